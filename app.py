@@ -1,10 +1,7 @@
 from flask import Flask, redirect, request, jsonify
-from config import app
-from v1.core.habit import register_habit_blueprint
+from config import create_app as create_base_app
+from database import pool_stats
 
-@app.route("/docs", methods=['GET'], endpoint="docs", strict_slashes=False)
-@app.route("/home", methods=['GET'], endpoint="home", strict_slashes=False)
-@app.route("/", methods=['GET'], endpoint="/", strict_slashes=False)
 
 def home():
 
@@ -20,6 +17,24 @@ def home():
         # Redirect to Postman documentation URL for browsers
         return redirect("https://documenter.getpostman.com/view/40761275/2sAYQUotVp")
 
-if __name__ == "__main__":
-    app.run()
 
+def health():
+    """ Report the MongoDB connection pool of this worker. """
+    return jsonify({"status": "success", "mongo_pool": pool_stats()}), 200
+
+
+def create_app() -> Flask:
+    """
+    Application factory (`gunicorn "app:create_app()"`, and found by `flask` on its own).
+    Importing this module does no I/O; each worker builds its app after fork.
+    """
+    app = create_base_app()
+    app.add_url_rule("/docs", endpoint="docs", view_func=home, methods=['GET'], strict_slashes=False)
+    app.add_url_rule("/home", endpoint="home", view_func=home, methods=['GET'], strict_slashes=False)
+    app.add_url_rule("/", endpoint="/", view_func=home, methods=['GET'], strict_slashes=False)
+    app.add_url_rule("/health", endpoint="health", view_func=health, methods=['GET'], strict_slashes=False)
+    return app
+
+
+if __name__ == "__main__":
+    create_app().run()
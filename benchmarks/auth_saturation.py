@@ -0,0 +1,99 @@
+"""
+Auth throughput and habit-endpoint latency while logins saturate password hashing.
+
+Run against a running server (e.g. `gunicorn "app:create_app()" -w 4 --threads 8`):
+
+    python3 benchmarks/auth_saturation.py --base-url http://localhost:8000 --login-threads 32 --duration 30
+
+Login threads hammer POST /auth/login while habit threads call GET /habit/status.
+The report shows logins/s, how many were shed with 503, and habit p50/p95/p99.
+Run it once with PASSWORD_HASH_WORKERS=0 (inline hashing) and once with the pool
+to compare.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+
+def call(base_url, method, path, body=None, token=None):
+    """ Send a JSON request, return (status, parsed body or None, seconds). """
+    request = urllib.request.Request(base_url + path, method=method,
+                                     data=json.dumps(body or {}).encode(),
+                                     headers={"Content-Type": "application/json"})
+    if token:
+        request.add_header("Authorization", f"Bearer {token}")
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            status, payload = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, e.read()
+    elapsed = time.perf_counter() - start
+    try:
+        return status, json.loads(payload or b"null"), elapsed
+    except ValueError:
+        return status, None, elapsed
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--login-threads", type=int, default=16)
+    parser.add_argument("--habit-threads", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args()
+
+    username, password = f"bench_{uuid.uuid4().hex[:8]}", "bench-password"
+    call(args.base_url, "POST", "/auth/register", {"username": username, "password": password})
+    status, body, _ = call(args.base_url, "POST", "/auth/login", {"username": username, "password": password})
+    if status != 200:
+        raise SystemExit(f"login failed ({status}): {body}")
+    token = body["access_token"]
+    call(args.base_url, "POST", "/habit/create", {"habit_name": "bench", "frequency": "daily"}, token)
+
+    deadline = time.monotonic() + args.duration
+    logins = {"ok": 0, "shed": 0, "other": 0}
+    habit_latencies = []
+    lock = threading.Lock()
+
+    def login_loop():
+        while time.monotonic() < deadline:
+            status, _, _ = call(args.base_url, "POST", "/auth/login", {"username": username, "password": password})
+            key = "ok" if status == 200 else "shed" if status == 503 else "other"
+            with lock:
+                logins[key] += 1
+
+    def habit_loop():
+        while time.monotonic() < deadline:
+            _, _, elapsed = call(args.base_url, "GET", "/habit/status", {"habit_name": "bench"}, token)
+            with lock:
+                habit_latencies.append(elapsed)
+
+    threads = [threading.Thread(target=login_loop) for _ in range(args.login_threads)]
+    threads += [threading.Thread(target=habit_loop) for _ in range(args.habit_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"logins/s       {logins['ok'] / args.duration:8.1f}")
+    print(f"shed (503)/s   {logins['shed'] / args.duration:8.1f}")
+    print(f"other errors   {logins['other']:8d}")
+    print(f"habit requests {len(habit_latencies):8d}")
+    for label, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+        print(f"habit {label} ms   {percentile(habit_latencies, fraction) * 1000:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Storage and read latency of habit logs before and after compaction into
+yearly buckets (`flask habit compact-logs`).
+
+Seeds synthetic users with habits and years of logs, measures, compacts the
+logs older than --keep-days, then measures again:
+
+    python3 benchmarks/compaction.py --users 20 --habits 5 --years 3 --keep-days 365
+
+- storage:     documents, data size, storage size and index size of habit_logs
+               and habit_log_buckets (collStats; the fake backend only reports
+               documents and BSON bytes)
+- history:     reading a habit's whole log history (HabitEngine.log_history)
+- rebuild:     recomputing a habit's rollup from its logs
+- stats range: the ranged statistics aggregation (skipped on the fake backend)
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import bson
+
+import harness
+
+COLLECTIONS = ("habit_logs", "habit_log_buckets")
+
+
+def storage(backend):
+    from database import get_db
+    db = get_db()
+    sizes = {}
+    for name in COLLECTIONS:
+        if backend == "fake":
+            documents = list(db[name].find())
+            sizes[name] = {"count": len(documents), "size": sum(len(bson.encode(document)) for document in documents),
+                           "storageSize": None, "totalIndexSize": None}
+        else:
+            stats = db.command("collStats", name)
+            sizes[name] = {field: stats.get(field, 0) for field in ("count", "size", "storageSize", "totalIndexSize")}
+    return sizes
+
+
+def timed(function, items, repeat):
+    """ Mean milliseconds of `function` over `items`, best of `repeat` passes. """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            function(item)
+        elapsed = (time.perf_counter() - started) * 1000 / max(len(items), 1)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def latencies(backend, habits, repeat):
+    from database import Habit_Log
+    from v1.core.habit.habit_service import HabitEngine
+    from v1.core.habit.habit_rollup import rebuild_rollup
+    from v1.core.habit.habit_pipelines import statistics_pipeline
+
+    engine = HabitEngine()
+    now = datetime.utcnow()
+    results = {
+        "history": timed(lambda habit: list(engine.log_history(habit["habit_id"])), habits, repeat),
+        "rebuild": timed(rebuild_rollup, habits, repeat),
+    }
+    if backend != "fake":
+        results["stats range"] = timed(lambda habit: list(Habit_Log.habit_logs.aggregate(
+            statistics_pipeline(habit["habit_id"], habit["frequency"], now, now - timedelta(days=2 * 365), now)
+        )), habits, repeat)
+    return results
+
+
+def format_bytes(value):
+    if value is None:
+        return "-"
+    return f"{value / 1024 / 1024:.2f} MiB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["auto", "local", "fake"], default="auto")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--habits", type=int, default=5)
+    parser.add_argument("--years", type=float, default=3.0)
+    parser.add_argument("--keep-days", type=int, default=365, help="Logs newer than this stay in habit_logs.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--keep-data", action="store_true", help="Don't drop the benchmark database afterwards.")
+    args = parser.parse_args()
+
+    backend = harness.setup_backend(args.backend)
+    harness.create_app()
+    from database import Habit
+    from database.indexes import sync_indexes
+    from v1.core.habit.habit_buckets import compact_all
+
+    try:
+        sync_indexes()
+        seeded = harness.seed(args.users, args.habits, args.years)
+        usernames = [username for username, _, _ in seeded]
+        habits = list(Habit.find({"username": {"$in": usernames}}, {"_id": 0}))
+        print(f"backend {backend}: seeded {args.users} users x {args.habits} habits x {args.years} years")
+
+        before = storage(backend), latencies(backend, habits, args.repeat)
+        started = time.perf_counter()
+        report = compact_all({"username": {"$in": usernames}}, timedelta(days=args.keep_days), pause=0)
+        print(f"compacted {report['logs']} logs of {report['habits']} habits in {time.perf_counter() - started:.2f} s")
+        after = storage(backend), latencies(backend, habits, args.repeat)
+
+        print(f"{'collection':18s} {'':6s} {'documents':>10s} {'data':>12s} {'storage':>12s} {'indexes':>12s}")
+        for name in COLLECTIONS:
+            for label, (sizes, _) in (("before", before), ("after", after)):
+                size = sizes[name]
+                print(f"{name:18s} {label:6s} {size['count']:10d} {format_bytes(size['size']):>12s} "
+                      f"{format_bytes(size['storageSize']):>12s} {format_bytes(size['totalIndexSize']):>12s}")
+        print(f"{'read (per habit)':18s} {'before ms':>10s} {'after ms':>10s}")
+        for name, milliseconds in before[1].items():
+            print(f"{name:18s} {milliseconds:10.2f} {after[1][name]:10.2f}")
+    finally:
+        if not args.keep_data:
+            harness.drop_bench_data()
+
+
+if __name__ == "__main__":
+    main()
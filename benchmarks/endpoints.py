@@ -0,0 +1,218 @@
+"""
+Per-endpoint latency and throughput, with a stored baseline to catch regressions.
+
+Seeds synthetic users with habits and years of logs, then drives every endpoint
+in-process through the Flask test client (no HTTP server, so the numbers show
+the cost of the views, HabitEngine and the database round trips):
+
+    python3 benchmarks/endpoints.py --users 20 --habits 5 --years 3 --requests 200
+    python3 benchmarks/endpoints.py --save-baseline benchmarks/baseline.json
+    python3 benchmarks/endpoints.py --baseline benchmarks/baseline.json --threshold 0.2
+
+With --baseline the run exits 1 when any endpoint's p95 is more than `threshold`
+(20% by default) slower than the baseline. Compare runs of the same backend and
+scale only; see harness.py for the backends.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import harness
+
+ENDPOINTS = ["register", "login", "create", "log", "log_history", "streak", "stats", "stats_range", "all", "dashboard"]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Scenario:
+    """ Builds the requests for each endpoint from the seeded data. """
+
+    def __init__(self, app, seeded):
+        self.app = app
+        self.seeded = seeded
+        self.tokens = {}
+        self.counter = 0
+        self.lock = threading.Lock()
+        # Seeded logs stop two periods short of now, so each habit accepts one new log
+        self.unlogged = [(username, habit_name) for username, _, habit_names in seeded for habit_name in habit_names]
+        client = app.test_client()
+        for username, password, _ in seeded:
+            response = client.post("/auth/login", json={"username": username, "password": password})
+            self.tokens[username] = response.get_json()["access_token"]
+
+    def next_index(self):
+        with self.lock:
+            self.counter += 1
+            return self.counter
+
+    def pick(self, i):
+        username, _, habit_names = self.seeded[i % len(self.seeded)]
+        return username, habit_names[(i // len(self.seeded)) % len(habit_names)]
+
+    def auth(self, username):
+        return {"Authorization": f"Bearer {self.tokens[username]}"}
+
+    def request(self, client, endpoint, i):
+        """ Send one request for `endpoint`; returns the status code. """
+        username, habit_name = self.pick(i)
+        if endpoint == "register":
+            body = {"username": f"bench_{uuid.uuid4().hex[:12]}", "password": "bench-password"}
+            return client.post("/auth/register", json=body).status_code
+        if endpoint == "login":
+            password = self.seeded[i % len(self.seeded)][1]
+            return client.post("/auth/login", json={"username": username, "password": password}).status_code
+        if endpoint == "create":
+            body = {"habit_name": f"new_{self.next_index()}", "frequency": "daily"}
+            return client.post("/habit/create", json=body, headers=self.auth(username)).status_code
+        if endpoint == "log":
+            with self.lock:
+                if not self.unlogged:
+                    return None
+                username, habit_name = self.unlogged.pop()
+            body = {"habit_name": habit_name, "log": "done"}
+            return client.post("/habit/log", json=body, headers=self.auth(username)).status_code
+        if endpoint == "log_history":
+            body = {"habit_name": habit_name, "limit": 100}
+            return client.get("/habit/log", json=body, headers=self.auth(username)).status_code
+        if endpoint == "streak":
+            return client.get("/habit/streak", json={"habit_name": habit_name}, headers=self.auth(username)).status_code
+        if endpoint == "stats":
+            return client.get("/habit/stats", json={"habit_name": habit_name}, headers=self.auth(username)).status_code
+        if endpoint == "stats_range":
+            end = datetime.utcnow()
+            body = {"habit_name": habit_name, "start": (end - timedelta(days=180)).isoformat(), "end": end.isoformat()}
+            return client.get("/habit/stats", json=body, headers=self.auth(username)).status_code
+        if endpoint == "all":
+            return client.get("/habit/all", headers=self.auth(username)).status_code
+        if endpoint == "dashboard":
+            return client.get("/habit/dashboard", headers=self.auth(username)).status_code
+        raise ValueError(f"unknown endpoint {endpoint}")
+
+
+def run_endpoint(scenario, endpoint, requests, concurrency):
+    """ Send `requests` requests over `concurrency` threads; returns the measurements. """
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(i):
+        nonlocal errors
+        if not hasattr(local, "client"):
+            local.client = scenario.app.test_client()
+        start = time.perf_counter()
+        status = scenario.request(local.client, endpoint, i)
+        elapsed = time.perf_counter() - start
+        if status is None:
+            return
+        with lock:
+            latencies.append(elapsed)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / wall, 1) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def regressions(results, baseline, threshold, min_delta_ms):
+    """ Endpoints whose p95 grew by more than `threshold` (and `min_delta_ms`) over the baseline. """
+    found = []
+    for endpoint, result in results.items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous or not previous.get("p95_ms"):
+            continue
+        delta = result["p95_ms"] - previous["p95_ms"]
+        if delta > previous["p95_ms"] * threshold and delta > min_delta_ms:
+            found.append((endpoint, previous["p95_ms"], result["p95_ms"]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["auto", "local", "fake"], default="auto")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--habits", type=int, default=5, help="habits per user")
+    parser.add_argument("--years", type=float, default=1.0, help="years of logs per habit")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma-separated subset of " + ", ".join(ENDPOINTS))
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--baseline", metavar="PATH")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95 slowdown (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore p95 changes smaller than this")
+    parser.add_argument("--keep-data", action="store_true", help="don't drop the benchmark database afterwards")
+    args = parser.parse_args()
+
+    endpoints = [endpoint.strip() for endpoint in args.endpoints.split(",") if endpoint.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    backend = harness.setup_backend(args.backend)
+    if backend == "fake" and "stats_range" in endpoints:
+        endpoints.remove("stats_range")  # mongomock has no $dateTrunc
+    app = harness.create_app()
+
+    started = time.perf_counter()
+    seeded = harness.seed(users=args.users, habits_per_user=args.habits, years=args.years)
+    print(f"backend {backend}: seeded {args.users} users x {args.habits} habits x {args.years} years "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    try:
+        scenario = Scenario(app, seeded)
+        results = {}
+        print(f"{'endpoint':12s} {'requests':>8s} {'errors':>6s} {'req/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s}")
+        for endpoint in endpoints:
+            result = run_endpoint(scenario, endpoint, args.requests, args.concurrency)
+            results[endpoint] = result
+            print(f"{endpoint:12s} {result['requests']:8d} {result['errors']:6d} {result['rps']:8.1f} "
+                  f"{result['p50_ms']:8.2f} {result['p95_ms']:8.2f} {result['p99_ms']:8.2f}")
+    finally:
+        if not args.keep_data:
+            harness.drop_bench_data()
+
+    report = {
+        "backend": backend,
+        "scale": {"users": args.users, "habits": args.habits, "years": args.years,
+                  "requests": args.requests, "concurrency": args.concurrency},
+        "endpoints": results,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("backend") != backend or baseline.get("scale") != report["scale"]:
+            print("warning: baseline was recorded with a different backend or scale")
+        found = regressions(results, baseline, args.threshold, args.min_delta_ms)
+        for endpoint, before, after in found:
+            print(f"REGRESSION {endpoint}: p95 {before:.2f} ms -> {after:.2f} ms")
+        if found:
+            sys.exit(1)
+        print(f"no p95 regression beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
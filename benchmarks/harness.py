@@ -0,0 +1,193 @@
+"""
+Shared setup for the benchmarks: pick a backend, build the app, seed synthetic data.
+
+Backends:
+- local: the mongod / redis-server at MONGODB_URI / REDIS_URL (defaults to localhost)
+- fake:  in-process mongomock + fakeredis (pip install mongomock fakeredis); no
+         server needed, but no $dateTrunc and different latencies, so only compare
+         fake runs with fake baselines
+- auto:  local when both servers answer, fake otherwise
+- replset: a throwaway three-member replica set of local mongod processes (mongod
+         on PATH), for checking that reads are routed to secondaries; Redis as
+         for auto
+"""
+import atexit
+import os
+import shutil
+import subprocess
+import sys
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Benchmarks never write to the application database
+BENCH_DB = 'habitforge_bench'
+
+
+def local_servers_available(mongo_uri, redis_url):
+    """ True when both servers answer within a second. """
+    try:
+        import pymongo
+        import redis
+        pymongo.MongoClient(mongo_uri, serverSelectionTimeoutMS=1000).admin.command("ping")
+        redis.Redis.from_url(redis_url, socket_connect_timeout=1).ping()
+        return True
+    except Exception:
+        return False
+
+
+def start_replica_set(ports=(27117, 27118, 27119), name="habitforge-bench-rs", timeout=60):
+    """
+    Start a three-member replica set on `ports` with data in a temporary directory,
+    wait until it has a primary and two secondaries, and return its URI. The
+    processes and their data are removed when the interpreter exits.
+    """
+    import pymongo
+
+    mongod = shutil.which("mongod")
+    if not mongod:
+        raise SystemExit("The replset backend needs mongod on PATH")
+    root = tempfile.mkdtemp(prefix="habitforge-rs-")
+    processes = []
+
+    def stop():
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(root, ignore_errors=True)
+
+    atexit.register(stop)
+    for port in ports:
+        dbpath = os.path.join(root, str(port))
+        os.makedirs(dbpath)
+        processes.append(subprocess.Popen([
+            mongod, "--replSet", name, "--port", str(port), "--bind_ip", "127.0.0.1",
+            "--dbpath", dbpath, "--logpath", os.path.join(dbpath, "mongod.log"),
+        ]))
+
+    deadline = time.monotonic() + timeout
+    members = [pymongo.MongoClient("127.0.0.1", port, directConnection=True, serverSelectionTimeoutMS=1000) for port in ports]
+    for member in members:
+        while True:
+            try:
+                member.admin.command("ping")
+                break
+            except pymongo.errors.PyMongoError:
+                if time.monotonic() > deadline:
+                    raise SystemExit(f"mongod did not start, see the logs in {root}")
+                time.sleep(0.2)
+
+    # The first member is preferred as primary so runs are repeatable
+    members[0].admin.command("replSetInitiate", {"_id": name, "members": [
+        {"_id": index, "host": f"127.0.0.1:{port}", "priority": 2 if index == 0 else 1}
+        for index, port in enumerate(ports)
+    ]})
+    while True:
+        states = sorted(member["stateStr"] for member in members[0].admin.command("replSetGetStatus")["members"])
+        if states == ["PRIMARY", "SECONDARY", "SECONDARY"]:
+            break
+        if time.monotonic() > deadline:
+            raise SystemExit(f"replica set did not elect a primary: {states}")
+        time.sleep(0.5)
+    for member in members:
+        member.close()
+    return f"mongodb://{','.join(f'127.0.0.1:{port}' for port in ports)}/?replicaSet={name}"
+
+
+def setup_backend(backend="auto"):
+    """
+    Configure the environment for `backend` and return the name of the one in use.
+    Must run before the app (config) is imported.
+    """
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+    os.environ.setdefault("MONGO_WARMUP", "0")
+    os.environ["MONGO_DB_NAME"] = BENCH_DB
+    mongo_uri = os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+    redis_url = os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+
+    if backend == "replset":
+        os.environ["MONGODB_URI"] = start_replica_set()
+        if not local_servers_available(os.environ["MONGODB_URI"], redis_url):
+            import fakeredis
+            from database.client import use_clients
+            use_clients(redis_client=fakeredis.FakeRedis(decode_responses=True))
+        return backend
+
+    if backend == "auto":
+        backend = "local" if local_servers_available(mongo_uri, redis_url) else "fake"
+
+    if backend == "fake":
+        try:
+            import mongomock
+            import fakeredis
+        except ImportError:
+            raise SystemExit("The fake backend needs: pip install mongomock fakeredis")
+        from database.client import use_clients
+        use_clients(mongo_client=mongomock.MongoClient(),
+                    redis_client=fakeredis.FakeRedis(decode_responses=True))
+    return backend
+
+
+def create_app():
+    """ Build the application once the backend is configured. """
+    from app import create_app as create_application
+    app = create_application()
+    app.testing = True
+    return app
+
+
+def seed(users=10, habits_per_user=5, years=1.0, seed_value=42):
+    """
+    Insert synthetic users, habits and 'done' logs directly (bypassing the API),
+    then rebuild the rollups. Returns [(username, password, [habit_name, ...])].
+    """
+    from database import User, Habit, Habit_Log, password_hasher
+    from v1.core.habit.habit_rollup import rebuild_all
+
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    frequencies = ['daily', 'weekly', 'monthly']
+    password = "bench-password"
+    hashed = password_hasher.hash(password)
+    seeded = []
+    for _ in range(users):
+        username = f"bench_{uuid.uuid4().hex[:10]}"
+        User.users.insert_one({"user_id": str(uuid.uuid4()), "username": username, "password": hashed})
+        habit_names = []
+        for index in range(habits_per_user):
+            frequency = frequencies[index % len(frequencies)]
+            habit_id = str(uuid.uuid4())
+            habit_name = f"habit_{index}"
+            start = now - timedelta(days=365 * years)
+            Habit.habits.insert_one({"username": username, "habit_id": habit_id, "habit_name": habit_name,
+                                     "frequency": frequency, "status": "active", "start_date": start})
+            step = {'daily': timedelta(days=1), 'weekly': timedelta(weeks=1), 'monthly': timedelta(days=31)}[frequency]
+            logs, timestamp = [], start
+            # Stop two periods short of now so the benchmark can still post logs
+            while timestamp < now - 2 * step:
+                if rng.random() < 0.8:
+                    logs.append({"username": username, "habit_name": habit_name, "habit_id": habit_id,
+                                 "timestamp": timestamp + timedelta(minutes=rng.randint(0, 600)), "log": "done"})
+                timestamp += step
+            for chunk in range(0, len(logs), 1000):
+                Habit_Log.habit_logs.insert_many(logs[chunk:chunk + 1000], ordered=False)
+            habit_names.append(habit_name)
+        seeded.append((username, password, habit_names))
+    rebuild_all({"username": {"$in": [username for username, _, _ in seeded]}})
+    return seeded
+
+
+def drop_bench_data():
+    """ Drop the benchmark database. """
+    from database import get_client
+    get_client().drop_database(BENCH_DB)
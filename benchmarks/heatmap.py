@@ -0,0 +1,91 @@
+"""
+Heatmap bucketing of long log histories: the NumPy datetime64 path of
+GET /habit/heatmap against a pure-Python baseline (period_start into a set,
+then one membership test per period).
+
+No server or database needed; both start from the datetimes the driver returns:
+
+    python3 benchmarks/heatmap.py --years 1,5,20 --repeat 5
+
+Both sides build the same grid (checked) and encode it bit-packed and as run lengths.
+"""
+import argparse
+import base64
+import random
+import time
+from datetime import datetime, timedelta
+
+import harness  # noqa: F401  (puts the repository on sys.path)
+from v1.core.habit.habit_heatmap import bucket_range, completion_grid, day_numbers, encode_grid
+from v1.core.habit.habit_periods import period_start, shift_period
+
+BUCKET_FREQUENCIES = {'day': 'daily', 'week': 'weekly', 'month': 'monthly'}
+
+
+def numpy_heatmap(timestamps, start, end, bucket):
+    first, periods = bucket_range(start, end, bucket)
+    grid = completion_grid(day_numbers(timestamps), first, periods, bucket)
+    return grid, encode_grid(grid, 'bits'), encode_grid(grid, 'rle')
+
+
+def python_heatmap(timestamps, start, end, bucket):
+    frequency = BUCKET_FREQUENCIES[bucket]
+    done = {period_start(timestamp, frequency) for timestamp in timestamps}
+    grid = []
+    period = period_start(start, frequency)
+    while period < end:
+        grid.append(period in done)
+        period = shift_period(period, frequency)
+
+    packed = bytearray()
+    for i in range(0, len(grid), 8):
+        byte = 0
+        for bit in grid[i:i + 8]:
+            byte = byte << 1 | bit
+        packed.append(byte << (8 - len(grid[i:i + 8])))
+    runs, value, length = [], False, 0
+    for completed in grid:
+        if completed != value:
+            runs.append(length)
+            value, length = completed, 0
+        length += 1
+    runs.append(length)
+    return grid, base64.b64encode(bytes(packed)).decode(), runs
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", default="1,5,20", help="Comma-separated history lengths")
+    parser.add_argument("--completion", type=float, default=0.7, help="Share of days with a log")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    end = datetime(2026, 1, 1)
+    print(f"{'years':>5s} {'logs':>7s} {'bucket':>6s} {'python ms':>10s} {'numpy ms':>9s} {'speedup':>8s}")
+    for years in (float(value) for value in args.years.split(",")):
+        start = end - timedelta(days=int(years * 365))
+        days = (end - start).days
+        timestamps = [start + timedelta(days=day, seconds=rng.randrange(86400), milliseconds=rng.randrange(1000))
+                      for day in range(days) if rng.random() < args.completion]
+        for bucket in BUCKET_FREQUENCIES:
+            python_grid, python_bits, python_runs = python_heatmap(timestamps, start, end, bucket)
+            numpy_grid, numpy_bits, numpy_runs = numpy_heatmap(timestamps, start, end, bucket)
+            assert python_grid == numpy_grid.tolist() and python_bits == numpy_bits and python_runs == numpy_runs, bucket
+            baseline = best_of(args.repeat, lambda: python_heatmap(timestamps, start, end, bucket))
+            vectorised = best_of(args.repeat, lambda: numpy_heatmap(timestamps, start, end, bucket))
+            print(f"{years:5g} {len(timestamps):7d} {bucket:>6s} {baseline * 1000:10.2f} {vectorised * 1000:9.2f} "
+                  f"{baseline / vectorised:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Read routing against a local three-member replica set: checks that history,
+statistics and dashboard reads go to secondaries while logging and exports
+stay on the primary, and reports their latency.
+
+Starts a throwaway replica set (mongod must be on PATH, see harness.py), seeds
+it, drives the endpoints in-process and records the server of every command:
+
+    python3 benchmarks/read_routing.py --users 5 --habits 3 --years 1 --requests 50
+
+Exits 1 when a read of a secondary-routed endpoint reached the primary, or a
+command of a primary endpoint reached a secondary.
+"""
+import argparse
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from pymongo import WriteConcern, monitoring
+
+import harness
+
+READ_COMMANDS = {"find", "aggregate", "getMore", "count", "distinct"}
+
+
+class CommandRecorder(monitoring.CommandListener):
+    """ Records (command, server) of every command issued while a scenario is labelled. """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.commands = defaultdict(list)
+
+    def label(self, name):
+        self.local.label = name
+
+    def started(self, event):
+        label = getattr(self.local, "label", None)
+        if label:
+            self.commands[label].append((event.command_name, event.connection_id))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--habits", type=int, default=3)
+    parser.add_argument("--years", type=float, default=1.0)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    harness.setup_backend("replset")
+    recorder = CommandRecorder()
+    monitoring.register(recorder)  # Before the shared client is created
+    app = harness.create_app()
+
+    from database import get_client, get_db
+    from database.indexes import sync_indexes
+
+    sync_indexes()
+    seeded = harness.seed(args.users, args.habits, args.years)
+    # Wait until both secondaries have everything seeded so far
+    get_db()["bench_sync"].with_options(write_concern=WriteConcern(w=3, wtimeout=30000)).insert_one({})
+    primary = get_client().primary
+
+    client = app.test_client()
+    users = []
+    for username, password, habit_names in seeded:
+        token = client.post("/auth/login", json={"username": username, "password": password}).get_json()["access_token"]
+        users.append(({"Authorization": f"Bearer {token}"}, habit_names))
+
+    # (label, expected server, request)
+    scenarios = [
+        ("post log", "primary", lambda headers, habit_name: client.post("/habit/log", headers=headers, json={"habit_name": habit_name, "log": "done"})),
+        ("log history", "secondary", lambda headers, habit_name: client.get("/habit/log", headers=headers, json={"habit_name": habit_name, "limit": 1000})),
+        ("stats", "secondary", lambda headers, habit_name: client.get("/habit/stats", headers=headers, json={"habit_name": habit_name})),
+        ("stats range", "secondary", lambda headers, habit_name: client.get("/habit/stats", headers=headers, json={"habit_name": habit_name, "start": "2020-01-01T00:00:00"})),
+        ("dashboard", "secondary", lambda headers, habit_name: client.get("/habit/dashboard", headers=headers)),
+        ("export", "primary", lambda headers, habit_name: client.get("/habit/export", headers=headers)),
+        ("streak", "primary", lambda headers, habit_name: client.get("/habit/streak", headers=headers, json={"habit_name": habit_name})),
+    ]
+
+    violations = []
+    print(f"primary {primary[0]}:{primary[1]}")
+    print(f"{'scenario':12s} {'expected':>9s} {'commands':>8s} {'primary':>8s} {'secondary':>9s} {'p50 ms':>8s} {'p95 ms':>8s}")
+    for label, expected, send in scenarios:
+        timings = []
+        recorder.label(label)
+        for i in range(args.requests):
+            headers, habit_names = users[i % len(users)]
+            started = time.perf_counter()
+            response = send(headers, habit_names[i % len(habit_names)])
+            response.get_data()  # Streamed bodies run their queries here
+            timings.append((time.perf_counter() - started) * 1000)
+        recorder.label(None)
+
+        commands = recorder.commands[label]
+        on_primary = [command for command, server in commands if server == primary]
+        on_secondary = [command for command, server in commands if server != primary]
+        if expected == "secondary" and any(command in READ_COMMANDS for command in on_primary):
+            violations.append(f"{label}: {sorted(set(on_primary) & READ_COMMANDS)} read from the primary")
+        if expected == "primary" and on_secondary:
+            violations.append(f"{label}: {sorted(set(on_secondary))} sent to a secondary")
+        print(f"{label:12s} {expected:>9s} {len(commands):8d} {len(on_primary):8d} {len(on_secondary):9d} "
+              f"{percentile(timings, 0.5):8.2f} {percentile(timings, 0.95):8.2f}")
+
+    for violation in violations:
+        print(f"ROUTING {violation}")
+    if violations:
+        sys.exit(1)
+    print("reads routed as expected")
+
+
+if __name__ == "__main__":
+    main()
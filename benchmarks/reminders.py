@@ -0,0 +1,92 @@
+"""
+Reminder scheduler tick cost against the number of scheduled habits.
+
+Fills a scratch sorted set with N habits whose reminders fall due uniformly over
+a simulated week, then steps a simulated clock and times each tick. A tick only
+touches the due reminders, so its cost should follow the reminders per tick,
+not N:
+
+    python3 benchmarks/reminders.py --sizes 10000,100000,1000000 --interval 30
+
+--publish also sends every reminder as an SSE event (the full tick); without it
+only claiming the due reminders is timed. Uses REDIS_URL when it answers,
+fakeredis otherwise (see harness.py); the scratch key is deleted afterwards.
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import harness
+
+BENCH_KEY = "bench:reminders:due"
+
+
+def run(size, interval, ticks, publish, rng):
+    from database import get_redis
+    from v1.core.habit import habit_reminders
+
+    client = get_redis()
+    client.delete(BENCH_KEY)
+    start = datetime(2030, 1, 1)
+    week = timedelta(weeks=1).total_seconds()
+    frequencies = list(habit_reminders.REMINDER_LEAD)
+
+    started = time.perf_counter()
+    pipe = client.pipeline(transaction=False)
+    for i in range(size):
+        habit = {"habit_id": str(uuid.uuid4()), "username": f"bench_{i % 50000}",
+                 "habit_name": f"habit_{i}", "frequency": frequencies[i % 3]}
+        due = start + timedelta(seconds=rng.random() * week)
+        pipe.zadd(BENCH_KEY, {habit_reminders.reminder_member(habit): habit_reminders._epoch(due)})
+        if i % 5000 == 4999:
+            pipe.execute()
+    pipe.execute()
+    fill_seconds = time.perf_counter() - started
+
+    # Start the clock mid-week so every tick has its share of due reminders
+    now = start + timedelta(days=3)
+    habit_reminders.pop_due(now, limit=size)  # Drain the backlog first
+    timings, popped = [], []
+    for _ in range(ticks):
+        now += timedelta(seconds=interval)
+        started = time.perf_counter()
+        if publish:
+            count = habit_reminders.tick(now)
+        else:
+            count = len(habit_reminders.pop_due(now, limit=100000))
+        timings.append(time.perf_counter() - started)
+        popped.append(count)
+    client.delete(BENCH_KEY)
+    return fill_seconds, timings, popped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["auto", "local", "fake"], default="auto")
+    parser.add_argument("--sizes", default="10000,100000", help="comma-separated habit counts")
+    parser.add_argument("--interval", type=float, default=30.0, help="simulated seconds between ticks")
+    parser.add_argument("--ticks", type=int, default=50)
+    parser.add_argument("--publish", action="store_true", help="also publish each reminder as an SSE event")
+    args = parser.parse_args()
+
+    backend = harness.setup_backend(args.backend)
+    from v1.core.habit import habit_reminders
+    habit_reminders.DUE_KEY = BENCH_KEY  # Never touch the real schedule
+
+    rng = random.Random(42)
+    print(f"backend {backend}, {args.ticks} ticks of {args.interval:.0f}s")
+    print(f"{'habits':>10s} {'fill s':>8s} {'per tick':>9s} {'tick p50 ms':>12s} {'tick p99 ms':>12s} {'us/reminder':>12s}")
+    for size in (int(value) for value in args.sizes.split(",") if value.strip()):
+        fill_seconds, timings, popped = run(size, args.interval, args.ticks, args.publish, rng)
+        timings.sort()
+        per_reminder = sum(timings) / max(1, sum(popped)) * 1e6
+        print(f"{size:10d} {fill_seconds:8.1f} {statistics.mean(popped):9.1f} "
+              f"{statistics.median(timings) * 1000:12.2f} {timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000:12.2f} "
+              f"{per_reminder:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
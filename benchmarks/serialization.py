@@ -0,0 +1,90 @@
+"""
+Encoding cost of large log histories: the old per-document copy loop against
+the app's JSON provider, plus what a projection saves when decoding from BSON.
+
+No server or database needed:
+
+    python3 benchmarks/serialization.py --logs 100000 --repeat 5
+
+- copy loop + json:   format each document (str(_id), isoformat()) then json.dumps
+- provider:           HabitJSONProvider.dumps on the documents as they come from the driver
+- bson full/projected: decoding the documents with and without the internal fields
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import bson
+from bson import ObjectId
+from flask import Flask
+
+import harness  # noqa: F401  (puts the repository on sys.path)
+from v1.core.serialization import HabitJSONProvider, register_json_provider
+from v1.core.serialization import json_provider
+from database import Habit
+
+
+def format_log(log: dict) -> dict:
+    """ The per-document copy GET /habit/log used to make before encoding. """
+    formatted_log = {}
+    for k, v in log.items():
+        if k == "_id":
+            formatted_log[k] = str(v)
+        elif k == "timestamp":
+            formatted_log[k] = v.isoformat()
+        else:
+            formatted_log[k] = v
+    return formatted_log
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logs", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    habit_id = str(uuid.uuid4())
+    start = datetime(2020, 1, 1, 7, 30)
+    logs = [{"_id": ObjectId(), "username": "bench_user", "habit_name": "reading", "habit_id": habit_id,
+             "timestamp": start + timedelta(days=i, milliseconds=i % 1000), "log": "done"} for i in range(args.logs)]
+
+    app = Flask(__name__)
+    register_json_provider(app)
+    provider = app.json
+    stdlib_provider = HabitJSONProvider(app)
+
+    results = {
+        "copy loop + json": best_of(args.repeat, lambda: json.dumps([format_log(log) for log in logs])),
+        "provider": best_of(args.repeat, lambda: provider.dumps(logs)),
+    }
+    if json_provider.orjson is not None:
+        # Passing any keyword argument takes the standard library path
+        results["provider (stdlib)"] = best_of(args.repeat, lambda: stdlib_provider.dumps(logs, separators=(",", ":")))
+
+    habits = [{"_id": ObjectId(), "username": "bench_user", "habit_id": str(uuid.uuid4()), "habit_name": f"habit_{i}",
+               "frequency": "daily", "status": "active", "start_date": start} for i in range(args.logs)]
+    full = [bson.encode(habit) for habit in habits]
+    projected = [bson.encode({k: v for k, v in habit.items() if k not in Habit.PUBLIC_PROJECTION}) for habit in habits]
+    results["bson full habits"] = best_of(args.repeat, lambda: [bson.decode(raw) for raw in full])
+    results["bson projected habits"] = best_of(args.repeat, lambda: [bson.decode(raw) for raw in projected])
+
+    print(f"{args.logs} documents, best of {args.repeat}")
+    for name, seconds in results.items():
+        print(f"{name:24s} {seconds * 1000:10.1f} ms")
+    print(f"{'bytes full / projected':24s} {sum(map(len, full)):>10d} / {sum(map(len, projected))}")
+    print(f"encode speedup           {results['copy loop + json'] / results['provider']:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
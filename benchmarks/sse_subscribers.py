@@ -0,0 +1,115 @@
+"""
+Concurrent /stream subscribers per node: connection capacity and fan-out latency.
+
+Opens N event streams (asyncio, one socket each) against a running server, then
+publishes events straight to the user's Redis channel and measures how long
+each event takes to reach every subscriber.
+
+    python3 benchmarks/sse_subscribers.py --base-url http://localhost:8000 --redis-url redis://localhost:6379 --subscribers 5000
+
+Thousands of open streams need a cooperative worker class (gevent); with sync
+workers every stream holds one worker thread.
+"""
+import argparse
+import asyncio
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+import redis
+
+
+def call(base_url, path, body):
+    request = urllib.request.Request(base_url + path, method="POST", data=json.dumps(body).encode(),
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+async def subscriber(host, port, path, ready, latencies, stats, events):
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        stats["failed"] += 1
+        ready.release()
+        return
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    if b" 200 " not in status_line:
+        stats["refused"] += 1
+        ready.release()
+        writer.close()
+        return
+    stats["connected"] += 1
+    ready.release()
+    received = 0
+    try:
+        while received < events:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b"data:") and b"bench_sent" in line:
+                payload = json.loads(line[5:].decode())
+                latencies.append(time.time() - payload["bench_sent"])
+                received += 1
+    finally:
+        writer.close()
+
+
+async def run(args):
+    username, password = f"bench_{uuid.uuid4().hex[:8]}", "bench-password"
+    call(args.base_url, "/auth/register", {"username": username, "password": password})
+    status, body = call(args.base_url, "/auth/login", {"username": username, "password": password})
+    if status != 200:
+        raise SystemExit(f"login failed ({status})")
+    parsed = urllib.parse.urlparse(args.base_url)
+    path = "/stream?jwt=" + urllib.parse.quote(body["access_token"])
+
+    latencies, stats = [], {"connected": 0, "refused": 0, "failed": 0}
+    ready = asyncio.Semaphore(0)
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(subscriber(parsed.hostname, parsed.port or 80, path, ready, latencies, stats, args.events))
+             for _ in range(args.subscribers)]
+    for _ in range(args.subscribers):
+        await ready.acquire()
+    connect_seconds = time.perf_counter() - started
+    await asyncio.sleep(args.settle)  # Let every stream finish subscribing
+
+    client = redis.Redis.from_url(args.redis_url)
+    for _ in range(args.events):
+        message = {"data": {"bench_sent": time.time()}, "type": "bench"}
+        client.publish(f"user.{username}", json.dumps(message))
+        await asyncio.sleep(args.interval)
+    await asyncio.wait(tasks, timeout=args.settle + 10)
+
+    latencies.sort()
+    expected = stats["connected"] * args.events
+    print(f"streams connected {stats['connected']:8d} in {connect_seconds:.1f}s")
+    print(f"refused (503)     {stats['refused']:8d}")
+    print(f"connect failures  {stats['failed']:8d}")
+    print(f"events delivered  {len(latencies):8d} / {expected}")
+    for label, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+        value = latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] if latencies else 0.0
+        print(f"fan-out {label} ms   {value * 1000:8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--redis-url", default="redis://localhost:6379")
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between published events")
+    parser.add_argument("--settle", type=float, default=2.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Cold boot and first-request latency of a fresh worker process.
+
+Each run starts a new interpreter that imports the app module, builds the app
+with the factory, optionally warms up the Mongo pool (as gunicorn.conf.py does
+after fork), then times its first requests:
+
+    python3 benchmarks/startup.py --runs 10
+    python3 benchmarks/startup.py --runs 10 --warmup
+
+- import:        `import app` (must not touch the network)
+- create_app:    the factory (must not touch the network)
+- warmup:        database.client.warmup(), with --warmup only
+- first health:  GET /health (no database call)
+- first mongo:   POST /auth/login for an unknown user (one users lookup)
+- second mongo:  the same request again, on the now-open connection
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import harness
+
+STEPS = ["import", "create_app", "warmup", "first health", "first mongo", "second mongo"]
+
+
+def child(backend, warmup):
+    """ One cold boot; prints the step timings (seconds) as JSON. """
+    harness.setup_backend(backend)
+    timings = {}
+
+    started = time.perf_counter()
+    import app as app_module
+    timings["import"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    app = app_module.create_app()
+    timings["create_app"] = time.perf_counter() - started
+    client = app.test_client()
+
+    if warmup:
+        from database.client import warmup as warmup_pool
+        started = time.perf_counter()
+        warmup_pool()
+        timings["warmup"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    client.get("/health")
+    timings["first health"] = time.perf_counter() - started
+
+    body = {"username": "startup_bench_unknown_user", "password": "unused"}
+    for step in ("first mongo", "second mongo"):
+        started = time.perf_counter()
+        client.post("/auth/login", json=body)
+        timings[step] = time.perf_counter() - started
+    print(json.dumps(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["auto", "local", "fake"], default="auto")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", action="store_true", help="warm the Mongo pool before the first request")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.backend, args.warmup)
+        return
+
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--backend", args.backend]
+    if args.warmup:
+        command.append("--warmup")
+    runs = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        timings["process total"] = time.perf_counter() - started
+        runs.append(timings)
+
+    print(f"{'step':14s} {'median ms':>10s} {'max ms':>10s}")
+    for step in STEPS + ["process total"]:
+        values = [run[step] for run in runs if step in run]
+        if values:
+            print(f"{step:14s} {statistics.median(values) * 1000:10.1f} {max(values) * 1000:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
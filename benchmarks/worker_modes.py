@@ -0,0 +1,216 @@
+"""
+Sync vs gevent gunicorn workers at equal RAM: requests per second, and memory
+per open connection while event streams are held open.
+
+Seeds the benchmark database of the local mongod / redis-server, then starts
+gunicorn once per mode with the same number of worker processes (so both run in
+about the same memory; the idle RSS is printed to check) and drives it over HTTP:
+
+    python3 benchmarks/worker_modes.py --workers 4 --clients 64 --streams 500 --duration 20
+
+For each mode (gevent must be installed):
+- idle:     RSS of the master and its workers (read from /proc, Linux only)
+- requests: --clients threads calling GET /habit/streak, /habit/stats and
+            /habit/dashboard for --duration seconds: req/s, errors, p50/p95
+- streams:  --streams /stream connections opened and held (a stream is open once
+            its headers arrived), then the request load again on top of them
+- memory:   RSS with the streams open, and its growth per open stream
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+import harness
+
+PATHS = ("/habit/streak", "/habit/stats", "/habit/dashboard")
+
+
+def rss_mb(pid):
+    """ RSS of a process and all its descendants, in MB. """
+    total, pending = 0, [pid]
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as stat:
+                    parent = int(stat.read().rsplit(")", 1)[1].split()[1])
+                children.setdefault(parent, []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total / 1024
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def start_server(mode, port, args):
+    env = {**os.environ, "GUNICORN_WORKER_CLASS": mode, "GUNICORN_WORKER_CONNECTIONS": str(args.worker_connections),
+           "SSE_MAX_SUBSCRIBERS": str(args.streams + args.clients), "MONGO_WARMUP": "1"}
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "app:create_app()", "-w", str(args.workers),
+                                "-b", f"127.0.0.1:{port}"], cwd=harness.ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f"gunicorn ({mode}) did not start on port {port}")
+
+
+def request_load(port, users, clients, duration):
+    """ Returns (requests, errors, latencies) of `clients` threads calling PATHS for `duration` seconds. """
+    deadline = time.monotonic() + duration
+    counters = {"requests": 0, "errors": 0}
+    latencies = []
+    lock = threading.Lock()
+
+    def loop(number):
+        token, habit_names = users[number % len(users)]
+        i = 0
+        while time.monotonic() < deadline:
+            path = PATHS[i % len(PATHS)]
+            body = json.dumps({"habit_name": habit_names[i % len(habit_names)]})
+            i += 1
+            started = time.perf_counter()
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+                connection.request("GET", path, body, {"Content-Type": "application/json", "Authorization": f"Bearer {token}"})
+                response = connection.getresponse()
+                response.read()
+                connection.close()
+                ok = response.status < 500
+            except OSError:
+                ok = False
+            with lock:
+                counters["requests" if ok else "errors"] += 1
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=loop, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counters["requests"], counters["errors"], latencies
+
+
+def open_streams(port, users, count, timeout=5.0):
+    """ Open `count` event streams; returns the sockets whose response headers arrived within `timeout`. """
+    sockets = []
+    for number in range(count):
+        token = urllib.parse.quote(users[number % len(users)][0])
+        try:
+            sock = socket.create_connection(("127.0.0.1", port), timeout=timeout)
+            sock.sendall(f"GET /stream?jwt={token} HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n".encode())
+            sockets.append(sock)
+        except OSError:
+            pass
+    opened = []
+    deadline = time.monotonic() + timeout
+    for sock in sockets:
+        try:
+            sock.settimeout(max(0.01, deadline - time.monotonic()))
+            if b" 200 " in sock.recv(64):
+                opened.append(sock)
+                continue
+        except OSError:
+            pass
+        sock.close()
+    return opened, sockets
+
+
+def run_mode(mode, port, users, args):
+    process = start_server(mode, port, args)
+    try:
+        request_load(port, users, args.clients, 2)  # Warm up every worker's pools
+        idle = rss_mb(process.pid)
+        requests, errors, latencies = request_load(port, users, args.clients, args.duration)
+        opened, sockets = open_streams(port, users, args.streams)
+        with_streams = rss_mb(process.pid)
+        stream_requests, stream_errors, stream_latencies = request_load(port, users, args.clients, args.duration)
+        for sock in sockets:
+            sock.close()
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        "idle MB": idle,
+        "req/s": requests / args.duration,
+        "errors": errors,
+        "p50 ms": percentile(latencies, 0.5) * 1000,
+        "p95 ms": percentile(latencies, 0.95) * 1000,
+        "streams open": len(opened),
+        "req/s + streams": stream_requests / args.duration,
+        "errors + streams": stream_errors,
+        "p95 ms + streams": percentile(stream_latencies, 0.95) * 1000,
+        "MB with streams": with_streams,
+        "KB per stream": (with_streams - idle) * 1024 / len(opened) if opened else 0.0,
+        "req/s per GB": requests / args.duration / (idle / 1024) if idle else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes of both modes")
+    parser.add_argument("--worker-connections", type=int, default=1000, help="Greenlets per gevent worker")
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--streams", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--modes", default="sync,gevent")
+    parser.add_argument("--port", type=int, default=8123)
+    args = parser.parse_args()
+
+    os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")  # Seeding and logins hash inline, in this process
+    if harness.setup_backend("local") != "local":
+        raise SystemExit("worker_modes.py needs the local mongod and redis-server")
+    app = harness.create_app()
+    from database.indexes import sync_indexes
+    sync_indexes()
+    seeded = harness.seed(args.users, 3, 1.0)
+
+    client = app.test_client()
+    users = []
+    for username, password, habit_names in seeded:
+        token = client.post("/auth/login", json={"username": username, "password": password}).get_json()["access_token"]
+        users.append((token, habit_names))  # Same JWT secret as the servers
+
+    results = {}
+    try:
+        for offset, mode in enumerate(args.modes.split(",")):
+            results[mode] = run_mode(mode, args.port + offset, users, args)
+    finally:
+        harness.drop_bench_data()
+
+    print(f"{args.workers} workers, {args.clients} clients, {args.streams} streams, {args.duration:g}s per phase")
+    print(f"{'':18s}" + "".join(f"{mode:>12s}" for mode in results))
+    for metric in next(iter(results.values())):
+        print(f"{metric:18s}" + "".join(f"{result[metric]:12.1f}" for result in results.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,24 @@
-from pymongo import MongoClient
 from flask import Flask
 from flask_jwt_extended import JWTManager
-import redis
-from urllib.parse import urlparse
-from flask_sse import sse
 import os
 from dotenv import load_dotenv
+from database.client import mongo_call_count
 
 
 def create_app():
+    """
+    Build the application without any network I/O. Mongo and Redis clients are
+    created on first use in the process that serves requests (i.e. after the
+    gunicorn fork); gunicorn.conf.py warms them up before a worker takes traffic.
+    """
     app = Flask(__name__)
 
     load_dotenv()
 
+    # JSON responses encode ObjectId and datetime natively (orjson when installed)
+    from v1.core.serialization import register_json_provider
+    register_json_provider(app)
+
     # JWT Configuration
     app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
 
@@ -21,43 +27,48 @@ def create_app():
     redis_url = os.getenv('REDIS_URL')  # Must be set in production environment
     if not redis_url:
         raise ValueError("REDIS_URL must be Configured")
-    parsed_redis = urlparse(redis_url)
-
-    # Configure Redis connection
-    redis_client = redis.Redis(
-            host=parsed_redis.hostname,
-            port=parsed_redis.port,
-            username=parsed_redis.username,
-            password=parsed_redis.password,
-            decode_responses=True
-            )
+    app.config['REDIS_URL'] = redis_url  # Shared, pooled client: database.get_redis()
+
     # Initialize JWT
     jwt = JWTManager(app)
 
-    # Register SSE extension
-    app.register_blueprint(sse, url_prefix='/stream')
+    # Request, Mongo and Redis timing served at /metrics (before the first Mongo client is created)
+    from v1.core.metrics import register_metrics
+    register_metrics(app)
+
+    # Register SSE extension (per-user habit event channels)
+    from v1.core.events import register_event_stream
+    register_event_stream(app)
 
     # MongoDB Configuration (using environment variable for production)
     mongo_uri = os.getenv('MONGODB_URI')  # Must be set in Configured
     if not mongo_uri:
         raise ValueError("MONGODB_URI must be Configured")
-    client = MongoClient(mongo_uri)
-    db_name = 'habitforge'  # Use your production database name
-    db = client[db_name]
-    app.config['MONGO_DB'] = db
+    # Shared, pooled client created lazily (pool sizes from MONGO_MAX_POOL_SIZE / MONGO_MIN_POOL_SIZE)
 
     # Register blueprints
     from v1.auth import register_auth_blueprint
     register_auth_blueprint(app)
     from v1.core.habit import register_habit_blueprint
     register_habit_blueprint(app)
+    from v1.core.leaderboard import register_leaderboard_blueprint
+    register_leaderboard_blueprint(app)
+
+    # Index maintenance commands (`flask db sync-indexes`, `flask db audit-queries`)
+    from database.commands import db_cli
+    app.cli.add_command(db_cli)
     
-    # Token blacklisting check
+    # Per-request Mongo command count, for asserting endpoint round trips in tests
+    @app.after_request
+    def report_mongo_calls(response):
+        if app.testing or os.getenv('MONGO_CALL_HEADER') == '1':
+            response.headers['X-Mongo-Calls'] = str(mongo_call_count())
+        return response
+
+    # Token blacklisting check (answered in process, see v1/auth/token_blocklist.py)
+    from v1.auth.token_blocklist import token_blocklist
     @jwt.token_in_blocklist_loader
     def check_if_token_is_revoked(jwt_header, jwt_payload):
-        return redis_client.get(jwt_payload["jti"]) is not None
+        return token_blocklist.is_revoked(jwt_payload["jti"])
 
     return app
-
-app = create_app()
-
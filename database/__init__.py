@@ -1,3 +1,5 @@
-from .data import User, Habit, Habit_Log
+from .data import User, Habit, Habit_Log, Habit_Log_Bucket, Habit_Rollup, HabitRepository
+from .password_hasher import password_hasher, HashingUnavailable
+from .client import get_client, get_db, get_redis, pool_stats, mongo_call_count, primary_reads, reads_from_secondaries, secondary_reads
 
-__all__ = ['User', 'Habit', 'Habit_Log']
+__all__ = ['User', 'Habit', 'Habit_Log', 'Habit_Log_Bucket', 'Habit_Rollup', 'HabitRepository', 'get_client', 'get_db', 'get_redis', 'pool_stats', 'mongo_call_count', 'primary_reads', 'reads_from_secondaries', 'secondary_reads', 'password_hasher', 'HashingUnavailable']
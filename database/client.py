@@ -0,0 +1,374 @@
+from pymongo import MongoClient, monitoring
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from flask import g, has_request_context, request
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import redis
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_NAME = os.getenv('MONGO_DB_NAME', 'habitforge')
+
+# Process-wide registry: one MongoClient (and therefore one connection pool) per URI
+_lock = threading.Lock()
+_clients: Dict[str, MongoClient] = {}
+_collections: Dict[tuple, object] = {}
+_redis_clients: Dict[str, redis.Redis] = {}
+
+# Called with (command name, seconds, failed) after every Redis command of the shared clients
+redis_listeners: List[Callable[[str, float, bool], None]] = []
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """ Counts connection pool events of the shared clients. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counters = {
+            "pools_created": 0,
+            "pools_cleared": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checked_out": 0,
+            "checked_in": 0,
+            "checkout_failed": 0,
+        }
+
+    def _incr(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def pool_created(self, event):
+        self._incr("pools_created")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._incr("pools_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._incr("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._incr("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._incr("checkout_failed")
+
+    def connection_checked_out(self, event):
+        self._incr("checked_out")
+
+    def connection_checked_in(self, event):
+        self._incr("checked_in")
+
+
+class RequestCommandCounter(monitoring.CommandListener):
+    """ Counts the Mongo commands issued while handling the current Flask request. """
+
+    def started(self, event):
+        if has_request_context():
+            g.mongo_calls = g.get("mongo_calls", 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+pool_listener = PoolStatsListener()
+command_counter = RequestCommandCounter()
+
+
+def pool_options() -> dict:
+    """ Pool sizing read from the environment (falls back to the driver defaults). """
+    return {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 100)),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 0)) or None,
+        "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 0)) or None,
+    }
+
+
+def get_client(uri: Optional[str] = None) -> MongoClient:
+    """ Return the shared MongoClient for `uri`, creating it on first use. """
+    uri = uri or os.getenv('MONGODB_URI')  # Must be set in production environment
+    if not uri:
+        raise ValueError("MONGODB_URI must be Configured")
+    client = _clients.get(uri)
+    if client is None:
+        with _lock:
+            client = _clients.get(uri)
+            if client is None:
+                client = MongoClient(uri, event_listeners=[pool_listener, command_counter], **pool_options())
+                _clients[uri] = client
+    return client
+
+
+def get_db(name: str = DB_NAME):
+    """ Return the habitforge database of the shared client. """
+    return get_client()[name]
+
+
+# Read preference of staleness-tolerant reads (history, statistics, dashboards, exports)
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# Set while the current context may (True) or must not (False) read from secondaries,
+# see secondary_reads and primary_reads; None defers to the view (reads_from_secondaries)
+_secondary_reads: ContextVar[Optional[bool]] = ContextVar("secondary_reads", default=None)
+
+
+def secondary_read_options() -> dict:
+    """ Read preference and max staleness of secondary reads, from the environment. """
+    return {
+        "mode": os.getenv("MONGO_SECONDARY_READ_PREFERENCE", "secondaryPreferred"),
+        "max_staleness": int(os.getenv("MONGO_MAX_STALENESS_SECONDS", 90)),  # -1: no limit; the server minimum is 90
+    }
+
+
+def secondary_read_preference():
+    options = secondary_read_options()
+    if options["mode"] not in READ_PREFERENCES:
+        raise ValueError(f"MONGO_SECONDARY_READ_PREFERENCE must be one of {', '.join(READ_PREFERENCES)}")
+    if options["mode"] == "primary":
+        return Primary()
+    return READ_PREFERENCES[options["mode"]](max_staleness=options["max_staleness"])
+
+
+def reading_from_secondaries() -> bool:
+    """
+    True inside secondary_reads() and in requests handled by a reads_from_secondaries
+    view, except inside primary_reads().
+    """
+    routed = _secondary_reads.get()
+    if routed is not None:
+        return routed
+    return bool(has_request_context() and g.get("secondary_reads", False))
+
+
+@contextmanager
+def secondary_reads():
+    """
+    Route the reads of the shared collections to secondaries (within the configured
+    max staleness) for the duration of the block. Writes, including find-and-modify,
+    always go to the primary.
+    """
+    token = _secondary_reads.set(True)
+    try:
+        yield
+    finally:
+        _secondary_reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Read from the primary for the duration of the block, even in a
+    reads_from_secondaries view, e.g. to build a response that gets cached.
+    """
+    token = _secondary_reads.set(False)
+    try:
+        yield
+    finally:
+        _secondary_reads.reset(token)
+
+
+def reads_from_secondaries(view):
+    """
+    View decorator: GET requests of the view read from secondaries, for the whole
+    request (streamed responses included). Other methods stay on the primary.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method in ("GET", "HEAD"):
+            g.secondary_reads = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def get_collection(name: str, db_name: str = DB_NAME, secondary: bool = False):
+    """
+    Return a collection of the shared client (cached until the registry is reset),
+    reading from secondaries when `secondary` is set.
+    """
+    key = (db_name, name, secondary)
+    collection = _collections.get(key)
+    if collection is None:
+        collection = get_db(db_name)[name]
+        if secondary:
+            collection = collection.with_options(read_preference=secondary_read_preference())
+        _collections[key] = collection
+    return collection
+
+
+class SharedCollection:
+    """
+    Class attribute that resolves to a collection of the shared client on access,
+    so models never hold on to a client that was created before a fork. Inside
+    secondary_reads() it resolves to the secondary-reading twin of the collection.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, obj, owner):
+        return get_collection(self.name, secondary=reading_from_secondaries())
+
+
+def cooperative() -> bool:
+    """ True in gevent workers: the standard library is monkey-patched and blocking I/O yields to other greenlets. """
+    if "gevent" not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched("socket")
+
+
+def _notify_redis_listeners(command: str, start: float, failed: bool):
+    elapsed = time.perf_counter() - start
+    for listener in redis_listeners:
+        listener(command, elapsed, failed)
+
+
+class TimedPipeline(redis.client.Pipeline):
+    """ Pipeline reported to the Redis listeners as one PIPELINE command. """
+
+    def execute(self, *args, **kwargs):
+        start, failed = time.perf_counter(), True
+        try:
+            result = super().execute(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            _notify_redis_listeners("PIPELINE", start, failed)
+
+
+class TimedRedis(redis.Redis):
+    """ Redis client reporting the duration of every command to `redis_listeners`. """
+
+    def execute_command(self, *args, **options):
+        start, failed = time.perf_counter(), True
+        try:
+            result = super().execute_command(*args, **options)
+            failed = False
+            return result
+        finally:
+            _notify_redis_listeners(str(args[0]).upper(), start, failed)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def get_redis(url: Optional[str] = None) -> redis.Redis:
+    """ Return the shared Redis client for `url` (one connection pool per process). """
+    url = url or os.getenv('REDIS_URL')  # Must be set in production environment
+    if not url:
+        raise ValueError("REDIS_URL must be Configured")
+    client = _redis_clients.get(url)
+    if client is None:
+        with _lock:
+            client = _redis_clients.get(url)
+            if client is None:
+                options = {"decode_responses": True, "max_connections": int(os.getenv("REDIS_MAX_CONNECTIONS", 50))}
+                if url.startswith("rediss://") and os.getenv("REDIS_SSL_CERT_REQS"):
+                    options["ssl_cert_reqs"] = os.getenv("REDIS_SSL_CERT_REQS")  # e.g. 'none' for Heroku Redis
+                if cooperative():
+                    # Hundreds of greenlets share the pool: wait for a free connection instead of failing with "Too many connections"
+                    pool = redis.BlockingConnectionPool.from_url(url, timeout=float(os.getenv("REDIS_POOL_TIMEOUT", 5)), **options)
+                    client = TimedRedis(connection_pool=pool)
+                    client.auto_close_connection_pool = True
+                else:
+                    client = TimedRedis.from_url(url, **options)
+                _redis_clients[url] = client
+    return client
+
+
+def use_clients(mongo_client=None, redis_client=None):
+    """
+    Register ready-made clients for the configured MONGODB_URI / REDIS_URL,
+    e.g. in-process fakes when benchmarking without mongod or redis-server.
+    """
+    with _lock:
+        if mongo_client is not None:
+            _clients[os.getenv('MONGODB_URI')] = mongo_client
+            _collections.clear()
+        if redis_client is not None:
+            _redis_clients[os.getenv('REDIS_URL')] = redis_client
+
+
+def mongo_call_count() -> int:
+    """ Number of Mongo commands issued so far by the current request. """
+    return g.get("mongo_calls", 0) if has_request_context() else 0
+
+
+def warmup():
+    """ Run server discovery and open the first pooled connection before serving traffic. """
+    get_client().admin.command("ping")
+
+
+def pool_stats() -> dict:
+    """ Return pool configuration and connection counters for this process. """
+    counters = dict(pool_listener.counters)
+    return {
+        "pid": os.getpid(),
+        "clients": len(_clients),
+        "options": pool_options(),
+        "secondary_reads": secondary_read_options(),
+        "cooperative": cooperative(),
+        "open_connections": counters["connections_created"] - counters["connections_closed"],
+        "in_use": counters["checked_out"] - counters["checked_in"],
+        **counters,
+    }
+
+
+def close_clients():
+    """ Close every shared Mongo and Redis client and empty the registry. """
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        _collections.clear()
+        for client in _redis_clients.values():
+            client.close()
+        _redis_clients.clear()
+    pool_listener.reset()
+
+
+def _reset_after_fork():
+    """ Drop Mongo and Redis clients inherited from the parent; the child builds its own pools on first use. """
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+    _collections.clear()
+    _redis_clients.clear()
+    pool_listener._lock = threading.Lock()
+    pool_listener.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
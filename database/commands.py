@@ -0,0 +1,31 @@
+from flask.cli import AppGroup
+import click
+from .indexes import sync_indexes, audit_queries
+
+# `flask db ...` maintenance commands, run at deploy time (see Procfile release phase)
+db_cli = AppGroup('db', help="MongoDB index maintenance.")
+
+
+@db_cli.command("sync-indexes")
+@click.option("--drop-extra", is_flag=True, help="Also drop indexes that are not declared.")
+def sync_indexes_command(drop_extra):
+    """ Create the declared indexes missing from each collection. """
+    report = sync_indexes(drop_extra=drop_extra)
+    for collection, changes in report.items():
+        created = ", ".join(changes["created"]) or "-"
+        dropped = ", ".join(changes["dropped"]) or "-"
+        click.echo(f"{collection}: created {created}; dropped {dropped}")
+
+
+@db_cli.command("audit-queries")
+def audit_queries_command():
+    """ Explain every query shape and fail on collection scans or in-memory sorts. """
+    flagged = 0
+    for result in audit_queries():
+        if result["issues"]:
+            flagged += 1
+            click.echo(f"FLAG {result['collection']}: {result['name']} ({', '.join(result['issues'])})")
+        else:
+            click.echo(f"ok   {result['collection']}: {result['name']}")
+    if flagged:
+        raise SystemExit(1)
@@ -1,29 +1,24 @@
-from pymongo import MongoClient, ASCENDING
-from werkzeug.security import generate_password_hash
 from uuid import uuid4  # Correct import for uuid
 import uuid
 from datetime import datetime, timedelta
-import os
-from dotenv import load_dotenv
+from flask import g, has_request_context
+from pymongo.errors import DuplicateKeyError
+from .client import SharedCollection
+from .password_hasher import password_hasher
 
-load_dotenv()
-
-mongo_uri = os.getenv('MONGODB_URI')  # Must be set in production environment
-if not mongo_uri:
-    raise ValueError("MONGODB_URI must be set Configured")
 
 class User:
+    # Collection of the process-wide shared client
+    users = SharedCollection('users')
+
     def __init__(self, username, password):
         self.user_id = uuid4()  # Corrected UUID generation
         self.username = username
         self.password = password
-        self.client = MongoClient(mongo_uri)
-        self.db = self.client['habitforge']
-        self.users = self.db['users']
 
     def save(self):
         """ Save a new user with hashed password to the database. """
-        hashed_password = generate_password_hash(self.password, method='pbkdf2:sha256', salt_length=8)
+        hashed_password = password_hasher.hash(self.password)  # Raises HashingUnavailable when saturated
         user_data = {
             "user_id": str(self.user_id),  # Ensure UUID is saved as a string
             "username": self.username,
@@ -35,24 +30,21 @@ class User:
     @staticmethod
     def find_user_by_username(username):
         """ Find a user by username. """
-        client = MongoClient(mongo_uri)
-        db = client['habitforge']
-        users = db['users']
-        user = users.find_one({"username": username})
+        user = User.users.find_one({"username": username})
         return user  # Will return None if not found, no need for try-except for this
 
     def update_password(self, new_password):
         """ Update the password for the user. """
-        hashed_password = generate_password_hash(new_password, method='pbkdf2:sha256', salt_length=8)
+        hashed_password = password_hasher.hash(new_password)
         self.users.update_one({"username": self.username}, {"$set": {"password": hashed_password}})
 
 
 class Habit:
-    # Initialize the MongoDB client and collection at the class level
-    client = MongoClient(mongo_uri)
-    db = client['habitforge']
-    habits = db['habits']
-    habits.create_index([("username", ASCENDING), ("habit_name", ASCENDING)], unique=True)
+    # Collection of the process-wide shared client
+    habits = SharedCollection('habits')
+    # Internal fields left out of API responses by the query itself
+    PUBLIC_PROJECTION = {"_id": 0, "habit_id": 0, "start_date": 0, "version": 0}
+
     def __init__(self, username, habit_name=None, frequency=None, status=None):
         self.habit_id = uuid4()  # Corrected UUID generation
         self.username = username  # Use the username from JWT
@@ -63,17 +55,14 @@ class Habit:
 
     # Ensure the Habit class has a find method defined to query the database
     @classmethod
-    def find(cls, query):
-        return cls.habits.find(query)  # Add this method to your Habit class
+    def find(cls, query, projection=None):
+        return cls.habits.find(query, projection)  # Add this method to your Habit class
 
     
     @staticmethod
     def find_habit_by_id(habit_id):
-        """ Find a user by username. """
-        client = MongoClient(mongo_uri)
-        db = client['habitforge']
-        habits = db['habits']
-        habit = habits.find_one({"habit_id": habit_id})
+        """ Find a habit by habit_id. """
+        habit = HabitRepository.current().find_by_id(habit_id)
         return habit # return habit details
 
     def create(self):
@@ -83,23 +72,33 @@ class Habit:
             "habit_name": self.habit_name,
             "frequency": self.frequency,
             "status": self.status,
-            "start_date": self.start_date
+            "start_date": self.start_date,
+            "version": 1  # Bumped by every change to the habit or its logs (ETags, response cache)
         }
         self.habits.insert_one(habit_data)
+        HabitRepository.current().remember(habit_data)
+
+    @staticmethod
+    def bump_versions(habit_ids):
+        """ Mark habits as changed, e.g. after logs were accepted: their cached responses no longer match. """
+        Habit.habits.update_many({"habit_id": {"$in": list(habit_ids)}}, {"$inc": {"version": 1}})
 
     def rename_habit(self, habit_name, new_habit_name):
-        habit = self.habits.find_one({"username": self.username, "habit_name": habit_name})
+        repository = HabitRepository.current()
+        habit = repository.find_by_name(self.username, habit_name)
         if habit:
             self.habits.update_one(
                 {"habit_id": habit["habit_id"]},
-                {"$set": {"habit_name": new_habit_name}}
+                {"$set": {"habit_name": new_habit_name}, "$inc": {"version": 1}}
             )
+            repository.forget(self.username, habit_name, new_habit_name)
             print("Habit renamed successfully.")
         else:
             print("Habit not found.")
 
     def delete_habit(self, habit_name):
         result = self.habits.delete_one({"username": self.username, "habit_name": habit_name})
+        HabitRepository.current().forget(self.username, habit_name)
         if result.deleted_count > 0:
             return f"Habit '{habit_name}' deleted successfully"
         else:
@@ -107,7 +106,7 @@ class Habit:
 
 
     def get_status(self, habit_name):
-        habit = self.habits.find_one({"username": self.username, "habit_name": habit_name})
+        habit = HabitRepository.current().find_by_name(self.username, habit_name)
         if habit:
             return habit.get("status", "No status logged yet")
         return "Habit not found."
@@ -115,32 +114,88 @@ class Habit:
     def put_status(self, habit_name, status):
         self.habits.update_one(
             {"username": self.username, "habit_name": habit_name},
-            {"$set": {"status": status}}
+            {"$set": {"status": status}, "$inc": {"version": 1}}
         )
+        HabitRepository.current().forget(self.username, habit_name)
         return f"Status for {habit_name} is '{status}'"
 
     def habit_frequency(self, habit_name):
-        habit = self.habits.find_one({"username": self.username, "habit_name": habit_name})
+        habit = HabitRepository.current().find_by_name(self.username, habit_name)
         if habit:
             return habit.get("frequency")
         return f"Frequency not found"
 
+
+class HabitRepository:
+    """
+    Identity map of habit documents for the current Flask request: a habit is
+    loaded once and the same document is handed to the blueprint, the Habit
+    model and HabitEngine. Outside a request nothing is cached.
+    """
+
+    def __init__(self):
+        self._by_name = {}
+        self._by_id = {}
+
+    @staticmethod
+    def current():
+        """ The repository of the current request (a throwaway one outside requests). """
+        if not has_request_context():
+            return HabitRepository()
+        if "habit_repository" not in g:
+            g.habit_repository = HabitRepository()
+        return g.habit_repository
+
+    def remember(self, habit):
+        """ Add a habit document to the identity map. """
+        self._by_name[(habit["username"], habit["habit_name"])] = habit
+        self._by_id[habit["habit_id"]] = habit
+
+    def find_by_name(self, username, habit_name):
+        """ Find a habit by (username, habit_name), at most once per request. """
+        key = (username, habit_name)
+        if key not in self._by_name:
+            habit = Habit.habits.find_one({"username": username, "habit_name": habit_name})
+            self._by_name[key] = habit
+            if habit:
+                self._by_id[habit["habit_id"]] = habit
+        return self._by_name[key]
+
+    def find_by_id(self, habit_id):
+        """ Find a habit by habit_id, at most once per request. """
+        if habit_id not in self._by_id:
+            habit = Habit.habits.find_one({"habit_id": habit_id})
+            self._by_id[habit_id] = habit
+            if habit:
+                self._by_name[(habit["username"], habit["habit_name"])] = habit
+        return self._by_id[habit_id]
+
+    def forget(self, username, *habit_names):
+        """ Drop habits from the identity map after they were changed. """
+        for habit_name in habit_names:
+            habit = self._by_name.pop((username, habit_name), None)
+            if habit:
+                self._by_id.pop(habit["habit_id"], None)
+
+    def forget_all(self):
+        """ Drop every cached habit (after bulk changes). """
+        self._by_name.clear()
+        self._by_id.clear()
+
+
 class Habit_Log:
-    # Initialize the MongoDB client and habit_logs collection at the class level
-    client = MongoClient(mongo_uri)
-    db = client['habitforge']
-    habit_logs = db['habit_logs']
-    habit_logs.create_index([('username', ASCENDING), ('habit_name', ASCENDING), ('log', ASCENDING), ('timestamp', ASCENDING)], unique=True)
-    #habit_logs.drop_indexes()
-    def __init__(self, username, habit_name, habit_id, log):
+    # Collection of the process-wide shared client
+    habit_logs = SharedCollection('habit_logs')
+
+    def __init__(self, username, habit_name, habit_id, log, timestamp=None, period=None):
         self.username = username
         self.habit_name = habit_name
         self.habit_id = habit_id
         self.log = log
-        self.timestamp = datetime.utcnow()
+        self.timestamp = timestamp or datetime.utcnow()  # Offline clients replay their own timestamps
+        self.period = period  # Start of the day/week/month logged, unique per habit
 
-    def insert_log(self):
-        
+    def to_document(self):
         log_data = {
                 "username": self.username,
                 "habit_name": self.habit_name,
@@ -148,8 +203,41 @@ class Habit_Log:
                 "timestamp": self.timestamp,
                 "log": self.log
                 }
+        if self.period:
+            log_data["period"] = self.period
+            log_data["pending"] = True  # Not folded into the habit's rollup yet
+        return log_data
+
+    def insert_log(self):
+        """ Store the log; a second log of the same period raises DuplicateKeyError. """
+        log_data = self.to_document()
         try:
             self.habit_logs.insert_one(log_data)
             return {"message": "Log added successfully"}, 201
+        except DuplicateKeyError:
+            raise
         except Exception as e:
-            return {"message": f"Error adding log: {str(e)}"}
+            return {"message": f"Error adding log: {str(e)}"}, 500
+
+
+class Habit_Rollup:
+    """
+    One document per habit holding precomputed streak and completion counters,
+    kept current by folding in accepted logs so reads never walk habit_logs.
+    """
+    # Collection of the process-wide shared client
+    habit_rollups = SharedCollection('habit_rollups')
+
+    @staticmethod
+    def find_rollup_by_habit_id(habit_id):
+        """ Find the rollup of a habit (None if it has no logs yet). """
+        return Habit_Rollup.habit_rollups.find_one({"habit_id": habit_id})
+
+
+class Habit_Log_Bucket:
+    """
+    Compacted 'done' logs: one document per habit per calendar year holding the
+    timestamps of logs moved out of habit_logs by `flask habit compact-logs`.
+    """
+    # Collection of the process-wide shared client
+    habit_log_buckets = SharedCollection('habit_log_buckets')
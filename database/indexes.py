@@ -0,0 +1,169 @@
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from .client import get_db
+
+# Indexes every collection must have. Names are left to the driver defaults
+# (e.g. "habit_id_1_timestamp_1") so existing indexes are recognised as-is.
+INDEXES: Dict[str, List[IndexModel]] = {
+    'users': [
+        IndexModel([('username', ASCENDING)], unique=True),
+    ],
+    'habits': [
+        IndexModel([('username', ASCENDING), ('habit_name', ASCENDING)], unique=True),
+        IndexModel([('habit_id', ASCENDING)], unique=True),
+    ],
+    'habit_logs': [
+        IndexModel([('username', ASCENDING), ('habit_name', ASCENDING), ('log', ASCENDING), ('timestamp', ASCENDING)], unique=True),
+        IndexModel([('habit_id', ASCENDING), ('timestamp', ASCENDING)]),
+        IndexModel([('habit_id', ASCENDING), ('_id', ASCENDING)]),  # Logs stored since an export checkpoint
+        # One log per habit per day/week/month: the insert itself is the spacing check
+        IndexModel([('habit_id', ASCENDING), ('period', ASCENDING)], unique=True,
+                   partialFilterExpression={'period': {'$exists': True}}),
+        # Logs not folded into their rollup yet, only those are indexed
+        IndexModel([('pending', ASCENDING), ('habit_id', ASCENDING)], partialFilterExpression={'pending': True}),
+    ],
+    'habit_rollups': [
+        IndexModel([('habit_id', ASCENDING)], unique=True),
+    ],
+    'habit_log_buckets': [
+        IndexModel([('habit_id', ASCENDING), ('year', ASCENDING)], unique=True),
+    ],
+}
+
+# Plan stages the audit reports: full collection scans and sorts done in memory
+FLAGGED_STAGES = {'COLLSCAN': 'collection scan', 'SORT': 'in-memory sort'}
+
+
+def sync_indexes(db=None, drop_extra: bool = False) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Create the declared indexes that are missing (optionally dropping undeclared ones).
+    Returns, per collection, the index names created and dropped.
+    """
+    db = db if db is not None else get_db()
+    report = {}
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        existing = set(collection.index_information())
+        declared = collection.create_indexes(models)
+        dropped = []
+        if drop_extra:
+            for name in existing - set(declared) - {'_id_'}:
+                collection.drop_index(name)
+                dropped.append(name)
+        report[collection_name] = {
+            "created": [name for name in declared if name not in existing],
+            "dropped": dropped,
+        }
+    return report
+
+
+def query_shapes(sample: Optional[dict] = None) -> List[dict]:
+    """
+    Every query shape the blueprints and HabitEngine issue, with sample values.
+    `sample` is a habits document used to fill in realistic values.
+    """
+    from v1.core.habit.habit_pipelines import statistics_pipeline, dashboard_pipeline
+
+    sample = sample or {}
+    username = sample.get("username", "audit_user")
+    habit_name = sample.get("habit_name", "audit_habit")
+    habit_id = sample.get("habit_id", "audit_habit_id")
+    frequency = sample.get("frequency") if sample.get("frequency") in ('daily', 'weekly', 'monthly') else 'daily'
+    now = datetime.utcnow()
+
+    return [
+        {"name": "user by username", "collection": "users",
+         "filter": {"username": username}},
+        {"name": "habit by name", "collection": "habits",
+         "filter": {"username": username, "habit_name": habit_name}},
+        {"name": "habit by id", "collection": "habits",
+         "filter": {"habit_id": habit_id}},
+        {"name": "habits of user", "collection": "habits",
+         "filter": {"username": username}},
+        {"name": "habits of user page (export)", "collection": "habits",
+         "filter": {"username": username, "habit_name": {"$gt": ""}}, "sort": {"habit_name": ASCENDING}},
+        {"name": "habits page (export)", "collection": "habits",
+         "filter": {"habit_id": {"$gt": ""}}, "sort": {"habit_id": ASCENDING}},
+        {"name": "pending logs of habits (rollup fold)", "collection": "habit_logs",
+         "filter": {"pending": True, "habit_id": {"$in": [habit_id]}}},
+        {"name": "logs left pending (scheduler)", "collection": "habit_logs",
+         "filter": {"pending": True, "_id": {"$lt": ObjectId.from_datetime(now - timedelta(minutes=1))}}},
+        {"name": "logs without a period (assign-log-periods)", "collection": "habit_logs",
+         "filter": {"habit_id": habit_id, "log": "done", "period": {"$exists": False}}, "sort": {"timestamp": ASCENDING}},
+        {"name": "rollups of habits (batch)", "collection": "habit_rollups",
+         "filter": {"habit_id": {"$in": [habit_id]}}},
+        {"name": "log history page", "collection": "habit_logs",
+         "filter": {"habit_id": habit_id, "timestamp": {"$gt": now - timedelta(days=30)}}, "sort": {"timestamp": ASCENDING}},
+        {"name": "logs stored since checkpoint (export)", "collection": "habit_logs",
+         "filter": {"habit_id": habit_id, "_id": {"$gte": ObjectId.from_datetime(now - timedelta(days=1)), "$lt": ObjectId.from_datetime(now)}}},
+        {"name": "compacted logs stored since checkpoint (export)", "collection": "habit_log_buckets",
+         "filter": {"habit_id": habit_id, "stored": {"$gte": now - timedelta(days=1), "$lt": now}}, "sort": {"year": ASCENDING}},
+        {"name": "logs of deleted habits (cascade)", "collection": "habit_logs",
+         "filter": {"habit_id": {"$in": [habit_id]}}},
+        {"name": "compacted logs (history)", "collection": "habit_log_buckets",
+         "filter": {"habit_id": habit_id, "last": {"$gt": now - timedelta(days=30)}}, "sort": {"year": ASCENDING}},
+        {"name": "logs to compact", "collection": "habit_logs",
+         "filter": {"habit_id": habit_id, "log": "done", "pending": {"$ne": True}, "timestamp": {"$lt": now - timedelta(days=365)}},
+         "sort": {"timestamp": ASCENDING}},
+        {"name": "done logs (rollup rebuild)", "collection": "habit_logs",
+         "filter": {"habit_id": habit_id, "log": "done"}, "sort": {"timestamp": ASCENDING}},
+        {"name": "heatmap logs", "collection": "habit_logs",
+         "filter": {"habit_id": habit_id, "log": "done", "timestamp": {"$gte": now - timedelta(days=365), "$lt": now}}},
+        {"name": "heatmap buckets", "collection": "habit_log_buckets",
+         "filter": {"habit_id": habit_id, "year": {"$gte": now.year - 1, "$lte": now.year}}},
+        {"name": "ranged statistics", "collection": "habit_logs",
+         "pipeline": statistics_pipeline(habit_id, frequency, now, now - timedelta(days=365), now)},
+        {"name": "habit rollup", "collection": "habit_rollups",
+         "filter": {"habit_id": habit_id}},
+        {"name": "dashboard", "collection": "habits",
+         "pipeline": dashboard_pipeline(username)},
+    ]
+
+
+def plan_issues(explain: dict) -> List[str]:
+    """ Return the flagged stages found anywhere in the winning plan(s) of an explain output. """
+    issues = []
+
+    def walk(node, in_winning_plan):
+        if isinstance(node, dict):
+            stage = node.get("stage")
+            if in_winning_plan and stage in FLAGGED_STAGES:
+                issues.append(FLAGGED_STAGES[stage])
+            for key, value in node.items():
+                if key == "rejectedPlans":
+                    continue
+                walk(value, in_winning_plan or key == "winningPlan")
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, in_winning_plan)
+
+    walk(explain, False)
+    return issues
+
+
+def explain_shape(shape: dict, db=None) -> dict:
+    """ Run explain (queryPlanner verbosity) for one query shape. """
+    db = db if db is not None else get_db()
+    if "pipeline" in shape:
+        command = {"aggregate": shape["collection"], "pipeline": shape["pipeline"], "cursor": {}}
+    else:
+        command = {"find": shape["collection"], "filter": shape["filter"]}
+        if shape.get("sort"):
+            command["sort"] = shape["sort"]
+    return db.command("explain", command, verbosity="queryPlanner")
+
+
+def audit_queries(db=None) -> List[dict]:
+    """ Explain every query shape and report the collection scans and in-memory sorts. """
+    db = db if db is not None else get_db()
+    sample = db['habits'].find_one({"frequency": {"$in": ['daily', 'weekly', 'monthly']}})
+    results = []
+    for shape in query_shapes(sample):
+        results.append({
+            "name": shape["name"],
+            "collection": shape["collection"],
+            "issues": plan_issues(explain_shape(shape, db)),
+        })
+    return results
@@ -0,0 +1,97 @@
+from werkzeug.security import generate_password_hash, check_password_hash
+from concurrent.futures import Executor, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from .client import cooperative
+import multiprocessing
+import os
+import threading
+from typing import Optional
+
+
+class HashingUnavailable(Exception):
+    """ The hashing pool is saturated (or too slow); the auth request should be shed. """
+
+
+class PasswordHasher:
+    """
+    Bounded process pool for PBKDF2 hashing and verification.
+
+    Hashing runs outside the request worker's interpreter, so it doesn't hold the
+    GIL of the worker serving habit requests. At most `queue_depth` hashes are in
+    flight per worker process; beyond that (or past `timeout`) HashingUnavailable
+    is raised instead of queueing more work. PASSWORD_HASH_WORKERS=0 hashes inline.
+
+    In gevent workers the pool is made of native threads instead (gevent's
+    threadpool): PBKDF2 releases the GIL, so the greenlets keep serving while
+    a hash runs, and no process pool has to cooperate with the gevent hub.
+    """
+
+    def __init__(self):
+        self.workers = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+        self.queue_depth = int(os.getenv("PASSWORD_HASH_QUEUE_DEPTH", max(1, self.workers) * 4))
+        self.timeout = float(os.getenv("PASSWORD_HASH_TIMEOUT", 5))
+        self.iterations = int(os.getenv("PASSWORD_HASH_ITERATIONS", 600000))  # PBKDF2 cost
+        self._slots = threading.BoundedSemaphore(self.queue_depth)
+        self._executor: Optional[Executor] = None
+        self._executor_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        """ The pool of this process, created on first use (and again after a fork). """
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            if self._executor_pid not in (None, pid):
+                self._lock = threading.Lock()
+                self._slots = threading.BoundedSemaphore(self.queue_depth)
+            with self._lock:
+                if self._executor is None or self._executor_pid != pid:
+                    if cooperative():
+                        from gevent.threadpool import ThreadPoolExecutor
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+                    else:
+                        # forkserver: hashing processes don't inherit the worker's client threads
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver"))
+                    self._executor_pid = pid
+        return self._executor
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        executor = self._get_executor()
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise HashingUnavailable("Password hashing queue is full")
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            slots.release()
+            self._executor = None  # Rebuilt on the next call
+            raise HashingUnavailable("Password hashing pool restarting")
+        except Exception:
+            slots.release()
+            raise
+        # The slot is freed when the hash finishes, even if the caller gave up waiting
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HashingUnavailable("Password hashing timed out")
+        except BrokenProcessPool:
+            self._executor = None  # A hashing process died; rebuilt on the next call
+            raise HashingUnavailable("Password hashing pool restarting")
+
+    def hash(self, password: str) -> str:
+        """ Hash a password with PBKDF2-SHA256 at the configured cost. """
+        return self._run(generate_password_hash, password, f"pbkdf2:sha256:{self.iterations}", 8)
+
+    def verify(self, hashed_password: str, password: str) -> bool:
+        """ Check a password against a stored hash (the cost is read from the hash). """
+        return self._run(check_password_hash, hashed_password, password)
+
+    def shutdown(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+password_hasher = PasswordHasher()
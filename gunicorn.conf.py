@@ -0,0 +1,44 @@
+# Gunicorn settings, read from the working directory (`gunicorn "app:create_app()"`)
+import glob
+import logging
+import os
+import shutil
+import tempfile
+
+# Build the app in every worker after fork: Mongo/Redis clients, their monitor
+# threads and the hashing pool are never shared between processes. gevent workers
+# also need it: the app must be imported after the worker monkey-patched the stdlib
+preload_app = False
+
+# "sync": one request per worker process at a time (an open /stream pins the worker).
+# "gevent": up to worker_connections requests and streams per process, each a
+# greenlet yielding on every Mongo, Redis and socket wait (pip install gevent)
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+logger = logging.getLogger("gunicorn.error")
+
+# Workers write their metrics snapshots here and /metrics serves their sum (one directory per server)
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"habitforge-metrics-{os.getpid()}"))
+
+
+def on_starting(server):
+    """ Start the metrics from zero: drop the snapshots of a previous server that used this METRICS_DIR. """
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "*.json")):
+        os.remove(path)
+
+
+def on_exit(server):
+    shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+
+
+def post_worker_init(worker):
+    """ Open the worker's Mongo pool before it accepts requests, so the first one doesn't pay for it. """
+    if os.getenv('MONGO_WARMUP', '1') == '0':
+        return
+    from database.client import warmup
+    try:
+        warmup()
+    except Exception as e:
+        # The driver keeps retrying in the background; requests fail until Mongo answers
+        logger.warning("MongoDB warmup failed in worker %s: %s", worker.pid, e)
@@ -0,0 +1,137 @@
+"""
+Test fixtures: the app against in-process fakes (mongomock, fakeredis), no
+server needed. Tests that need a real mongod are skipped without one.
+"""
+import functools
+import os
+import threading
+
+os.environ.setdefault("MONGODB_URI", "mongodb://tests.invalid:27017")
+os.environ.setdefault("REDIS_URL", "redis://tests.invalid:6379")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-test-secret-key-test")
+os.environ["MONGO_DB_NAME"] = "habitforge_test"
+os.environ["MONGO_WARMUP"] = "0"
+os.environ["PASSWORD_HASH_WORKERS"] = "0"  # Hash inline
+os.environ["PASSWORD_HASH_ITERATIONS"] = "1000"
+
+import fakeredis
+import mongomock
+import pytest
+from flask.testing import FlaskClient
+from pymongo import DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from database.client import command_counter, use_clients
+
+# The habit most tests create and log (`from conftest import HABIT`)
+HABIT = {"habit_name": "read"}
+
+# Collection methods that send one command to the server
+COMMAND_METHODS = (
+    "find", "find_one", "aggregate", "insert_one", "insert_many", "update_one", "update_many",
+    "replace_one", "delete_one", "delete_many", "find_one_and_update", "bulk_write",
+    "count_documents", "distinct",
+)
+_in_command = threading.local()
+
+
+def _counted(method):
+    """
+    mongomock sends no command events: report each top-level collection call to
+    the app's command counter (mongomock methods calling each other count once).
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if getattr(_in_command, "active", False):
+            return method(*args, **kwargs)
+        command_counter.started(None)
+        _in_command.active = True
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _in_command.active = False
+    return wrapper
+
+
+def _bulk_write(self, requests, ordered=True, **kwargs):
+    """ mongomock's bulk_write rejects pymongo 4's UpdateOne; replay the operations one by one. """
+    errors = []
+    for index, request in enumerate(requests):
+        try:
+            if isinstance(request, UpdateOne):
+                self.update_one(request._filter, request._doc, upsert=request._upsert)
+            elif isinstance(request, InsertOne):
+                self.insert_one(request._doc)
+            elif isinstance(request, DeleteOne):
+                self.delete_one(request._filter)
+            else:
+                raise NotImplementedError(type(request).__name__)
+        except DuplicateKeyError as e:
+            errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+            if ordered:
+                break
+    if errors:
+        raise BulkWriteError({"writeErrors": errors})
+
+
+def _create_indexes(self, indexes, session=None):
+    """ mongomock's create_indexes drops partialFilterExpression; create each index with all its options. """
+    return [
+        self.create_index(list(index.document["key"].items()), **{key: value for key, value in index.document.items() if key != "key"})
+        for index in indexes
+    ]
+
+
+mongomock.collection.Collection.bulk_write = _bulk_write
+mongomock.collection.Collection.create_indexes = _create_indexes
+for _name in COMMAND_METHODS:
+    setattr(mongomock.collection.Collection, _name, _counted(getattr(mongomock.collection.Collection, _name)))
+
+_mongo = mongomock.MongoClient()
+_redis = fakeredis.FakeRedis(decode_responses=True)
+use_clients(mongo_client=_mongo, redis_client=_redis)
+
+
+class SentResponsesClient(FlaskClient):
+    """ Closes each response once it is read, like a WSGI server once it sent it: work deferred until then has run. """
+
+    def open(self, *args, **kwargs):
+        kwargs.setdefault("buffered", True)
+        return super().open(*args, **kwargs)
+
+
+@pytest.fixture
+def app():
+    from app import create_app
+    from database.indexes import sync_indexes
+
+    _mongo.drop_database(os.environ["MONGO_DB_NAME"])
+    _redis.flushall()
+    sync_indexes()
+    application = create_app()
+    application.testing = True
+    application.test_client_class = SentResponsesClient
+    return application
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth(client):
+    """ Authorization headers of a freshly registered user. """
+    def login(username="alice", password="password123"):
+        client.post("/auth/register", json={"username": username, "password": password})
+        token = client.post("/auth/login", json={"username": username, "password": password}).get_json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+    return login
+
+
+@pytest.fixture
+def headers(client, auth):
+    """ Authorization headers of a freshly registered user with a daily HABIT. """
+    headers = auth()
+    client.post("/habit/create", json={**HABIT, "frequency": "daily"}, headers=headers)
+    return headers
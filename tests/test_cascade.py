@@ -0,0 +1,185 @@
+"""
+Deleting, resetting and renaming habits only queue the log cascade; the worker
+(work) applies it, picks up again the jobs of a worker that died mid-job, and
+lets the current habit name win. sweep_orphans reclaims what was never queued.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import Habit, Habit_Log, Habit_Log_Bucket, Habit_Rollup, get_redis
+from v1.core.habit import habit_cascade
+from v1.core.habit.habit_buckets import compact_all
+from v1.core.habit.habit_cascade import JOBS_KEY, PROCESSING_PREFIX, sweep_orphans, work
+from v1.core.habit.habit_rollup import rebuild_all
+
+from conftest import HABIT
+
+
+def create(client, headers, habit_name, days=30):
+    """ Create a daily habit with `days` logs, the older half compacted, and its rollup. Returns its habit_id. """
+    client.post("/habit/create", json={"habit_name": habit_name, "frequency": "daily"}, headers=headers)
+    habit = Habit.habits.find_one({"habit_name": habit_name})
+    now = datetime.utcnow()
+    Habit_Log.habit_logs.insert_many([
+        Habit_Log(habit["username"], habit_name, habit["habit_id"], "done", now - timedelta(days=day)).to_document()
+        for day in range(1, days + 1)
+    ])
+    compact_all({"habit_id": habit["habit_id"]}, older_than=timedelta(days=days // 2), pause=0)
+    rebuild_all({"habit_id": habit["habit_id"]})
+    return habit["habit_id"]
+
+
+def stored(habit_id):
+    """ (raw logs, buckets, rollups) of a habit """
+    return (
+        Habit_Log.habit_logs.count_documents({"habit_id": habit_id}),
+        Habit_Log_Bucket.habit_log_buckets.count_documents({"habit_id": habit_id}),
+        Habit_Rollup.habit_rollups.count_documents({"habit_id": habit_id}),
+    )
+
+
+def names(habit_id):
+    """ habit_name of the habit's raw logs and buckets """
+    return (
+        {log["habit_name"] for log in Habit_Log.habit_logs.find({"habit_id": habit_id})},
+        {bucket["habit_name"] for bucket in Habit_Log_Bucket.habit_log_buckets.find({"habit_id": habit_id})},
+    )
+
+
+def queued(name="test"):
+    redis = get_redis()
+    return [json.loads(job) for job in redis.lrange(JOBS_KEY, 0, -1) + redis.lrange(PROCESSING_PREFIX + name, 0, -1)]
+
+
+def test_delete_leaves_the_raw_logs_to_the_worker(client, headers):
+    doomed = create(client, headers, "read")
+    kept = create(client, headers, "run")
+    assert stored(doomed)[0] > 0 and stored(doomed)[1:] == (1, 1)
+
+    assert client.delete("/habit/delete", json=HABIT, headers=headers).status_code == 200
+    assert stored(doomed)[0] > 0 and stored(doomed)[1:] == (0, 0)  # Rollup and buckets go with the habit
+    assert queued() == [{"op": "delete", "habit_id": doomed}]
+
+    work(name="test", once=True)
+    assert stored(doomed) == (0, 0, 0)
+    assert stored(kept)[1:] == (1, 1) and stored(kept)[0] > 0
+    assert queued() == []
+
+
+def test_reset_deletes_the_logs_of_every_habit(client, headers, auth):
+    habit_ids = [create(client, headers, "read"), create(client, headers, "run")]
+    bob = auth("bob")
+    bobs = create(client, bob, "swim")
+
+    assert client.delete("/habit/reset", headers=headers).status_code == 200
+    assert sorted(job["habit_id"] for job in queued()) == sorted(habit_ids)
+
+    work(name="test", once=True)
+    assert [stored(habit_id) for habit_id in habit_ids] == [(0, 0, 0)] * 2
+    assert stored(bobs)[0] > 0
+
+
+def test_rename_rewrites_the_logs_and_buckets(client, headers):
+    habit_id = create(client, headers, "read")
+    assert client.put("/habit/rename", json={**HABIT, "new_habit_name": "study"}, headers=headers).status_code == 200
+    assert names(habit_id) == ({"read"}, {"read"})
+
+    work(name="test", once=True)
+    assert names(habit_id) == ({"study"}, {"study"})
+    assert stored(habit_id)[1:] == (1, 1)
+
+
+def test_the_current_name_wins_over_queued_ones(client, headers):
+    habit_id = create(client, headers, "read")
+    client.put("/habit/rename", json={**HABIT, "new_habit_name": "study"}, headers=headers)
+    client.put("/habit/rename", json={"habit_name": "study", "new_habit_name": "learn"}, headers=headers)
+    get_redis().rpush(JOBS_KEY, json.dumps({"op": "rename", "habit_id": habit_id, "habit_name": "study"}))  # Replayed last
+
+    work(name="test", once=True)
+    assert names(habit_id) == ({"learn"}, {"learn"})
+
+
+@pytest.mark.parametrize("order", ["rename, delete", "delete, rename"])
+def test_rename_and_delete_in_any_order_delete_everything(client, headers, order):
+    habit_id = create(client, headers, "read")
+    client.put("/habit/rename", json={**HABIT, "new_habit_name": "study"}, headers=headers)
+    client.delete("/habit/delete", json={"habit_name": "study"}, headers=headers)
+    jobs = queued()
+    assert [job["op"] for job in reversed(jobs)] == ["rename", "delete"]  # Oldest first (taken from the right)
+    if order == "delete, rename":
+        redis = get_redis()
+        redis.delete(JOBS_KEY)
+        redis.lpush(JOBS_KEY, *(json.dumps(job) for job in reversed(jobs)))
+
+    work(name="test", once=True)
+    assert stored(habit_id) == (0, 0, 0)
+    assert queued() == []
+
+
+def test_the_logs_of_a_live_habit_are_never_deleted(client, headers):
+    habit_id = create(client, headers, "read")
+    before = stored(habit_id)
+    get_redis().lpush(JOBS_KEY, json.dumps({"op": "delete", "habit_id": habit_id}))  # e.g. a replayed job
+
+    work(name="test", once=True)
+    assert stored(habit_id) == before
+
+
+def test_jobs_of_a_dead_worker_are_picked_up_by_its_successor(client, headers):
+    habit_id = create(client, headers, "read")
+    client.delete("/habit/delete", json=HABIT, headers=headers)
+    redis = get_redis()
+    redis.lmove(JOBS_KEY, PROCESSING_PREFIX + "web.1", "RIGHT", "LEFT")  # Taken, then the worker died
+
+    work(name="worker.1", once=True)  # Another worker leaves it alone
+    assert stored(habit_id)[0] > 0
+    assert redis.llen(PROCESSING_PREFIX + "web.1") == 1
+
+    work(name="web.1", once=True)  # The restarted worker requeues it first
+    assert stored(habit_id) == (0, 0, 0)
+    assert queued("web.1") == []
+
+
+def test_a_failed_job_is_requeued(client, headers, monkeypatch):
+    habit_id = create(client, headers, "read")
+    client.delete("/habit/delete", json=HABIT, headers=headers)
+    run_job, calls = habit_cascade.run_job, []
+
+    def failing_once(job):
+        calls.append(job)
+        if len(calls) == 1:
+            raise ConnectionError("mongod went away")
+        return run_job(job)
+
+    monkeypatch.setattr(habit_cascade, "run_job", failing_once)
+    work(name="test", once=True, wait=0)
+    assert len(calls) == 2
+    assert stored(habit_id) == (0, 0, 0)
+    assert queued() == []
+
+
+def test_sweep_reclaims_what_was_never_queued(client, headers, monkeypatch):
+    def unreachable(*args, **kwargs):
+        raise ConnectionError("redis went away")
+
+    orphans = [create(client, headers, name) for name in ("read", "run", "swim")]
+    kept = create(client, headers, "write")
+    monkeypatch.setattr(habit_cascade, "get_redis", unreachable)
+    for name in ("read", "run", "swim"):
+        assert client.delete("/habit/delete", json={"habit_name": name}, headers=headers).status_code == 200
+    monkeypatch.undo()
+    assert queued() == []
+    Habit_Rollup.habit_rollups.insert_one({"habit_id": orphans[0], "current_streak": 1})  # Folded after the delete
+    logs = sum(stored(habit_id)[0] for habit_id in orphans)
+    kept_before = stored(kept)
+
+    report = sweep_orphans(dry_run=True, chunk=2)
+    assert report == {"habits": 3, "logs": logs, "buckets": 0, "rollups": 1}
+    assert sum(stored(habit_id)[0] for habit_id in orphans) == logs
+
+    assert sweep_orphans(chunk=2) == report
+    assert [stored(habit_id) for habit_id in orphans] == [(0, 0, 0)] * 3
+    assert stored(kept) == kept_before
+    assert sweep_orphans() == {"habits": 0, "logs": 0, "buckets": 0, "rollups": 0}
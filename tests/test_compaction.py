@@ -0,0 +1,68 @@
+"""
+Compacting old logs into yearly buckets changes how they are stored, not what
+any endpoint answers: history, streak, statistics, heatmap and export read the
+same before and after, and rollups rebuilt from the buckets match.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import Habit, Habit_Log, Habit_Log_Bucket
+from v1.core.habit import habit_cache
+from v1.core.habit.habit_buckets import compact_all
+from v1.core.habit.habit_rollup import rebuild_all
+
+from conftest import HABIT
+
+
+@pytest.fixture
+def logged(headers, monkeypatch):
+    """ Two years of logs with gaps (a 41-day streak running up to yesterday), stored before rollups existed. """
+    monkeypatch.setattr(habit_cache, "CACHE_MAX_ENTRIES", 0)  # Every read is computed
+    habit_id = Habit.habits.find_one({"username": "alice", **HABIT})["habit_id"]
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    days = [day for day in range(41, 730) if day % 5 and day % 7] + list(range(1, 41))
+    logs = [Habit_Log("alice", "read", habit_id, "done", today - timedelta(days=day, hours=-8)) for day in days]
+    logs += [Habit_Log("alice", "read", habit_id, "skipped", today - timedelta(days=day, hours=-9)) for day in range(45, 730, 35)]
+    Habit_Log.habit_logs.insert_many([log.to_document() for log in logs])
+    rebuild_all()
+    return habit_id
+
+
+def answers(client, headers):
+    """ What the read endpoints answer for HABIT (history without the raw logs' _id, which buckets don't keep). """
+    history = client.get("/habit/log", json={
+        **HABIT, "format": "ndjson", "fields": ["username", "habit_name", "habit_id", "timestamp", "log"],
+    }, headers=headers)
+    export = client.get("/habit/export?format=jsonl", headers=headers)
+    return {
+        "history": [json.loads(line) for line in history.get_data(as_text=True).splitlines()],
+        "streak": client.get("/habit/streak", json=HABIT, headers=headers).get_json(),
+        "stats": client.get("/habit/stats", json=HABIT, headers=headers).get_json(),
+        "heatmap": client.get("/habit/heatmap", json={**HABIT, "start": "2000-01-01"}, headers=headers).get_json(),
+        "export": [json.loads(line) for line in export.get_data(as_text=True).splitlines()],
+    }
+
+
+def test_compaction_changes_no_answer(client, headers, logged):
+    before = answers(client, headers)
+    assert before["streak"]["current_streak"] == 41
+
+    report = compact_all(older_than=timedelta(days=100), pause=0)
+    assert report["logs"] > 400
+    assert Habit_Log_Bucket.habit_log_buckets.count_documents({"habit_id": logged}) in (2, 3)
+    assert Habit_Log.habit_logs.count_documents({"habit_id": logged, "log": "done", "timestamp": {
+        "$lt": datetime.utcnow() - timedelta(days=100)
+    }}) == 0
+
+    assert answers(client, headers) == before
+    rebuild_all()  # Recomputed from the buckets and the remaining raw logs
+    assert answers(client, headers) == before
+
+
+def test_compacting_twice_changes_nothing(client, headers, logged):
+    compact_all(older_than=timedelta(days=100), pause=0)
+    before = answers(client, headers)
+    assert compact_all(older_than=timedelta(days=100), pause=0) == {"habits": 0, "logs": 0}
+    assert answers(client, headers) == before
@@ -0,0 +1,113 @@
+"""
+GET /stream: events published on the user's channel reach their open streams
+through the process' EventHub; streams beyond SSE_MAX_SUBSCRIBERS are refused,
+a stream that fell behind is told to resync, and a closed stream unsubscribes.
+"""
+import json
+import time
+
+import pytest
+from flask_sse import Message
+
+from database import get_redis
+from v1.core.events.event_stream import HabitEventStream, publish_event, sse, user_channel
+
+HEARTBEAT = ": keepalive\n\n"
+
+
+@pytest.fixture
+def stream(client, auth, monkeypatch):
+    """
+    Open an event stream of a freshly registered user. Streams aren't buffered;
+    they share this thread's request context stack, so they are closed last opened first.
+    """
+    monkeypatch.setattr(sse, "heartbeat", 0.05)
+    assert HabitEventStream.hub.count() == 0
+    opened = []
+
+    def open_stream(username="alice"):
+        token = auth(username)["Authorization"].split()[1]
+        response = client.get(f"/stream?jwt={token}", buffered=False)
+        opened.append(response)
+        return response
+
+    yield open_stream
+    for response in reversed(opened):
+        response.close()
+
+
+def read(response, until):
+    """ Chunks of a stream up to (and including) the first one for which `until` is true. """
+    chunks = []
+    for chunk in response.response:
+        chunks.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+        if until(chunks[-1]):
+            return chunks
+    raise AssertionError(f"stream ended after {chunks}")
+
+
+def event(chunk):
+    """ (type, data) of an SSE event chunk """
+    lines = dict(line.split(":", 1) for line in chunk.strip().split("\n"))
+    return lines["event"], json.loads(lines["data"])
+
+
+def subscribed(response):
+    """ Read a stream until its subscription exists (the first heartbeat is sent from it). """
+    return read(response, lambda chunk: chunk == HEARTBEAT)
+
+
+def test_published_events_reach_the_users_stream(stream):
+    response = stream()
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert subscribed(response)[0] == "retry:5000\n\n"
+
+    deadline = time.monotonic() + 5
+    while not get_redis().pubsub_numpat() and time.monotonic() < deadline:
+        time.sleep(0.01)  # The hub's listener subscribes in the background
+    publish_event("bob", "log-accepted", {"habit_name": "run"})  # Someone else's
+    publish_event("alice", "log-accepted", {"habit_name": "read"})
+    chunks = read(response, lambda chunk: chunk.startswith("event:"))
+    assert event(chunks[-1]) == ("log-accepted", {"habit_name": "read"})
+    assert all(chunk == HEARTBEAT for chunk in chunks[:-1])
+
+
+def test_streams_beyond_the_limit_are_refused(stream, monkeypatch):
+    monkeypatch.setattr(sse, "max_subscribers", 2)
+    subscribed(stream("alice"))
+    subscribed(stream("bob"))
+    assert HabitEventStream.hub.count() == 2
+
+    response = stream("carol")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    assert HabitEventStream.hub.count() == 2
+
+
+def test_a_stream_that_fell_behind_is_told_to_resync(stream, monkeypatch):
+    monkeypatch.setattr(HabitEventStream.hub, "queue_size", 2)
+    response = stream()
+    subscribed(response)
+    for number in range(5):  # Faster than the stream is read
+        HabitEventStream.hub.dispatch(user_channel("alice"), Message({"number": number}, type="log-accepted"))
+
+    events = [event(chunk) for chunk in read(response, lambda chunk: chunk == HEARTBEAT) if chunk != HEARTBEAT]
+    assert events == [
+        ("resync", {"reason": "events were dropped"}),
+        ("log-accepted", {"number": 0}),  # What the queue held
+        ("log-accepted", {"number": 1}),
+    ]
+
+
+def test_a_closed_stream_unsubscribes(stream):
+    first, second = stream("alice"), stream("alice")
+    subscribed(first)
+    subscribed(second)
+    assert HabitEventStream.hub.count() == 2
+
+    second.close()  # The client went away: the server closes the response
+    assert HabitEventStream.hub.count() == 1
+    first.close()
+    assert HabitEventStream.hub.count() == 0
+    HabitEventStream.hub.dispatch(user_channel("alice"), Message({"number": 0}, type="log-accepted"))  # Nobody to tell
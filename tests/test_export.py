@@ -0,0 +1,75 @@
+"""
+Incremental exports select logs by when they were stored, so logs posted with
+past timestamps (offline batches) after a checkpoint are in the next export.
+"""
+import json
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from database import Habit, Habit_Log
+from v1.core.habit.habit_export import export_rows
+
+from conftest import HABIT
+
+
+def test_logs_with_past_timestamps_are_in_the_next_export(app, client, auth):
+    headers = auth()
+    client.post("/habit/create", json={**HABIT, "frequency": "daily"}, headers=headers)
+    habit_id = Habit.habits.find_one({"username": "alice", **HABIT})["habit_id"]
+    now = datetime.utcnow().replace(microsecond=0)
+    Habit_Log.habit_logs.insert_one({
+        **Habit_Log("alice", "read", habit_id, "done", now - timedelta(days=3)).to_document(),
+        "_id": ObjectId.from_datetime(now - timedelta(minutes=10)),  # Stored before the first export
+    })
+
+    response = client.get("/habit/export?format=jsonl", headers=headers)
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row["timestamp"][:10] for row in rows if row["type"] == "log"] == [str((now - timedelta(days=3)).date())]
+    checkpoint = datetime.fromisoformat(response.headers["X-Export-Checkpoint"])
+    assert checkpoint <= now
+
+    # Replayed by an offline client after the export, timestamped days before the checkpoint
+    replayed = now - timedelta(days=2)
+    result = client.post("/habit/log/batch", json={"logs": [{**HABIT, "timestamp": replayed.isoformat()}]}, headers=headers)
+    assert result.get_json()["results"][0]["status"] == 201
+
+    with app.app_context():
+        rows = list(export_rows("alice", checkpoint, datetime.utcnow() + timedelta(seconds=1)))
+    assert [row["timestamp"] for row in rows if row["type"] == "log"] == [replayed]
+
+
+def test_compacted_logs_stored_after_the_checkpoint_are_exported(app, client, auth):
+    from v1.core.habit.habit_buckets import compact_all
+
+    headers = auth()
+    client.post("/habit/create", json={**HABIT, "frequency": "daily"}, headers=headers)
+    habit_id = Habit.habits.find_one({"username": "alice", **HABIT})["habit_id"]
+    checkpoint = datetime.utcnow().replace(microsecond=0) - timedelta(minutes=1)
+    old = datetime(2020, 3, 1)
+    Habit_Log.habit_logs.insert_one(Habit_Log("alice", "read", habit_id, "done", old).to_document())
+    compact_all(pause=0)
+
+    with app.app_context():
+        rows = list(export_rows("alice", checkpoint, datetime.utcnow() + timedelta(seconds=1)))
+    assert [row["timestamp"] for row in rows if row["type"] == "log"] == [old]
+
+
+def test_compacted_logs_stored_after_the_export_wait_for_the_next(app, client, auth):
+    from v1.core.habit.habit_buckets import compact_all
+
+    headers = auth()
+    client.post("/habit/create", json={**HABIT, "frequency": "daily"}, headers=headers)
+    habit_id = Habit.habits.find_one({"username": "alice", **HABIT})["habit_id"]
+    old = datetime(2020, 3, 1)
+    Habit_Log.habit_logs.insert_one(Habit_Log("alice", "read", habit_id, "done", old).to_document())
+    compact_all(pause=0)
+
+    response = client.get("/habit/export?format=jsonl", headers=headers)
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row for row in rows if row["type"] == "log"] == []  # Stored within the checkpoint lag, like raw logs
+    checkpoint = datetime.fromisoformat(response.headers["X-Export-Checkpoint"])
+
+    with app.app_context():
+        rows = list(export_rows("alice", checkpoint, datetime.utcnow() + timedelta(seconds=1)))
+    assert [row["timestamp"] for row in rows if row["type"] == "log"] == [old]
@@ -0,0 +1,72 @@
+"""
+The gevent worker path, in a monkey-patched subprocess against a real Redis
+server (redislite): a blocking Redis pool shared by many greenlets, and
+password hashing on gevent's native thread pool without stalling the hub.
+Skipped without gevent or redislite.
+"""
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+gevent = pytest.importorskip("gevent")
+redislite = pytest.importorskip("redislite")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = textwrap.dedent("""
+    from gevent import monkey
+    monkey.patch_all()
+
+    import gevent
+    import redis
+    from gevent.threadpool import ThreadPoolExecutor
+    from database.client import cooperative, get_redis
+    from database.password_hasher import password_hasher
+
+    assert cooperative()
+    client = get_redis()
+    assert isinstance(client.connection_pool, redis.BlockingConnectionPool)
+
+    # 200 greenlets on a pool of 5 connections wait for one instead of failing
+    def roundtrip(number):
+        client.set(f"gevent:{number}", number)
+        return client.get(f"gevent:{number}")
+    jobs = [gevent.spawn(roundtrip, number) for number in range(200)]
+    gevent.joinall(jobs, raise_error=True)
+    assert [job.value for job in jobs] == [str(number) for number in range(200)]
+
+    # Hashing runs on native threads: other greenlets keep running meanwhile
+    ticks = []
+    def tick():
+        while True:
+            ticks.append(1)
+            gevent.sleep(0.001)
+    ticker = gevent.spawn(tick)
+    hashed = password_hasher.hash("password123")
+    ticker.kill()
+    assert isinstance(password_hasher._executor, ThreadPoolExecutor)
+    assert password_hasher.verify(hashed, "password123")
+    assert len(ticks) > 10, len(ticks)
+    print("ok")
+""")
+
+
+def test_gevent_worker_path(tmp_path):
+    server = redislite.Redis(str(tmp_path / "redis.db"))
+    env = {
+        **os.environ,
+        "PYTHONPATH": ROOT,
+        "REDIS_URL": f"unix://{server.socket_file}",
+        "REDIS_MAX_CONNECTIONS": "5",
+        "PASSWORD_HASH_WORKERS": "2",
+        "PASSWORD_HASH_ITERATIONS": "300000",
+    }
+    try:
+        result = subprocess.run([sys.executable, "-c", SCRIPT], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60)
+    finally:
+        server.shutdown()
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "ok"
@@ -0,0 +1,131 @@
+"""
+GET /habit/heatmap: the bit-packed and run-length encoded grids decode to the
+days, ISO weeks and months holding a 'done' log, raw or compacted, counted here
+in plain Python; ranges beyond MAX_HEATMAP_PERIODS are refused.
+"""
+import base64
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from database import Habit, Habit_Log
+from v1.core.habit.habit_buckets import compact_all
+from v1.core.habit.habit_heatmap import MAX_HEATMAP_PERIODS
+
+from conftest import HABIT
+
+START, END = datetime(2023, 11, 15), datetime(2025, 2, 10)
+
+
+@pytest.fixture
+def done(headers):
+    """ Timestamps of 'done' logs in and around [START, END), those before 2024 compacted, plus 'skipped' ones. """
+    habit_id = Habit.habits.find_one({"username": "alice", **HABIT})["habit_id"]
+    timestamps = [START - timedelta(days=3, hours=-5), END + timedelta(hours=2), END - timedelta(seconds=1)]
+    timestamps += [START + timedelta(days=day, hours=day % 24) for day in range(0, 450) if day % 3 == 0 or day % 11 == 0]
+    logs = [Habit_Log("alice", "read", habit_id, "done", timestamp) for timestamp in timestamps]
+    logs += [Habit_Log("alice", "read", habit_id, "skipped", START + timedelta(days=day)) for day in range(1, 450, 3)]
+    Habit_Log.habit_logs.insert_many([log.to_document() for log in logs])
+    compact_all(older_than=datetime.utcnow() - datetime(2024, 1, 1), pause=0)
+    assert Habit_Log.habit_logs.count_documents({"log": "done", "timestamp": {"$lt": datetime(2024, 1, 1)}}) == 0
+    return timestamps
+
+
+def bucket_of(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day + timedelta(days=7)
+    if bucket == "month":
+        return (day + timedelta(days=31)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def expected_grid(timestamps, bucket):
+    """ (first bucket, one bool per bucket of [START, END)) """
+    first, last = bucket_of(START.date(), bucket), bucket_of((END - timedelta(microseconds=1)).date(), bucket)
+    completed = {bucket_of(timestamp.date(), bucket) for timestamp in timestamps if START <= timestamp < END}
+    grid, current = [], first
+    while current <= last:
+        grid.append(current in completed)
+        current = next_bucket(current, bucket)
+    return first, grid
+
+
+def decode_bits(data: str, periods: int):
+    packed = base64.b64decode(data)
+    assert len(packed) == -(-periods // 8)
+    bits = [bool(byte >> (7 - shift) & 1) for byte in packed for shift in range(8)]
+    assert not any(bits[periods:])  # Padding
+    return bits[:periods]
+
+
+def decode_rle(runs):
+    grid = []
+    for index, length in enumerate(runs):
+        assert length > 0 or index == 0
+        grid += [index % 2 == 1] * length
+    return grid
+
+
+@pytest.mark.parametrize("bucket", ["day", "week", "month"])
+@pytest.mark.parametrize("encoding", ["bits", "rle"])
+def test_grid_decodes_to_the_logged_buckets(client, headers, done, bucket, encoding):
+    response = client.get("/habit/heatmap", json={
+        **HABIT, "bucket": bucket, "encoding": encoding, "start": START.isoformat(), "end": END.isoformat(),
+    }, headers=headers)
+    assert response.status_code == 200
+    body = response.get_json()
+    first, grid = expected_grid(done, bucket)
+
+    assert (body["bucket"], body["encoding"]) == (bucket, encoding)
+    assert body["start"] == first.isoformat()
+    assert body["periods"] == len(grid)
+    assert body["completed"] == sum(grid)
+    decoded = decode_bits(body["data"], body["periods"]) if encoding == "bits" else decode_rle(body["data"])
+    assert decoded == grid
+
+
+def test_weeks_start_on_monday(client, headers, done):
+    # 2023-11-15 is a Wednesday: its week started on Monday 2023-11-13
+    body = client.get("/habit/heatmap", json={
+        **HABIT, "bucket": "week", "start": START.isoformat(), "end": (START + timedelta(days=5)).isoformat(),
+    }, headers=headers).get_json()
+    assert (body["start"], body["periods"]) == ("2023-11-13", 1)
+
+
+@pytest.mark.parametrize("bucket", ["day", "week", "month"])
+def test_ranges_are_capped(client, headers, bucket):
+    start = datetime(1900, 1, 1)  # A Monday
+    years, months = divmod(MAX_HEATMAP_PERIODS, 12)
+    end = {  # The start of the bucket after the last one allowed
+        "day": start + timedelta(days=MAX_HEATMAP_PERIODS),
+        "week": start + timedelta(weeks=MAX_HEATMAP_PERIODS),
+        "month": datetime(start.year + years, 1 + months, 1),
+    }[bucket]
+    request = {**HABIT, "bucket": bucket, "start": start.isoformat()}
+
+    response = client.get("/habit/heatmap", json={**request, "end": end.isoformat()}, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()["periods"] == MAX_HEATMAP_PERIODS
+
+    response = client.get("/habit/heatmap", json={**request, "end": (end + timedelta(days=1)).isoformat()}, headers=headers)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("params", [
+    {"start": [1]},
+    {"end": "soon"},
+    {"start": "2025-01-02", "end": "2025-01-01"},
+    {"bucket": "year"},
+    {"encoding": "png"},
+])
+def test_malformed_parameters_are_refused(client, headers, params):
+    response = client.get("/habit/heatmap", json={**HABIT, **params}, headers=headers)
+    assert response.status_code == 400
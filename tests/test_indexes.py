@@ -0,0 +1,100 @@
+"""
+`flask db sync-indexes` creates the declared indexes, and `flask db audit-queries`
+flags every query shape whose winning plan scans a collection or sorts in
+memory. Plans are read from synthetic explain outputs; the audit of the real
+plans runs on a throwaway replica set, skipped without mongod on PATH.
+"""
+import os
+import shutil
+import sys
+
+import pytest
+
+from database import indexes
+from database.indexes import INDEXES, audit_queries, plan_issues, query_shapes, sync_indexes
+
+IXSCAN = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "keyPattern": {"habit_id": 1, "timestamp": 1}}}
+COLLSCAN = {"stage": "COLLSCAN", "direction": "forward"}
+SORTED_IN_MEMORY = {"stage": "SORT", "sortPattern": {"timestamp": 1}, "inputStage": IXSCAN}
+
+
+def find_explain(winning, rejected=()):
+    return {"queryPlanner": {"winningPlan": winning, "rejectedPlans": list(rejected)}, "ok": 1.0}
+
+
+@pytest.mark.parametrize("explain, issues", [
+    (find_explain(IXSCAN), []),
+    (find_explain(COLLSCAN), ["collection scan"]),
+    (find_explain(SORTED_IN_MEMORY), ["in-memory sort"]),
+    (find_explain({"stage": "SORT", "inputStage": COLLSCAN}), ["in-memory sort", "collection scan"]),
+    (find_explain(IXSCAN, rejected=[COLLSCAN, SORTED_IN_MEMORY]), []),  # Only the winning plan runs
+    # Slot-based engine: the classic tree is under queryPlan
+    (find_explain({"queryPlan": COLLSCAN, "slotBasedPlan": {"stages": "..."}}), ["collection scan"]),
+    # Aggregation: one planner output per $cursor / $unionWith sub-pipeline
+    ({"stages": [
+        {"$cursor": find_explain(IXSCAN)},
+        {"$unionWith": {"coll": "habit_log_buckets", "pipeline": [{"$cursor": find_explain(COLLSCAN)}]}},
+        {"$group": {}},
+    ]}, ["collection scan"]),
+    # Sharded: one winning plan per shard
+    ({"queryPlanner": {"winningPlan": {"stage": "SINGLE_SHARD", "shards": [
+        {"shardName": "a", "winningPlan": IXSCAN, "rejectedPlans": [COLLSCAN]},
+        {"shardName": "b", "winningPlan": SORTED_IN_MEMORY, "rejectedPlans": []},
+    ]}}}, ["in-memory sort"]),
+], ids=["index", "collection scan", "sort", "sorted scan", "rejected", "sbe", "aggregation", "sharded"])
+def test_flagged_stages_of_the_winning_plans(explain, issues):
+    assert plan_issues(explain) == issues
+
+
+def test_audit_command_fails_on_flagged_shapes(app, monkeypatch):
+    flagged = {"log history page", "dashboard"}
+    monkeypatch.setattr(indexes, "explain_shape", lambda shape, db=None: find_explain(
+        SORTED_IN_MEMORY if shape["name"] in flagged else IXSCAN
+    ))
+    result = app.test_cli_runner().invoke(args=["db", "audit-queries"])
+    assert result.exit_code == 1
+    lines = result.output.splitlines()
+    assert len(lines) == len(query_shapes())
+    assert sorted(line for line in lines if line.startswith("FLAG")) == [
+        "FLAG habit_logs: log history page (in-memory sort)",
+        "FLAG habits: dashboard (in-memory sort)",
+    ]
+
+    monkeypatch.setattr(indexes, "explain_shape", lambda shape, db=None: find_explain(IXSCAN))
+    result = app.test_cli_runner().invoke(args=["db", "audit-queries"])
+    assert result.exit_code == 0
+    assert all(line.startswith("ok") for line in result.output.splitlines())
+
+
+def test_sync_creates_the_missing_indexes_only(app):
+    from database import get_db
+
+    db = get_db()
+    assert all(changes["created"] == [] for changes in sync_indexes().values())  # The app fixture synced them
+    db["habit_logs"].drop_index("habit_id_1_timestamp_1")
+    db["habit_logs"].create_index([("log", 1)])
+
+    assert sync_indexes()["habit_logs"] == {"created": ["habit_id_1_timestamp_1"], "dropped": []}
+    assert sync_indexes(drop_extra=True)["habit_logs"] == {"created": [], "dropped": ["log_1"]}
+    for collection, models in INDEXES.items():
+        assert set(db[collection].index_information()) == {"_id_"} | {model.document["name"] for model in models}
+
+
+@pytest.mark.skipif(not shutil.which("mongod"), reason="needs mongod on PATH")
+def test_every_query_shape_uses_an_index():
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+    import harness
+    import pymongo
+
+    try:
+        uri = harness.start_replica_set(ports=(27417, 27418, 27419), name="habitforge-audit-rs")
+    except SystemExit as e:
+        pytest.fail(str(e))
+    db = pymongo.MongoClient(uri)["habitforge_audit"]
+    sync_indexes(db)
+    db["habits"].insert_one({"username": "alice", "habit_name": "read", "habit_id": "h1", "frequency": "weekly"})
+
+    assert [result for result in audit_queries(db) if result["issues"]] == []
+    db["habit_logs"].drop_index("habit_id_1_timestamp_1")
+    flagged = {result["name"] for result in audit_queries(db) if result["issues"]}
+    assert "log history page" in flagged
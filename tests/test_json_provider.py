@@ -0,0 +1,44 @@
+"""
+The orjson provider answers like Flask's default one: sorted keys, BSON types,
+ensure_ascii, and jsonify's positional / keyword arguments.
+"""
+import json
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from flask import jsonify
+
+DOCUMENT = {"habit_name": "lire 📚 à l'aube", "b": 1, "a": [ObjectId("0123456789abcdef01234567"), datetime(2025, 1, 31, 8)]}
+EXPECTED = {"a": ["0123456789abcdef01234567", "2025-01-31T08:00:00"], "b": 1, "habit_name": "lire 📚 à l'aube"}
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_dumps_matches_the_standard_library(app, ensure_ascii):
+    app.json.ensure_ascii = ensure_ascii
+    assert app.json.dumps(DOCUMENT) == json.dumps(EXPECTED, sort_keys=True, ensure_ascii=ensure_ascii, separators=(",", ":"))
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_response_body(app, ensure_ascii):
+    app.json.ensure_ascii = ensure_ascii
+    with app.app_context():
+        body = jsonify(DOCUMENT).get_data(as_text=True)
+    assert body == json.dumps(EXPECTED, sort_keys=True, ensure_ascii=ensure_ascii, separators=(",", ":")) + "\n"
+    assert body.isascii() == ensure_ascii
+
+
+@pytest.mark.parametrize("args, kwargs, expected", [
+    ((), {}, None),
+    ((1,), {}, 1),
+    ((1, 2), {}, [1, 2]),
+    ((), {"a": 1}, {"a": 1}),
+])
+def test_response_arguments(app, args, kwargs, expected):
+    with app.app_context():
+        assert jsonify(*args, **kwargs).get_json() == expected
+
+
+def test_response_rejects_args_and_kwargs(app):
+    with app.app_context(), pytest.raises(TypeError):
+        jsonify(1, a=1)
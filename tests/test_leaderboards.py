@@ -0,0 +1,39 @@
+"""
+Leaderboards: anonymous streak boards, and habits logged before the boards
+existed counted from their real first period.
+"""
+from datetime import datetime, timedelta
+
+from database import Habit, Habit_Log
+
+from conftest import HABIT
+
+
+def test_streak_board_only_names_your_own_habits(client, auth):
+    for username in ("bob", "alice"):
+        headers = auth(username)
+        client.post("/habit/create", json={**HABIT, "frequency": "daily"}, headers=headers)
+        client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers)
+
+    leaders = client.get("/leaderboard/streaks?frequency=daily", headers=headers).get_json()["leaders"]
+    assert sorted(entry["rank"] for entry in leaders) == [1, 2]
+    assert [entry for entry in leaders if entry.get("yours")] == [
+        {"rank": entry["rank"], "streak": 1, "habit_name": "read", "yours": True} for entry in leaders if entry.get("yours")
+    ]
+    assert [set(entry) for entry in leaders if not entry.get("yours")] == [{"rank", "streak"}]
+
+
+def test_legacy_habit_counts_from_its_first_log(client, auth):
+    headers = auth()
+    client.post("/habit/create", json={**HABIT, "frequency": "daily"}, headers=headers)
+    habit_id = Habit.habits.find_one({"username": "alice", **HABIT})["habit_id"]
+    yesterday = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    Habit_Log.habit_logs.insert_many([
+        Habit_Log("alice", "read", habit_id, "done", yesterday - timedelta(days=day)).to_document() for day in range(100)
+    ])
+
+    assert client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers).status_code == 201
+    adherence = client.get("/leaderboard/adherence?habit_name=read&frequency=daily", headers=headers).get_json()
+    assert adherence["habits"] == 1
+    assert adherence["completed"] == 101
+    assert adherence["total_periods"] == 101
@@ -0,0 +1,29 @@
+"""
+POST /habit/log/batch: malformed entries get their own 4xx result, the rest of the batch goes through.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import HABIT
+
+
+@pytest.mark.parametrize("entry, status", [
+    ({**HABIT, "log": 1}, 400),
+    ({**HABIT, "log": ["done"]}, 400),
+    ({**HABIT, "timestamp": "yesterday"}, 400),
+    ({**HABIT, "timestamp": (datetime.utcnow() + timedelta(days=1)).isoformat()}, 400),
+    ({**HABIT, "log": "skipped"}, 409),
+    ({"habit_name": ["read"]}, 404),
+    ({"habit_name": "write"}, 404),
+])
+def test_invalid_entries_are_rejected_one_by_one(client, headers, entry, status):
+    yesterday = (datetime.utcnow() - timedelta(days=2)).isoformat()
+    response = client.post("/habit/log/batch", json={"logs": [entry, {**HABIT, "timestamp": yesterday}]}, headers=headers)
+    assert response.status_code == 200
+    assert [result["status"] for result in response.get_json()["results"]] == [status, 201]
+
+
+def test_single_log_must_be_a_string(client, headers):
+    response = client.post("/habit/log", json={**HABIT, "log": 1}, headers=headers)
+    assert response.status_code == 400
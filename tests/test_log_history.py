@@ -0,0 +1,97 @@
+"""
+GET /habit/log: pages follow X-Next-After across raw logs and compacted buckets,
+`fields` projects the documents, format=ndjson streams the whole history, and
+malformed parameters are refused with 400.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import Habit, Habit_Log
+from v1.core.habit.habit_buckets import compact_all
+
+from conftest import HABIT
+
+OLD = datetime(2020, 12, 28, 7)  # Compacted into the 2020 and 2021 buckets
+
+
+@pytest.fixture
+def history(headers):
+    """ 'done' logs around a new year, compacted, plus raw 'skipped' ones between them and a week of recent logs. """
+    habit_id = Habit.habits.find_one({"username": "alice", **HABIT})["habit_id"]
+    now = datetime.utcnow().replace(microsecond=0)
+    logs = [Habit_Log("alice", "read", habit_id, "done", OLD + timedelta(days=day)) for day in range(8)]
+    logs += [Habit_Log("alice", "read", habit_id, "skipped", OLD + timedelta(days=day, hours=1)) for day in range(0, 8, 3)]
+    logs += [Habit_Log("alice", "read", habit_id, "done", now - timedelta(days=day)) for day in range(1, 8)]
+    Habit_Log.habit_logs.insert_many([log.to_document() for log in logs])
+    assert compact_all(pause=0) == {"habits": 1, "logs": 8}
+    return sorted(log.timestamp for log in logs)
+
+
+def timestamps(logs):
+    return [datetime.fromisoformat(log["timestamp"]) for log in logs]
+
+
+@pytest.mark.parametrize("limit", [1, 4, 7, 100])
+def test_pages_cover_the_history_once(client, headers, history, limit):
+    received, after, pages = [], None, 0
+    while True:
+        response = client.get("/habit/log", json={**HABIT, "limit": limit, "after": after}, headers=headers)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert 0 < len(page) <= limit
+        received += timestamps(page)
+        pages += 1
+        after = response.headers.get("X-Next-After")
+        if after is None:
+            break
+        assert datetime.fromisoformat(after) == received[-1]
+
+    assert received == history
+    assert pages == -(-len(history) // limit)
+
+
+def test_fields_project_the_logs(client, headers, history):
+    default = client.get("/habit/log", json=HABIT, headers=headers).get_json()
+    raw = [log for log in default if "_id" in log]
+    assert raw and {key for log in raw for key in log} == {"_id", "username", "habit_name", "habit_id", "timestamp", "log"}
+    assert not any("period" in log or "pending" in log for log in default)
+
+    only_timestamps = client.get("/habit/log", json={**HABIT, "fields": ["timestamp"]}, headers=headers).get_json()
+    assert [set(log) for log in only_timestamps] == [{"timestamp"}] * len(history)
+
+    ids = client.get("/habit/log", json={**HABIT, "fields": ["_id", "log"]}, headers=headers).get_json()
+    assert {log["log"] for log in ids} == {"done", "skipped"}
+    assert all(set(log) == {"_id", "log", "timestamp"} for log in ids if log["log"] == "skipped")
+    assert all(set(log) <= {"_id", "log", "timestamp"} for log in ids)
+
+
+def test_ndjson_streams_the_whole_history(client, headers, history):
+    response = client.get("/habit/log", json={**HABIT, "format": "ndjson", "limit": 2}, headers=headers)
+    assert response.mimetype == "application/x-ndjson"
+    assert "X-Next-After" not in response.headers
+    lines = response.get_data(as_text=True).splitlines()
+    assert timestamps(json.loads(line) for line in lines) == history
+
+    after = history[3].isoformat()
+    response = client.get("/habit/log", json={**HABIT, "format": "ndjson", "after": after, "fields": ["timestamp"]}, headers=headers)
+    assert [json.loads(line) for line in response.get_data(as_text=True).splitlines()] == [
+        {"timestamp": timestamp.isoformat()} for timestamp in history[4:]
+    ]
+
+
+@pytest.mark.parametrize("params", [
+    {"limit": [1]},
+    {"limit": {"n": 1}},
+    {"limit": "x"},
+    {"after": [1]},
+    {"after": "yesterday"},
+    {"fields": "timestamp"},
+    {"fields": [["timestamp"]]},
+    {"fields": [{"timestamp": 1}]},
+    {"fields": ["period"]},
+])
+def test_malformed_parameters_are_refused(client, headers, params):
+    response = client.get("/habit/log", json={**HABIT, **params}, headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,34 @@
+"""
+/metrics sums the snapshots of every worker of the server.
+"""
+import json
+import os
+
+from v1.core.metrics import metrics
+
+
+def requests_total(body, endpoint):
+    for line in body.splitlines():
+        if line.startswith(f'habitforge_http_requests_total{{endpoint="{endpoint}",method="GET",status="200"}}'):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_metrics_are_summed_over_workers(client, tmp_path, monkeypatch):
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+    metrics.reset()
+    client.get("/health")
+    client.get("/health")
+    other_worker = {"habitforge_http_requests_total": [[["health", "GET", "200"], 5]]}
+    (tmp_path / "1.json").write_text(json.dumps(other_worker))
+
+    body = client.get("/metrics").get_data(as_text=True)
+    assert requests_total(body, "health") == 7
+    assert {path.name for path in tmp_path.iterdir()} == {"1.json", f"{os.getpid()}.json"}
+
+
+def test_metrics_of_this_process_without_a_directory(client, monkeypatch):
+    monkeypatch.delenv("METRICS_DIR", raising=False)
+    metrics.reset()
+    client.get("/health")
+    assert requests_total(client.get("/metrics").get_data(as_text=True), "health") == 1
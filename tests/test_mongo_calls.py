@@ -0,0 +1,53 @@
+"""
+Mongo commands per request (X-Mongo-Calls): each endpoint stays at its minimum,
+the habit is loaded once per request however many layers need it.
+"""
+import pytest
+
+from conftest import HABIT
+
+
+def mongo_calls(response):
+    return int(response.headers["X-Mongo-Calls"])
+
+
+@pytest.mark.parametrize("method, path, body, calls", [
+    ("get", "/habit/status", HABIT, 1),  # habit
+    ("get", "/habit/frequency", HABIT, 1),  # habit
+    ("get", "/habit/details", HABIT, 2),  # habit, public fields
+    ("get", "/habit/streak", HABIT, 2),  # habit, rollup
+    ("get", "/habit/all", None, 2),  # versions, public fields
+    ("get", "/habit/dashboard", None, 1),  # one aggregation
+    ("put", "/habit/status", {**HABIT, "status": "active"}, 2),  # habit, update
+])
+def test_endpoint_mongo_calls(client, headers, method, path, body, calls):
+    response = getattr(client, method)(path, json=body or {}, headers=headers)
+    assert response.status_code == 200
+    assert mongo_calls(response) == calls
+
+
+def test_post_log_mongo_calls(client, headers):
+    response = client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers)
+    assert response.status_code == 201
+    assert mongo_calls(response) == 2  # habit, log insert (the rollup is folded once the response was sent)
+
+    response = client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers)
+    assert response.status_code == 409
+    assert mongo_calls(response) == 2  # habit, log insert rejected by the period key
+
+
+def test_statistics_reads_the_habit_once(client, headers):
+    client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers)
+    response = client.get("/habit/stats", json=HABIT, headers=headers)
+    assert response.status_code == 200
+    assert mongo_calls(response) == 2  # habit, rollup
+
+
+def test_cached_response_needs_only_the_habit(client, headers):
+    first = client.get("/habit/streak", json=HABIT, headers=headers)
+    cached = client.get("/habit/streak", json=HABIT, headers=headers)
+    revalidated = client.get("/habit/streak", json=HABIT, headers={**headers, "If-None-Match": first.headers["ETag"]})
+    assert cached.get_json() == first.get_json()
+    assert mongo_calls(cached) == 1
+    assert revalidated.status_code == 304
+    assert mongo_calls(revalidated) == 1
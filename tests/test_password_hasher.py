@@ -0,0 +1,96 @@
+"""
+Password hashing runs in a bounded pool: once `queue_depth` hashes are in flight,
+or one runs past `timeout`, register and login are shed with 503 instead of
+queueing. The pool is a thread pool here (the process pool's workers would
+need the forkserver); the bookkeeping is the same.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from database import User, password_hasher, HashingUnavailable
+
+CREDENTIALS = {"username": "alice", "password": "password123"}
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """ The shared hasher with one worker and room for one hash in flight. """
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(password_hasher, "workers", 1)
+    monkeypatch.setattr(password_hasher, "queue_depth", 1)
+    monkeypatch.setattr(password_hasher, "timeout", 5)
+    monkeypatch.setattr(password_hasher, "_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(password_hasher, "_executor", executor)
+    monkeypatch.setattr(password_hasher, "_executor_pid", os.getpid())
+    yield password_hasher
+    executor.shutdown(wait=True)
+
+
+def hold(hasher):
+    """ Start a hash that runs until the returned event is set; what its caller got ends up in `outcome`. """
+    started, release, outcome = threading.Event(), threading.Event(), []
+
+    def slow():
+        started.set()
+        return release.wait(5)
+
+    def call():
+        try:
+            outcome.append(hasher._run(slow))
+        except HashingUnavailable as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=call)
+    thread.start()
+    assert started.wait(5)
+    return release, thread, outcome
+
+
+def wait_for_slot(hasher):
+    """ Slots are freed by the futures' done callbacks, which may run just after their result was handed over. """
+    assert hasher._slots.acquire(timeout=5)
+    hasher._slots.release()
+
+
+def test_a_saturated_hasher_sheds_register_and_login(client, pool):
+    assert client.post("/auth/register", json=CREDENTIALS).status_code == 201
+    release, thread, _ = hold(pool)
+
+    response = client.post("/auth/login", json=CREDENTIALS)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert client.post("/auth/register", json={**CREDENTIALS, "username": "bob"}).status_code == 503
+    assert User.find_user_by_username("bob") is None
+
+    release.set()
+    thread.join()
+    wait_for_slot(pool)
+    assert client.post("/auth/login", json=CREDENTIALS).status_code == 200
+
+
+def test_a_hash_past_the_timeout_keeps_its_slot_until_it_ends(pool, monkeypatch):
+    monkeypatch.setattr(pool, "timeout", 0.05)
+    release, thread, outcome = hold(pool)
+    thread.join()
+    assert isinstance(outcome[0], HashingUnavailable)  # Gave up waiting after 50ms, the hash still runs
+    with pytest.raises(HashingUnavailable):
+        pool.hash("password123")  # The slot is still taken
+
+    release.set()
+    wait_for_slot(pool)
+    assert pool.verify(pool.hash("password123"), "password123")
+
+
+def test_a_broken_pool_frees_its_slot_and_is_rebuilt(pool, monkeypatch):
+    def broken(*args, **kwargs):
+        raise BrokenProcessPool("a hashing process died")
+
+    monkeypatch.setattr(pool._executor, "submit", broken)
+    with pytest.raises(HashingUnavailable):
+        pool.hash("password123")
+    assert pool._executor is None  # Rebuilt on the next call
+    assert pool._slots.acquire(blocking=False)
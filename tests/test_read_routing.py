@@ -0,0 +1,131 @@
+"""
+Read routing against a throwaway three-member replica set: history, statistics
+and dashboard reads go to secondaries, logs, rollup folds and exports to the primary.
+Skipped without mongod on PATH.
+"""
+import os
+import shutil
+import sys
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo import WriteConcern, monitoring
+
+from conftest import HABIT
+
+pytestmark = pytest.mark.skipif(not shutil.which("mongod"), reason="needs mongod on PATH")
+
+READ_COMMANDS = {"find", "aggregate", "getMore", "count", "distinct"}
+
+
+class CommandRecorder(monitoring.CommandListener):
+    """ (command, server) of every command issued on this thread while recording. """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.commands = []
+
+    def started(self, event):
+        if getattr(self.local, "recording", False):
+            self.commands.append((event.command_name, event.connection_id))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def record(self, send):
+        self.commands = []
+        self.local.recording = True
+        try:
+            result = send()
+            if hasattr(result, "get_data"):
+                result.get_data()  # Streamed bodies run their queries here
+        finally:
+            self.local.recording = False
+        return self.commands
+
+
+@pytest.fixture(scope="module")
+def replica_set():
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+    import harness
+
+    try:
+        uri = harness.start_replica_set(ports=(27217, 27218, 27219), name="habitforge-test-rs")
+    except SystemExit as e:
+        pytest.fail(str(e))
+    recorder = CommandRecorder()
+    monitoring.register(recorder)  # Before the replica set's client is created
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("MONGODB_URI", uri)
+        patch.setenv("MONGO_SECONDARY_READ_PREFERENCE", "secondary")
+        yield recorder
+
+
+@pytest.fixture
+def routed(replica_set):
+    """ The app on the replica set, a logged-in user with a logged daily habit, and the recorder. """
+    from app import create_app
+    from database import get_client, get_db
+    from database.client import _collections
+    from database.indexes import sync_indexes
+
+    _collections.clear()
+    get_client().drop_database(os.environ["MONGO_DB_NAME"])
+    sync_indexes()
+    app = create_app()
+    app.testing = True
+    client = app.test_client()
+    client.post("/auth/register", json={"username": "alice", "password": "password123"})
+    token = client.post("/auth/login", json={"username": "alice", "password": "password123"}).get_json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/habit/create", json={**HABIT, "frequency": "daily"}, headers=headers)
+    client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers)
+    # Wait until both secondaries have everything so far
+    get_db()["test_sync"].with_options(write_concern=WriteConcern(w=3, wtimeout=30000)).insert_one({})
+    yield client, headers, replica_set, get_client().primary
+    _collections.clear()
+
+
+@pytest.mark.parametrize("method, path, body", [
+    ("get", "/habit/log", {**HABIT, "limit": 100}),
+    ("get", "/habit/stats", HABIT),
+    ("get", "/habit/stats", {**HABIT, "start": "2020-01-01T00:00:00"}),
+    ("get", "/habit/dashboard", None),
+])
+def test_history_reads_go_to_secondaries(routed, method, path, body):
+    client, headers, recorder, primary = routed
+    commands = recorder.record(lambda: getattr(client, method)(path, json=body or {}, headers=headers))
+    reads = [(command, server) for command, server in commands if command in READ_COMMANDS]
+    assert reads
+    assert not [command for command, server in reads if server == primary]
+
+
+@pytest.mark.parametrize("send", [
+    lambda client, headers: client.get("/habit/export?format=jsonl", headers=headers),
+    lambda client, headers: client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers),
+    lambda client, headers: client.post("/habit/log/batch", json={"logs": [HABIT]}, headers=headers),
+], ids=["export", "log", "log batch"])
+def test_exports_and_log_claims_stay_on_the_primary(routed, send):
+    client, headers, recorder, primary = routed
+    commands = recorder.record(lambda: send(client, headers))
+    assert commands
+    assert [server for _, server in commands] == [primary] * len(commands)
+
+
+def test_log_fold_reads_the_primary_inside_secondary_reads(routed):
+    from database import Habit, Habit_Log, secondary_reads
+    from v1.core.habit.habit_periods import period_start
+    from v1.core.habit.habit_service import fold_pending_logs
+
+    client, headers, recorder, primary = routed
+    habit_id = Habit.habits.find_one({"username": "alice", **HABIT})["habit_id"]
+    replayed = datetime.utcnow() - timedelta(days=2)  # Before the last log: recomputed from all the logs
+    Habit_Log.habit_logs.insert_one(Habit_Log("alice", "read", habit_id, "done", replayed, period_start(replayed, "daily")).to_document())
+    with secondary_reads():
+        commands = recorder.record(lambda: fold_pending_logs([habit_id]))
+    reads = [server for command, server in commands if command in READ_COMMANDS]
+    assert reads and set(reads) == {primary}
@@ -0,0 +1,36 @@
+"""
+Renaming a habit moves its scheduled reminder atomically with respect to ticks.
+"""
+from datetime import datetime
+
+import redis
+
+from database import get_redis
+from v1.core.habit.habit_reminders import DUE_KEY, pop_due, rename_reminder, reminder_member, schedule_reminder
+
+HABIT = {"habit_id": "h1", "username": "alice", "habit_name": "read", "frequency": "daily"}
+
+
+def test_rename_keeps_the_due_time(app):
+    schedule_reminder(HABIT, datetime(2030, 1, 1))
+    due = get_redis().zscore(DUE_KEY, reminder_member(HABIT))
+
+    rename_reminder(HABIT, "study")
+    assert get_redis().zrange(DUE_KEY, 0, -1, withscores=True) == [(reminder_member({**HABIT, "habit_name": "study"}), due)]
+
+
+def test_rename_racing_a_tick_sends_the_reminder_once(app, monkeypatch):
+    schedule_reminder(HABIT, datetime(2020, 1, 1))  # Due
+    zscore = redis.client.Pipeline.zscore
+    claimed = []
+
+    def tick_in_between(pipe, *args):
+        due = zscore(pipe, *args)
+        if not claimed:
+            claimed.extend(pop_due())  # A scheduler claims the reminder between the read and the move
+        return due
+
+    monkeypatch.setattr(redis.client.Pipeline, "zscore", tick_in_between)
+    rename_reminder(HABIT, "study")
+    assert [habit["habit_name"] for habit, _ in claimed] == ["read"]
+    assert get_redis().zcard(DUE_KEY) == 0  # Not scheduled again under the new name
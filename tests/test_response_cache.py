@@ -0,0 +1,26 @@
+"""
+Cached bodies are computed from primary reads, even in views routed to secondaries.
+"""
+from database.client import reading_from_secondaries
+from v1.core.habit.habit_service import HabitEngine
+
+from conftest import HABIT
+
+
+def test_cached_bodies_read_from_the_primary(client, auth, monkeypatch):
+    headers = auth()
+    client.post("/habit/create", json={**HABIT, "frequency": "daily"}, headers=headers)
+    client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers)
+    routed = []
+    statistics = HabitEngine.statistics
+
+    def recording(self, *args, **kwargs):
+        routed.append(reading_from_secondaries())
+        return statistics(self, *args, **kwargs)
+
+    monkeypatch.setattr(HabitEngine, "statistics", recording)
+    first = client.get("/habit/stats", json=HABIT, headers=headers)
+    cached = client.get("/habit/stats", json=HABIT, headers=headers)
+    assert first.status_code == cached.status_code == 200
+    assert cached.get_json() == first.get_json()
+    assert routed == [False]  # Computed once, from the primary; then served from the cache
@@ -0,0 +1,169 @@
+"""
+Logs and rollups: one stored log per period whatever fails or races, rollups
+folded in after the response without losing a concurrent fold, and habits
+logged before rollups existed built from their logs.
+"""
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from pymongo.errors import AutoReconnect
+
+from database import Habit, Habit_Log, Habit_Rollup
+
+from conftest import HABIT
+
+
+def add_legacy_logs(habit_id, last, days=100):
+    """ Daily logs up to `last`, stored the way they were before rollups existed. """
+    Habit_Log.habit_logs.insert_many([
+        Habit_Log("alice", "read", habit_id, "done", last - timedelta(days=day)).to_document() for day in range(days)
+    ])
+
+
+@pytest.fixture
+def new_habit(client, auth):
+    """ Authorization headers and habit_id of a daily habit with no logs and no rollup. """
+    headers = auth()
+    client.post("/habit/create", json={**HABIT, "frequency": "daily"}, headers=headers)
+    return headers, Habit.habits.find_one({"username": "alice", **HABIT})["habit_id"]
+
+
+@pytest.fixture
+def legacy_habit(new_habit):
+    """ The daily habit with 100 days of logs, the last one yesterday (24h+ ago), and no rollup. """
+    add_legacy_logs(new_habit[1], datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1))
+    return new_habit
+
+
+def test_first_log_keeps_the_history(client, legacy_habit):
+    headers, habit_id = legacy_habit
+    response = client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers)
+    assert response.status_code == 201
+
+    streak = client.get("/habit/streak", json=HABIT, headers=headers).get_json()
+    assert streak["current_streak"] == 101
+    assert streak["longest_streak"] == 101
+    assert Habit_Rollup.find_rollup_by_habit_id(habit_id)["completed_count"] == 101
+
+
+def test_rebuild_missing_rollups(app, legacy_habit):
+    headers, habit_id = legacy_habit
+    result = app.test_cli_runner().invoke(args=["habit", "rebuild-rollups", "--missing"])
+    assert "Backfilled rollups for 1 habit(s)" in result.output
+    assert Habit_Rollup.find_rollup_by_habit_id(habit_id)["current_streak"] == 100
+
+    result = app.test_cli_runner().invoke(args=["habit", "rebuild-rollups", "--missing"])
+    assert "Backfilled rollups for 0 habit(s)" in result.output
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/habit/log", {**HABIT, "log": "done"}),
+    ("/habit/log/batch", {"logs": [HABIT]}),
+])
+def test_legacy_logs_keep_their_period(app, client, new_habit, path, body):
+    headers, habit_id = new_habit
+    add_legacy_logs(habit_id, datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0), days=10)  # Up to today
+    result = app.test_cli_runner().invoke(args=["habit", "assign-log-periods"])
+    assert "Assigned periods to 10 log(s)" in result.output
+
+    response = client.post(path, json=body, headers=headers)
+    status = response.status_code if path == "/habit/log" else response.get_json()["results"][0]["status"]
+    assert status == 409
+    assert Habit_Log.habit_logs.count_documents({"habit_id": habit_id}) == 10
+
+
+def test_logs_are_refused_without_the_unique_period_index(client, new_habit, monkeypatch):
+    from v1.core.habit import habit_rollup
+
+    headers, habit_id = new_habit
+    monkeypatch.setattr(habit_rollup, "_checked_indexes", set())
+    Habit_Log.habit_logs.drop_indexes()
+    response = client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers)
+    assert response.status_code == 500
+    assert "sync-indexes" in response.get_json()["message"]
+    assert Habit_Log.habit_logs.count_documents({"habit_id": habit_id}) == 0
+
+
+def test_failed_insert_leaves_the_period_to_a_concurrent_post(client, new_habit, monkeypatch):
+    headers, habit_id = new_habit
+    insert_one = mongomock.collection.Collection.insert_one
+    responses = []
+
+    def fail_after_a_concurrent_post(collection, document, *args, **kwargs):
+        if collection.name == "habit_logs" and not responses:
+            responses.append(None)
+            responses[0] = client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers)
+            raise AutoReconnect("connection lost")
+        return insert_one(collection, document, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "insert_one", fail_after_a_concurrent_post)
+    failed = client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers)
+    assert failed.status_code == 500
+    assert responses[0].status_code == 201
+    assert client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers).status_code == 409
+
+    assert Habit_Log.habit_logs.count_documents({"habit_id": habit_id}) == 1
+    rollup = Habit_Rollup.find_rollup_by_habit_id(habit_id)
+    assert (rollup["completed_count"], rollup["current_streak"]) == (1, 1)
+
+
+def test_concurrent_post_wins_the_period(client, new_habit, monkeypatch):
+    headers, habit_id = new_habit
+    insert_one = mongomock.collection.Collection.insert_one
+    responses = []
+
+    def post_in_between(collection, document, *args, **kwargs):
+        if collection.name == "habit_logs" and not responses:
+            responses.append(None)
+            responses[0] = client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers)
+        return insert_one(collection, document, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "insert_one", post_in_between)
+    assert client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers).status_code == 409
+    assert responses[0].status_code == 201
+    assert Habit_Log.habit_logs.count_documents({"habit_id": habit_id}) == 1
+    assert Habit_Rollup.find_rollup_by_habit_id(habit_id)["completed_count"] == 1
+
+
+def test_fold_racing_another_fold_loses_no_log(client, new_habit, monkeypatch):
+    headers, habit_id = new_habit
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    client.post("/habit/log/batch", json={"logs": [{**HABIT, "timestamp": (today - timedelta(days=2)).isoformat()}]}, headers=headers)
+    replace_one = mongomock.collection.Collection.replace_one
+    raced = []
+
+    def log_in_between(collection, *args, **kwargs):
+        if collection.name == "habit_rollups" and not raced:
+            # Today's log is stored and folded (with yesterday's, pending too) between this fold's read and write
+            raced.append(None)
+            raced[0] = client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers)
+        return replace_one(collection, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "replace_one", log_in_between)
+    response = client.post("/habit/log/batch", json={"logs": [{**HABIT, "timestamp": (today - timedelta(days=1)).isoformat()}]}, headers=headers)
+    assert response.get_json()["results"][0]["status"] == 201
+    assert raced[0].status_code == 201
+
+    rollup = Habit_Rollup.find_rollup_by_habit_id(habit_id)
+    assert (rollup["completed_count"], rollup["current_streak"], rollup["longest_streak"]) == (3, 3, 3)
+    assert Habit_Log.habit_logs.count_documents({"habit_id": habit_id, "pending": True}) == 0
+
+
+def test_stranded_logs_are_folded_by_the_scheduler(client, new_habit, monkeypatch):
+    from v1.core.habit import habit_service
+
+    headers, habit_id = new_habit
+
+    def worker_died(*args):
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(habit_service, "fold_rollup", worker_died)
+    assert client.post("/habit/log", json={**HABIT, "log": "done"}, headers=headers).status_code == 201
+    assert Habit_Rollup.find_rollup_by_habit_id(habit_id) is None
+    assert habit_service.fold_stranded_logs() == 0  # Still within its request's grace period
+    monkeypatch.undo()
+
+    assert habit_service.fold_stranded_logs(datetime.utcnow() + timedelta(minutes=5)) == 1
+    assert client.get("/habit/streak", json=HABIT, headers=headers).get_json()["current_streak"] == 1
+    assert Habit_Log.habit_logs.count_documents({"habit_id": habit_id, "pending": True}) == 0
@@ -0,0 +1,129 @@
+"""
+GET /habit/stats over a date range runs one aggregation ($unionWith the compacted
+buckets, $dateTrunc, $dateDiff) that mongomock can't run: its results are checked
+against periods counted in plain Python on a throwaway replica set, skipped
+without mongod on PATH. Parameter checks run everywhere.
+"""
+import os
+import shutil
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+from v1.core.habit import habit_cache
+from v1.core.habit.habit_periods import period_start, periods_between
+
+from conftest import HABIT
+
+mongod = pytest.mark.skipif(not shutil.which("mongod"), reason="needs mongod on PATH")
+
+FIRST_LOG = datetime(2023, 1, 1)
+COMPACTED_BEFORE = datetime(2024, 7, 1)
+# Done most days for two and a half years, with a month off; logs before COMPACTED_BEFORE are compacted
+DONE = [FIRST_LOG + timedelta(days=day, hours=day % 24) for day in range(912) if day % 4 != 1 and not 200 <= day < 230]
+SKIPPED = [FIRST_LOG + timedelta(days=day, hours=1) for day in range(1, 912, 4)]
+
+
+@pytest.fixture(scope="module")
+def replica_set():
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+    import harness
+
+    try:
+        uri = harness.start_replica_set(ports=(27317, 27318, 27319), name="habitforge-stats-rs")
+    except SystemExit as e:
+        pytest.fail(str(e))
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("MONGODB_URI", uri)
+        yield uri
+
+
+@pytest.fixture(params=["daily", "weekly", "monthly"])
+def logged(request, replica_set, monkeypatch):
+    """ The app on the replica set and a logged-in user's habit of each frequency, logged since FIRST_LOG. """
+    from app import create_app
+    from database import Habit, Habit_Log, get_client
+    from database.client import _collections
+    from database.indexes import sync_indexes
+    from v1.core.habit.habit_buckets import compact_all
+    from v1.core.habit.habit_rollup import rebuild_all
+
+    _collections.clear()
+    get_client().drop_database(os.environ["MONGO_DB_NAME"])
+    sync_indexes()
+    monkeypatch.setattr(habit_cache, "CACHE_MAX_ENTRIES", 0)  # Every request runs its aggregation
+    app = create_app()
+    app.testing = True
+    client = app.test_client()
+    client.post("/auth/register", json={"username": "alice", "password": "password123"})
+    token = client.post("/auth/login", json={"username": "alice", "password": "password123"}).get_json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/habit/create", json={**HABIT, "frequency": request.param}, headers=headers)
+    habit_id = Habit.habits.find_one({"username": "alice", **HABIT})["habit_id"]
+    Habit.habits.update_one({"habit_id": habit_id}, {"$set": {"start_date": FIRST_LOG}})  # Ranges aren't clipped
+    Habit_Log.habit_logs.insert_many(
+        [Habit_Log("alice", "read", habit_id, "done", timestamp).to_document() for timestamp in DONE]
+        + [Habit_Log("alice", "read", habit_id, "skipped", timestamp).to_document() for timestamp in SKIPPED]
+    )
+    compact_all(older_than=datetime.utcnow() - COMPACTED_BEFORE, pause=0)
+    rebuild_all()
+    assert Habit_Log.habit_logs.count_documents({"habit_id": habit_id, "log": "done", "timestamp": {"$lt": COMPACTED_BEFORE}}) == 0
+    yield client, headers, habit_id, request.param
+    _collections.clear()
+
+
+def expected(frequency, start=None, end=None):
+    """ Statistics of DONE counted in Python: periods holding a log in [start, end), periods from start (or the first one) to today or end. """
+    last = min(end - timedelta(milliseconds=1), datetime.utcnow()) if end else datetime.utcnow()
+    completed = {period_start(timestamp, frequency) for timestamp in DONE
+                 if (start is None or timestamp >= start) and (end is None or timestamp < end)}
+    total = periods_between(start or min(completed), last, frequency)
+    return {"total_periods": total, "completed": len(completed), "adherence_rate": round(len(completed) / total * 100, 2) if total else 0.0}
+
+
+def statistics(client, headers, **params):
+    response = client.get("/habit/stats", json={**HABIT, **{key: value.isoformat() for key, value in params.items()}}, headers=headers)
+    assert response.status_code == 200
+    data = response.get_json()["data"]
+    return {key: data[key] for key in ("total_periods", "completed", "adherence_rate")}
+
+
+@mongod
+@pytest.mark.parametrize("start, end", [
+    (datetime(2023, 3, 15), None),
+    (None, datetime(2024, 2, 10)),
+    (datetime(2023, 11, 20, 12), datetime(2024, 8, 5)),  # Compacted and raw logs
+    (datetime(2024, 6, 25), datetime(2024, 7, 8)),  # Across the compaction boundary, within a week or two
+    (datetime(2023, 2, 1), datetime(2023, 5, 1)),  # Compacted logs only
+    (datetime(2023, 7, 20), datetime(2023, 8, 17)),  # The month off
+    (datetime(2022, 6, 1), datetime(2023, 1, 1)),  # Before the first log
+], ids=["from", "until", "compacted and raw", "boundary", "compacted", "month off", "before"])
+def test_ranges_count_the_periods_logged(logged, start, end):
+    client, headers, habit_id, frequency = logged
+    result = statistics(client, headers, **{key: value for key, value in (("start", start), ("end", end)) if value})
+    want = expected(frequency, start, end)
+    assert result == {**want, "adherence_rate": pytest.approx(want["adherence_rate"], abs=0.01)}
+
+
+@mongod
+def test_whole_history_aggregation_matches_the_rollup(logged):
+    from database import Habit_Rollup
+
+    client, headers, habit_id, frequency = logged
+    from_rollup = statistics(client, headers)
+    Habit_Rollup.habit_rollups.delete_one({"habit_id": habit_id})  # Computed by the aggregation instead
+    from_logs = statistics(client, headers)
+    want = expected(frequency)
+    assert from_rollup == from_logs == {**want, "adherence_rate": pytest.approx(want["adherence_rate"], abs=0.01)}
+
+
+@pytest.mark.parametrize("params", [
+    {"start": [1]},
+    {"end": {"date": "2024-01-01"}},
+    {"start": "last week"},
+    {"start": "2024-02-01", "end": "2024-01-01"},
+])
+def test_malformed_ranges_are_refused(client, headers, params):
+    response = client.get("/habit/stats", json={**HABIT, **params}, headers=headers)
+    assert response.status_code == 400
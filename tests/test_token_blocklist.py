@@ -0,0 +1,83 @@
+"""
+Revoked tokens: keys of the current scheme keep a token revoked, from memory and
+in the Redis fallback, and so do bare-jti keys written before the 'revoked:'
+prefix while TOKEN_BLOCKLIST_LEGACY_KEYS is set. Expired tokens are forgotten.
+"""
+import time
+import uuid
+
+import pytest
+
+from database import get_redis
+from v1.auth.token_blocklist import REVOKED_PREFIX, TokenBlocklist
+
+
+@pytest.fixture
+def blocklist(app, monkeypatch):
+    blocklist = TokenBlocklist()
+    monkeypatch.setattr(blocklist, "_ensure_listener", lambda: None)  # Driven by hand below
+    return blocklist
+
+
+@pytest.mark.parametrize("key", [lambda jti: REVOKED_PREFIX + jti, lambda jti: jti], ids=["prefixed", "legacy"])
+def test_revoked_keys_are_loaded(blocklist, key, monkeypatch):
+    monkeypatch.setattr(blocklist, "legacy_keys", True)
+    jti = str(uuid.uuid4())
+    get_redis().setex(key(jti), 3600, "invalid")
+
+    assert blocklist.is_revoked(jti)  # Redis fallback, not subscribed yet
+    blocklist._load_existing(get_redis())
+    blocklist._synced.set()
+    assert blocklist.is_revoked(jti)
+    assert not blocklist.is_revoked(str(uuid.uuid4()))
+
+
+def test_revoke(blocklist):
+    jti = str(uuid.uuid4())
+    blocklist.revoke(jti, time.time() + 60)
+    blocklist._synced.set()
+    assert blocklist.is_revoked(jti)
+    assert get_redis().ttl(REVOKED_PREFIX + jti) > 0
+
+
+def test_legacy_keys_are_not_scanned_by_default(blocklist, monkeypatch):
+    legacy, current = str(uuid.uuid4()), str(uuid.uuid4())
+    client = get_redis()
+    client.setex(legacy, 3600, "invalid")
+    client.setex(REVOKED_PREFIX + current, 3600, "invalid")
+    scans = []
+    scan_iter = client.scan_iter
+    monkeypatch.setattr(client, "scan_iter", lambda match=None, **kwargs: scans.append(match) or scan_iter(match=match, **kwargs))
+
+    assert not blocklist.is_revoked(legacy)
+    blocklist._load_existing(client)
+    blocklist._synced.set()
+    assert scans == [REVOKED_PREFIX + "*"]
+    assert blocklist.is_revoked(current)
+    assert not blocklist.is_revoked(legacy)
+
+
+def test_expired_tokens_are_forgotten_in_expiry_order(blocklist):
+    now = time.time()
+    for number in range(1000):
+        blocklist._remember(f"live-{number}", now + 60 + number)
+    blocklist._remember("expired", now - 1)
+    blocklist._remember("extended", now - 1)
+    blocklist._remember("extended", now + 30)  # Revoked again for longer
+
+    blocklist._purge_expired()
+    assert "expired" not in blocklist._revoked
+    assert blocklist._revoked["extended"] == now + 30
+    assert len(blocklist._revoked) == 1001
+    assert len(blocklist._expiries) == 1001  # Only the expired entries were popped
+
+    blocklist._remember("extended", now + 10)  # An earlier expiry doesn't shorten a revocation
+    assert blocklist._revoked["extended"] == now + 30
+
+
+def test_reloading_keeps_one_expiry_per_token(blocklist):
+    jti = str(uuid.uuid4())
+    get_redis().setex(REVOKED_PREFIX + jti, 3600, "invalid")
+    for _ in range(3):  # Every reconnect reloads the keys
+        blocklist._load_existing(get_redis())
+    assert len(blocklist._expiries) == 1
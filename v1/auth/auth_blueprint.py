@@ -1,14 +1,23 @@
 # src/auth/auth_blueprint.py
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt, create_access_token
-from werkzeug.security import check_password_hash
-import redis
 from database.data import User, Habit
+from database.password_hasher import password_hasher, HashingUnavailable
+from .token_blocklist import token_blocklist
 from typing import Optional, Dict, Tuple, Union
 
 # Create the blueprint for authentication
 auth = Blueprint('auth', __name__)
 
+def busy_response() -> Tuple[Dict[str, str], int]:
+    """
+    Shed an auth request when password hashing is saturated, so it doesn't hold a worker.
+    """
+    response = jsonify({"msg": "authentication is busy, try again shortly"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
 @auth.route("/register", methods=["POST"])
 def signup() -> Tuple[Dict[str, str], int]:
     """
@@ -26,7 +35,10 @@ def signup() -> Tuple[Dict[str, str], int]:
         return jsonify({"msg": "username already used, try another one"}), 409
 
     new_user = User(username, password)
-    new_user.save()
+    try:
+        new_user.save()
+    except HashingUnavailable:
+        return busy_response()
 
     return jsonify({"msg": "account created successfully"}), 201
 
@@ -45,7 +57,11 @@ def login() -> Tuple[Dict[str, Union[str, str]], int]:
         return jsonify({"msg": "user not found"}), 404
 
     hashed_pwd = user["password"]
-    if not check_password_hash(hashed_pwd, password):
+    try:
+        valid_password = password_hasher.verify(hashed_pwd, password)
+    except HashingUnavailable:
+        return busy_response()
+    if not valid_password:
         return jsonify({"msg": "Bad username or password"}), 401
 
     access_token = create_access_token(identity=username)
@@ -68,9 +84,8 @@ def logout() -> Dict[str, str]:
     """
     Logs the user out by blacklisting the JWT token.
     """
-    jti = get_jwt()["jti"]
+    token = get_jwt()
 
-    r = redis.StrictRedis(host="redis-12255.c10.us-east-1-4.ec2.cloud.redislabs.com", port=12255, password = "1rPEIkNriUNIT8PyUpy6C4rQCId3evGb", db =0)
-    r.setex(jti, 3600, "invalid")
+    token_blocklist.revoke(token["jti"], token["exp"])
 
     return jsonify(msg="Successfully logged out"), 200
@@ -0,0 +1,142 @@
+from database import get_redis
+import heapq
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Redis key prefix of revoked tokens and the channel announcing new revocations
+REVOKED_PREFIX = "revoked:"
+REVOKED_CHANNEL = "habitforge:revoked"
+# Tokens revoked before the prefix existed: the bare jti (a uuid4) as the key, set for an hour.
+# Only looked for with TOKEN_BLOCKLIST_LEGACY_KEYS=1, during the hour after upgrading from such a release
+LEGACY_REVOKED_MATCH = "????????-????-????-????-????????????"
+
+
+class TokenBlocklist:
+    """
+    Revoked JWT ids, cached in process and kept current over Redis pub/sub.
+
+    Redis stays the source of truth (one key per revoked jti, expiring with the
+    token). Each worker subscribes to REVOKED_CHANNEL, loads the existing keys
+    once, and then answers is_revoked() from memory, so valid tokens cost no
+    network call. While the subscription is down (startup, Redis outage) the
+    check falls back to a Redis lookup, so a revocation is never missed.
+    Expired tokens are forgotten in expiry order (a heap), so the listener
+    never walks the whole cache.
+    """
+
+    def __init__(self, poll_interval: float = 1.0):
+        self.poll_interval = poll_interval  # Upper bound for noticing a dropped subscription
+        self.legacy_keys = os.getenv("TOKEN_BLOCKLIST_LEGACY_KEYS", "0") == "1"  # Also honour bare jti keys
+        self._revoked: Dict[str, float] = {}  # jti -> token expiry (epoch seconds)
+        self._expiries: List[Tuple[float, str]] = []  # Heap of (expiry, jti), possibly stale
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        self._listener_pid: Optional[int] = None
+        self._synced = threading.Event()
+
+    def revoke(self, jti: str, expires_at: float):
+        """ Revoke a token until it expires and tell every worker about it. """
+        ttl = max(1, int(expires_at - time.time()))
+        pipe = get_redis().pipeline()
+        pipe.setex(REVOKED_PREFIX + jti, ttl, "invalid")
+        pipe.publish(REVOKED_CHANNEL, f"{jti} {int(expires_at)}")
+        pipe.execute()
+        self._remember(jti, expires_at)
+
+    def is_revoked(self, jti: str) -> bool:
+        """ Check a token id, from memory while the subscription is live. """
+        self._ensure_listener()
+        if self._synced.is_set():
+            expires_at = self._revoked.get(jti)
+            return expires_at is not None and expires_at > time.time()
+        keys = [REVOKED_PREFIX + jti, jti] if self.legacy_keys else [REVOKED_PREFIX + jti]
+        return get_redis().exists(*keys) > 0
+
+    def _remember(self, jti: str, expires_at: float):
+        with self._lock:
+            self._store(jti, expires_at)
+
+    def _store(self, jti: str, expires_at: float):
+        """ Record a revocation (the later expiry wins); the caller holds the lock. """
+        if expires_at > self._revoked.get(jti, 0):
+            self._revoked[jti] = expires_at
+            heapq.heappush(self._expiries, (expires_at, jti))
+
+    def _purge_expired(self):
+        """ Forget the tokens that expired, popping them off the expiry heap. """
+        now = time.time()
+        with self._lock:
+            while self._expiries and self._expiries[0][0] <= now:
+                expires_at, jti = heapq.heappop(self._expiries)
+                if self._revoked.get(jti) == expires_at:  # Not revoked again for longer since
+                    del self._revoked[jti]
+
+    def _ensure_listener(self):
+        """ Start the subscriber thread in this process (again after a fork). """
+        pid = os.getpid()
+        if self._listener_pid == pid and self._listener and self._listener.is_alive():
+            return
+        if self._listener_pid not in (None, pid):
+            self._lock = threading.Lock()  # The parent's lock may have been held at fork time
+        with self._lock:
+            if self._listener_pid == pid and self._listener and self._listener.is_alive():
+                return
+            self._synced = threading.Event()
+            self._listener_pid = pid
+            self._listener = threading.Thread(target=self._listen, name="token-blocklist", daemon=True)
+            self._listener.start()
+
+    def _load_existing(self, client):
+        """ Load the revocations made before this worker subscribed (legacy keys too with `legacy_keys`). """
+        keys = [(key, key[len(REVOKED_PREFIX):]) for key in client.scan_iter(match=REVOKED_PREFIX + "*", count=1000)]
+        if self.legacy_keys:
+            keys += [(key, key) for key in client.scan_iter(match=LEGACY_REVOKED_MATCH, count=1000)]
+        if not keys:
+            return
+        pipe = client.pipeline()
+        for key, _ in keys:
+            pipe.ttl(key)
+        now = time.time()
+        with self._lock:
+            for (_, jti), ttl in zip(keys, pipe.execute()):
+                # TTLs are whole seconds: a reload within a second of the known expiry changes nothing
+                if ttl and ttl > 0 and now + ttl > self._revoked.get(jti, 0) + 1:
+                    self._store(jti, now + ttl)
+
+    def _listen(self):
+        backoff = self.poll_interval
+        while True:
+            pubsub = None
+            try:
+                client = get_redis()
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(REVOKED_CHANNEL)
+                # Subscribed first, then snapshot: nothing revoked in between is lost
+                self._load_existing(client)
+                self._synced.set()
+                backoff = self.poll_interval
+                while True:
+                    message = pubsub.get_message(timeout=self.poll_interval)
+                    if message and message.get("type") == "message":
+                        jti, _, expires_at = message["data"].partition(" ")
+                        self._remember(jti, float(expires_at or 0))
+                    self._purge_expired()
+            except Exception as e:
+                self._synced.clear()
+                logger.warning("Token blocklist subscription lost, falling back to Redis lookups: %s", e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+
+token_blocklist = TokenBlocklist()
@@ -0,0 +1,8 @@
+from .event_stream import sse, publish_event  # Import the SSE blueprint
+
+def register_event_stream(app):
+
+    # Register the blueprint
+    app.register_blueprint(sse, url_prefix='/stream')
+
+__all__ = ['sse', 'publish_event'] # Explicitly export the blueprint
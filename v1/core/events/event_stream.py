@@ -0,0 +1,189 @@
+from flask import current_app, json, request, stream_with_context
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_sse import Message, ServerSentEventsBlueprint
+from database import get_redis
+from typing import Dict, Optional, Set
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Every user has one private channel; the hub listens to all of them on one connection
+CHANNEL_PREFIX = "user."
+
+
+def user_channel(username: str) -> str:
+    return f"{CHANNEL_PREFIX}{username}"
+
+
+class Subscription:
+    """ A bounded queue of messages for one open stream. """
+
+    def __init__(self, channel: str, size: int):
+        self.channel = channel
+        self.queue: "queue.Queue[Message]" = queue.Queue(maxsize=size)
+        self.overflowed = False  # Messages were dropped because the client reads too slowly
+
+
+class EventHub:
+    """
+    Fans Redis pub/sub messages out to the streams open in this process.
+
+    One pattern subscription per process (instead of one Redis connection per
+    open stream) feeds a bounded queue per stream. A stream whose queue is full
+    loses messages instead of buffering without limit, and is told to resync.
+    """
+
+    def __init__(self, queue_size: int = 64, poll_interval: float = 1.0):
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        self._listener_pid: Optional[int] = None
+
+    def subscribe(self, channel: str) -> Subscription:
+        self._ensure_listener()
+        subscription = Subscription(channel, self.queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.channel, None)
+
+    def count(self) -> int:
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def dispatch(self, channel: str, message: Message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                subscription.overflowed = True
+
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if self._listener_pid == pid and self._listener and self._listener.is_alive():
+            return
+        if self._listener_pid not in (None, pid):
+            self._lock = threading.Lock()  # The parent's lock may have been held at fork time
+            self._subscriptions = {}
+        with self._lock:
+            if self._listener_pid == pid and self._listener and self._listener.is_alive():
+                return
+            self._listener_pid = pid
+            self._listener = threading.Thread(target=self._listen, name="event-hub", daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        backoff = self.poll_interval
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(CHANNEL_PREFIX + "*")
+                backoff = self.poll_interval
+                while True:
+                    pubsub_message = pubsub.get_message(timeout=self.poll_interval)
+                    if pubsub_message and pubsub_message["type"] == "pmessage":
+                        self.dispatch(pubsub_message["channel"], Message(**json.loads(pubsub_message["data"])))
+            except Exception as e:
+                logger.warning("Event hub subscription lost, retrying: %s", e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+
+class HabitEventStream(ServerSentEventsBlueprint):
+    """
+    flask_sse blueprint streaming each authenticated user's own channel.
+
+    - the JWT comes from the Authorization header or a `jwt` query parameter
+      (EventSource can't set headers); the `channel` parameter is ignored
+    - a comment line is sent every `SSE_HEARTBEAT_SECONDS` so proxies keep the
+      connection open and dead clients are detected
+    - at most `SSE_MAX_SUBSCRIBERS` streams per process; more are refused with 503
+    - a stream that fell behind gets a `resync` event telling the client to refetch
+    """
+
+    hub = EventHub(queue_size=int(os.getenv("SSE_QUEUE_SIZE", 64)))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.heartbeat = float(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+        self.max_subscribers = int(os.getenv("SSE_MAX_SUBSCRIBERS", 1000))
+        self.max_stream_seconds = float(os.getenv("SSE_MAX_STREAM_SECONDS", 3600))
+
+    @property
+    def redis(self):
+        """ The shared, pooled Redis client (flask_sse builds a new one per call). """
+        return get_redis()
+
+    def messages(self, channel='sse'):
+        """ Messages of `channel`, with None yielded whenever a heartbeat is due. """
+        subscription = self.hub.subscribe(channel)
+        try:
+            while True:
+                try:
+                    yield subscription.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield None
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    yield Message({"reason": "events were dropped"}, type="resync")
+        finally:
+            self.hub.unsubscribe(subscription)
+
+    def stream(self):
+        verify_jwt_in_request(locations=["headers", "query_string"])
+        if self.hub.count() >= self.max_subscribers:
+            response = current_app.response_class("event stream capacity reached\n", status=503)
+            response.headers["Retry-After"] = "5"
+            return response
+
+        channel = user_channel(get_jwt_identity())
+        deadline = time.monotonic() + self.max_stream_seconds
+
+        @stream_with_context
+        def generator():
+            yield "retry:5000\n\n"  # Reconnect delay hint for EventSource
+            for message in self.messages(channel=channel):
+                yield ": keepalive\n\n" if message is None else str(message)
+                if time.monotonic() > deadline:
+                    break  # Recycle long-lived streams; the client reconnects
+
+        response = current_app.response_class(generator(), mimetype='text/event-stream')
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"  # Don't let proxies buffer the stream
+        return response
+
+
+sse = HabitEventStream('sse', __name__)
+sse.add_url_rule(rule="", endpoint="stream", view_func=sse.stream)
+
+
+def publish_event(username: str, event_type: str, data: dict):
+    """
+    Publish an event on the user's channel. Failures are logged, never raised:
+    a missing notification must not fail the write that triggered it.
+    """
+    try:
+        sse.publish(data, type=event_type, channel=user_channel(username))
+    except Exception as e:
+        logger.warning("Could not publish '%s' event for %s: %s", event_type, username, e)
@@ -1,14 +1,34 @@
-from flask import Blueprint, jsonify, request
-from database.data import User, Habit, Habit_Log
-from .habit_service import HabitEngine
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from database.data import User, Habit, Habit_Log, HabitRepository
+from database import reads_from_secondaries
+from .habit_service import HabitEngine, fold_stranded_logs, parse_timestamp
+from .habit_rollup import assign_periods, rebuild_all
+from .habit_reminders import cancel_reminders, rename_reminder, schedule_all, tick
+from .habit_buckets import COMPACT_AFTER_DAYS, compact_all
+from .habit_cascade import habit_renamed, habits_deleted, sweep_orphans, work
+from .habit_export import EXPORT_FORMATS, encode_rows, export_checkpoint, export_rows, gzip_chunks
+from .habit_cache import conditional_response, habit_tag, response_tag
+from .habit_heatmap import FREQUENCY_BUCKETS, HEATMAP_BUCKETS, HEATMAP_ENCODINGS, MAX_HEATMAP_PERIODS, bucket_range, heatmap
+from .habit_leaderboards import forget_habits, rebuild_leaderboards, rename_on_leaderboards
+from v1.core.events import publish_event
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from typing import Optional
 import uuid
 import json
 import datetime
+import click
+import time
 
 habit = Blueprint('habit', __name__)
 
+
+# GET /habit/log paging and POST /habit/log/batch size
+LOG_PAGE_SIZE = 100
+MAX_LOG_PAGE_SIZE = 1000
+MAX_LOG_BATCH_SIZE = 500
+LOG_FIELDS = ('_id', 'username', 'habit_name', 'habit_id', 'timestamp', 'log')
+
+
 @habit.route("/create", methods=['POST'], strict_slashes=False)
 @jwt_required()
 def create_habit():
@@ -18,7 +38,7 @@ def create_habit():
     frequency = request.json.get("frequency")
     status = request.json.get("status")
     habit_obj = Habit(username, habit_name, frequency, status)
-    habit = Habit.habits.find_one({"username": username, "habit_name": habit_name})
+    habit = HabitRepository.current().find_by_name(username, habit_name)
     if not habit:
         habit_obj.create()
         return jsonify({"message": f"{frequency} '{habit_name}' habit created successfully"}), 201
@@ -32,13 +52,19 @@ def rename_habit():
     username = get_jwt_identity()
     habit_name = request.json.get("habit_name")
     new_habit_name = request.json.get("new_habit_name")
-    if Habit.habits.find_one({"username": username, "habit_name": new_habit_name}):
+    if HabitRepository.current().find_by_name(username, new_habit_name):
         return jsonify({"message": f"New Habit name already exists, try another one"}), 409
     else:
-        habit = Habit.habits.find_one({"username": username, "habit_name": habit_name})
+        habit = HabitRepository.current().find_by_name(username, habit_name)
         if habit:
             habit_obj = Habit(username=username, habit_name=habit_name)
             habit_obj.rename_habit(habit_name, new_habit_name)
+            rename_reminder(habit, new_habit_name)
+            rename_on_leaderboards(habit, new_habit_name)
+            habit_renamed(habit["habit_id"], new_habit_name)
+            publish_event(username, "habit-renamed", {
+                "habit_id": habit["habit_id"], "habit_name": habit_name, "new_habit_name": new_habit_name
+            })
             return jsonify({"message": f"Habit renamed to {new_habit_name}"}), 200
         return jsonify({"message": f"Habit not found"}), 404
 
@@ -49,7 +75,7 @@ def del_habit():
     """ Delete a specific habit. """
     username = get_jwt_identity()
     habit_name = request.json.get("habit_name")
-    habit = Habit.habits.find_one({"username": username, "habit_name": habit_name})
+    habit = HabitRepository.current().find_by_name(username, habit_name)
     if not habit:
         return jsonify({"message": "Habit not found"}), 404
     else:
@@ -57,6 +83,10 @@ def del_habit():
         if habit_obj is None:
             return jsonify({"message": "Habit not found"}), 404
         del_habit = habit_obj.delete_habit(habit_name)
+        cancel_reminders([habit])
+        forget_habits([habit])
+        habits_deleted([habit])
+        publish_event(username, "habit-deleted", {"habit_id": habit["habit_id"], "habit_name": habit_name})
         return jsonify({"message": f"{del_habit}"}), 200
 
 
@@ -65,9 +95,15 @@ def del_habit():
 def reset_habits():
     """Reset all habits to 0 for the authenticated user."""
     username = get_jwt_identity()
+    habits = list(Habit.find({"username": username}, {"_id": 0, "habit_id": 1, "username": 1, "habit_name": 1, "frequency": 1}))
     result = Habit.habits.delete_many({"username": username})
+    HabitRepository.current().forget_all()
+    cancel_reminders(habits)
+    forget_habits(habits)
+    habits_deleted(habits)
     
     if result.deleted_count > 0:
+        publish_event(username, "habits-reset", {"deleted": result.deleted_count})
         return jsonify({"message": f"All habits for user '{username}' have been reset successfully."}), 200
     return jsonify({"message": f"No habits found for user '{username}'. No habits were reset."}), 404
 
@@ -77,19 +113,30 @@ def reset_habits():
 def list_habits():
     """ List all habits associated with the authenticated user. """
     username = get_jwt_identity()
-    all_habits = []
-    for habit in Habit.find({"username": username}):
-        if isinstance(habit, dict):  # Ensure habit is a dictionary
-            # Exclude fields (_id, habit_id, start_date)
-            filter_habit = {}
-            for key, value in habit.items():
-                if key not in ['_id', 'habit_id', 'start_date']:
-                    filter_habit[key] = value
-            all_habits.append(str(filter_habit))  # Add the filtered habit to the list
+    # The list changes exactly when a habit is created, deleted or bumps its version
+    versions = sorted((habit["habit_id"], habit.get("version", 0))
+                      for habit in Habit.find({"username": username}, {"_id": 0, "habit_id": 1, "version": 1}))
+    if versions == []:
+        return jsonify({"message": "you have no habits yet"}), 404
 
-    if all_habits == []:
-            return jsonify({"message": "you have no habits yet"}), 404
-    return jsonify({"message": all_habits}), 200
+    def compute():
+        # _id, habit_id and start_date are excluded by the projection, never transferred
+        all_habits = [str(habit) for habit in Habit.find({"username": username}, Habit.PUBLIC_PROJECTION)]
+        return jsonify({"message": all_habits}), 200
+
+    return conditional_response(response_tag(username, versions), compute)
+
+
+@habit.route("/dashboard", methods=['GET'], strict_slashes=False)
+@jwt_required()
+@reads_from_secondaries
+def dashboard():
+    """ All habits of the authenticated user with streak, adherence and last log, in one call. """
+    username = get_jwt_identity()
+    habits = HabitEngine().dashboard(username)
+    if habits == []:
+        return jsonify({"message": "you have no habits yet"}), 404
+    return jsonify({"message": "Dashboard retrieved successfully", "habits": habits}), 200
 
 
 @habit.route("/details", methods=["GET"], strict_slashes=False)
@@ -98,18 +145,16 @@ def habit_details():
     """ Get detailed information about a specific habit. """
     username = get_jwt_identity()
     habit_name = request.json.get("habit_name")
-    details = Habit.habits.find_one({"username": username, "habit_name": habit_name})
-    filtered_habit = []
-    filtered_attr = {}
-    if details:
-        for key, value in details.items():
-            if key not in ['_id', 'habit_id', 'start_date']:
-                filtered_attr[key] = value
-        filtered_habit.append(filtered_attr)
-        return jsonify({"message": filtered_habit}), 200
-    else:
+    habit = HabitRepository.current().find_by_name(username, habit_name)
+    if not habit:
         return jsonify({"message": "Habit not found"}), 404
 
+    def compute():
+        details = Habit.habits.find_one({"habit_id": habit["habit_id"]}, Habit.PUBLIC_PROJECTION)
+        return jsonify({"message": [details]}), 200
+
+    return conditional_response(habit_tag(habit), compute)
+
 
 @habit.route("/status", methods=["GET", "PUT"], strict_slashes=False)
 @jwt_required()
@@ -118,7 +163,7 @@ def habit_status():
 
     username = get_jwt_identity()
     habit_name = request.json.get("habit_name")
-    habit = Habit.habits.find_one({"username": username, "habit_name": habit_name})
+    habit = HabitRepository.current().find_by_name(username, habit_name)
 
     if not habit:
         return jsonify({"message": "Habit not found"}), 404
@@ -141,7 +186,7 @@ def habit_frequency():
     username = get_jwt_identity()
     new_frequency = request.json.get("new_frequency")
     habit_name = request.json.get("habit_name")
-    habit = Habit.habits.find_one({"username": username, "habit_name": habit_name})
+    habit = HabitRepository.current().find_by_name(username, habit_name)
     if habit:
         habit_obj = Habit(username=username, habit_name=habit_name)
         frequency = habit_obj.habit_frequency(habit_name)
@@ -154,8 +199,9 @@ def habit_frequency():
             else:
                 Habit.habits.update_one(
                         {"habit_id": habit["habit_id"]},
-                        {"$set": {"frequency": new_frequency}}
+                        {"$set": {"frequency": new_frequency}, "$inc": {"version": 1}}
                         )
+                HabitRepository.current().forget(username, habit_name)
                 return jsonify({"message": f"{new_frequency} frequency submitted successfully"}), 201
     else:
         return jsonify({"message": "Habit not found"}), 404
@@ -164,12 +210,13 @@ def habit_frequency():
 
 @habit.route("/log", methods=['POST', 'GET'], strict_slashes=False)
 @jwt_required()
+@reads_from_secondaries
 def habit_log():
     habit_name = request.json.get("habit_name") # This should be included in the request body
     username = get_jwt_identity()
 
     # Fetch the habit from the MongoDB database
-    habit = Habit.habits.find_one({"username": username, "habit_name": habit_name})
+    habit = HabitRepository.current().find_by_name(username, habit_name)
 
     if not habit:
         return jsonify({"message": "Habit not found"}), 404  # Return 404 if habit doesn't exist
@@ -190,27 +237,95 @@ def habit_log():
             return {"message": f"Error posting log: {str(e)}"}, 500
 
     elif request.method == 'GET':
-        # Fetch log history for the given habit_id
-        logs = HabitEngine().log_history(habit_id=str(habit_id))
-        # Process each log item
-        
-        list_logs = []
-        for log in logs:
-            formatted_log = {}
-            for k, v in log.items():
-                if k == "_id":
-                    formatted_log[k] = str(v)  # Convert _id to string
-                elif k == "timestamp":
-                    formatted_log[k] = v.isoformat()  # Convert timestamp to ISO format
-                else:
-                    formatted_log[k] = v  # Add other values as they are
-            list_logs.append(formatted_log) # Append formatted log to the list isinstance(list_logs, list):  # Ensure logs are returned in the correct format (list of dicts)
-        if isinstance(list_logs, list):
-            if list_logs == []:
-                return {"message": "No logs found"}, 404
-            return jsonify(list_logs), 200
-        else:
-            return jsonify({"message": f"{logs} is not in the correct format"}), 500
+        try:
+            after = parse_timestamp(request.json.get("after"))  # Timestamp of the last log already received
+            limit = int(request.json.get("limit") or LOG_PAGE_SIZE)
+        except (TypeError, ValueError):
+            return jsonify({"message": "after must be an ISO 8601 timestamp and limit a number"}), 400
+        limit = max(1, min(limit, MAX_LOG_PAGE_SIZE))
+
+        fields = request.json.get("fields") or list(LOG_FIELDS)  # Never the internal period and pending flag
+        if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields) or set(fields) - set(LOG_FIELDS):
+            return jsonify({"message": f"fields must be a list of {', '.join(LOG_FIELDS)}"}), 400
+        projection = {field: 1 for field in fields}
+        projection["timestamp"] = 1  # Always returned, it is the pagination key
+        if "_id" not in fields:
+            projection["_id"] = 0
+
+        engine = HabitEngine()
+
+        if request.json.get("format") == "ndjson":
+            # Stream the whole history (from `after`) straight from the cursor, one document per line
+            logs = engine.log_history(habit_id=str(habit_id), after=after, projection=projection)
+
+            encoder = current_app.json
+
+            def generate():
+                for log in logs:
+                    yield encoder.dumps(log) + "\n"
+
+            return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+        # Fetch one extra log to know whether there is a next page
+        logs = engine.log_history(habit_id=str(habit_id), after=after, limit=limit + 1, projection=projection)
+        list_logs = list(logs)  # Encoded as-is by the app's JSON provider
+        has_more = len(list_logs) > limit
+        list_logs = list_logs[:limit]
+
+        if list_logs == [] and not after:
+            return {"message": "No logs found"}, 404
+        response = jsonify(list_logs)
+        if has_more:
+            response.headers["X-Next-After"] = list_logs[-1]["timestamp"].isoformat()
+        return response, 200
+
+
+@habit.route("/log/batch", methods=['POST'], strict_slashes=False)
+@jwt_required()
+def habit_log_batch():
+    """ Post many queued logs at once, e.g. completions recorded by an offline client. """
+    username = get_jwt_identity()
+    entries = request.json.get("logs")
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"message": "logs must be a non-empty list of {habit_name, timestamp}"}), 400
+    if len(entries) > MAX_LOG_BATCH_SIZE:
+        return jsonify({"message": f"A batch can't hold more than {MAX_LOG_BATCH_SIZE} logs"}), 413
+
+    results = HabitEngine().post_logs(username=username, entries=entries)
+    accepted = sum(1 for result in results if result["status"] == 201)
+    return jsonify({"message": f"{accepted} of {len(results)} logs added", "results": results}), 200
+
+
+@habit.route("/export", methods=['GET'], strict_slashes=False)
+@jwt_required()
+def export_habits():
+    """
+    Stream all the user's habits and logs as CSV or JSON lines (query string:
+    format, since, gzip). `since` selects logs by when they were stored, not by
+    their timestamps; the X-Export-Checkpoint header is the `since` of the next export.
+    Reads stay on the primary: a lagging secondary would miss logs stored before the checkpoint.
+    """
+    username = get_jwt_identity()
+    export_format = request.args.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"message": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        since = parse_timestamp(request.args.get("since"))
+    except ValueError:
+        return jsonify({"message": "since must be an ISO 8601 timestamp"}), 400
+    until = export_checkpoint()
+
+    chunks = encode_rows(export_rows(username, since, until), export_format, current_app.json.dumps)
+    filename = f"habits-{username}.{export_format}"
+    mimetype = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    if request.args.get("gzip") in ("1", "true"):
+        chunks, filename, mimetype = gzip_chunks(chunks), filename + ".gz", "application/gzip"
+
+    # No Content-Length: the body goes out with chunked transfer encoding as it is read
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response.headers["X-Export-Checkpoint"] = until.isoformat()
+    return response
 
 
 @habit.route("/streak", methods=['GET'], strict_slashes=False)
@@ -221,12 +336,11 @@ def get_streak():
     username = get_jwt_identity()
 
     # Fetch the habit from the MongoDB database
-    habit = Habit.habits.find_one({"username": username, "habit_name": habit_name})
+    habit = HabitRepository.current().find_by_name(username, habit_name)
     if habit:
         habit_id = habit.get('habit_id')
         engine = HabitEngine()
-        get_streak = engine.streak(habit_id=habit_id)
-        return get_streak
+        return conditional_response(habit_tag(habit), lambda: engine.streak(habit_id=habit_id))
     else:
         return jsonify({"message": "habit not found"}), 404
 
@@ -234,17 +348,165 @@ def get_streak():
 @habit.route("/statistics", methods=['GET'], endpoint="statistics", strict_slashes=False)
 @habit.route("/stats", methods=['GET'], endpoint="stats", strict_slashes=False)
 @jwt_required()
+@reads_from_secondaries
 def get_statistics():
 
 
     habit_name = request.json.get("habit_name") # This should be included in the request body
     username = get_jwt_identity()
     # Fetch the habit from the MongoDB database
-    if not Habit.habits.find_one({"username": username, "habit_name": habit_name}):
+    habit = HabitRepository.current().find_by_name(username, habit_name)
+    if not habit:
         return jsonify({"message": "habit not found"}), 404
     else:
-        habit = Habit.habits.find_one({"username": username, "habit_name": habit_name})
+        try:
+            start = parse_timestamp(request.json.get("start"))  # Optional range start (inclusive)
+            end = parse_timestamp(request.json.get("end"))  # Optional range end (exclusive)
+        except (TypeError, ValueError):
+            return jsonify({"message": "start and end must be ISO 8601 dates"}), 400
         habit_id = habit.get('habit_id')
         engine = HabitEngine()
-        stats = engine.statistics(habit_id=habit_id)
-        return stats
+        return conditional_response(habit_tag(habit, start, end),
+                                    lambda: engine.statistics(habit_id=habit_id, start=start, end=end))
+
+
+@habit.route("/heatmap", methods=['GET'], strict_slashes=False)
+@jwt_required()
+@reads_from_secondaries
+def get_heatmap():
+    """ Completion grid of a habit by day, ISO week or month, bit-packed or run-length encoded. """
+    username = get_jwt_identity()
+    habit_name = request.json.get("habit_name")
+    habit = HabitRepository.current().find_by_name(username, habit_name)
+    if not habit:
+        return jsonify({"message": "habit not found"}), 404
+
+    bucket = request.json.get("bucket") or FREQUENCY_BUCKETS.get(habit.get("frequency"), "day")
+    encoding = request.json.get("encoding") or "bits"
+    if bucket not in HEATMAP_BUCKETS or encoding not in HEATMAP_ENCODINGS:
+        return jsonify({"message": f"bucket must be one of {', '.join(HEATMAP_BUCKETS)} and encoding one of {', '.join(HEATMAP_ENCODINGS)}"}), 400
+    try:
+        start = parse_timestamp(request.json.get("start"))  # Optional range start (inclusive)
+        end = parse_timestamp(request.json.get("end"))  # Optional range end (exclusive)
+    except (TypeError, ValueError):
+        return jsonify({"message": "start and end must be ISO 8601 dates"}), 400
+    # Defaults to the year up to and including today
+    end = end or datetime.datetime.combine(datetime.datetime.utcnow().date(), datetime.time()) + datetime.timedelta(days=1)
+    start = start or end - datetime.timedelta(days=365)
+    if start >= end:
+        return jsonify({"message": "Heatmap range must start before it ends"}), 400
+    if bucket_range(start, end, bucket)[1] > MAX_HEATMAP_PERIODS:
+        return jsonify({"message": f"A heatmap can't cover more than {MAX_HEATMAP_PERIODS} {bucket}s"}), 400
+
+    def compute():
+        grid = heatmap(habit["habit_id"], start, end, bucket, encoding)
+        return jsonify({"message": "Heatmap retrieved successfully", "habit_name": habit_name, **grid}), 200
+
+    return conditional_response(habit_tag(habit, start, end, bucket, encoding), compute)
+
+
+@habit.cli.command("rebuild-rollups")
+@click.option("--username", default=None, help="Only rebuild the habits of this user.")
+@click.option("--missing", is_flag=True, help="Only backfill habits without a rollup (run on every release).")
+def rebuild_rollups(username, missing):
+    """ Recompute habit rollups (streaks, completed periods) from the raw habit_logs. """
+    rebuilt = rebuild_all({"username": username} if username else None, missing=missing)
+    click.echo(f"{'Backfilled' if missing else 'Rebuilt'} rollups for {rebuilt} habit(s)")
+
+
+@habit.cli.command("assign-log-periods")
+@click.option("--username", default=None, help="Only the habits of this user.")
+def assign_log_periods(username):
+    """ Key the logs stored before one-log-per-period was enforced by their period (run once when upgrading). """
+    assigned = assign_periods({"username": username} if username else None)
+    click.echo(f"Assigned periods to {assigned} log(s)")
+
+
+@habit.cli.command("compact-logs")
+@click.option("--older-than-days", default=COMPACT_AFTER_DAYS, show_default=True, help="Compact logs older than this many days.")
+@click.option("--username", default=None, help="Only compact the habits of this user.")
+def compact_logs(older_than_days, username):
+    """ Fold old 'done' logs into one document per habit per year (habit_log_buckets). """
+    report = compact_all({"username": username} if username else None, datetime.timedelta(days=older_than_days))
+    click.echo(f"Compacted {report['logs']} log(s) of {report['habits']} habit(s)")
+
+
+@habit.cli.command("export")
+@click.option("--username", default=None, help="Only export this user (default: every user).")
+@click.option("--format", "export_format", type=click.Choice(EXPORT_FORMATS), default="csv", show_default=True)
+@click.option("--since", default=None, help="Only export logs stored from this ISO 8601 checkpoint on.")
+@click.option("--checkpoint-file", default=None, help="Read --since from this file and store the next one there when done.")
+@click.option("--gzip", "compress", is_flag=True, help="Gzip the output.")
+@click.option("--output", type=click.File("wb"), default="-", help="Output file (default: stdout).")
+def export_command(username, export_format, since, checkpoint_file, compress, output):
+    """ Stream habits and logs as CSV or JSON lines, incrementally with --checkpoint-file. """
+    if since is None and checkpoint_file:
+        try:
+            with open(checkpoint_file) as file:
+                since = file.read().strip() or None
+        except FileNotFoundError:
+            pass
+    until = export_checkpoint()
+    chunks = encode_rows(export_rows(username, parse_timestamp(since), until), export_format, current_app.json.dumps)
+    for chunk in gzip_chunks(chunks) if compress else chunks:  # From the primary, like the endpoint
+        output.write(chunk if compress else chunk.encode())
+    output.flush()
+    if checkpoint_file:
+        with open(checkpoint_file, "w") as file:
+            file.write(until.isoformat())
+    click.echo(f"Exported logs stored up to {until.isoformat()}", err=True)
+
+
+@habit.cli.command("rebuild-leaderboards")
+def reconcile_leaderboards():
+    """ Recompute the Redis leaderboards from habit_logs (after a data repair, or after losing Redis data). """
+    counted = rebuild_leaderboards()
+    click.echo(f"Rebuilt leaderboards from {counted} habit(s)")
+
+
+@habit.cli.command("schedule-reminders")
+@click.option("--username", default=None, help="Only schedule the habits of this user.")
+def schedule_reminders(username):
+    """ Schedule streak reminders from the stored rollups (backfill, or after losing Redis). """
+    scheduled = schedule_all({"username": username} if username else None)
+    click.echo(f"Scheduled reminders for {scheduled} habit(s)")
+
+
+@habit.cli.command("scheduler")
+@click.option("--interval", default=30.0, show_default=True, help="Seconds between ticks.")
+@click.option("--batch", default=1000, show_default=True, help="Reminders claimed per Redis round trip.")
+@click.option("--once", is_flag=True, help="Run a single tick and exit.")
+def run_scheduler(interval, batch, once):
+    """ Send streak reminders on the users' event streams as they fall due. """
+    while True:
+        started = time.monotonic()
+        try:
+            folded = fold_stranded_logs()  # Before reminding anyone of a streak they already kept
+            if folded:
+                click.echo(f"Folded {folded} stranded log(s)")
+            sent = tick(limit=batch)
+            if sent or once:
+                click.echo(f"Sent {sent} reminder(s)")
+        except Exception as e:
+            click.echo(f"Scheduler tick failed: {e}", err=True)
+        if once:
+            return
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+@habit.cli.command("cascade-worker")
+@click.option("--name", default=None, help="Worker name, keeps its in-flight job across restarts (default: $DYNO or host:pid).")
+@click.option("--once", is_flag=True, help="Drain the queue and exit.")
+def run_cascade_worker(name, once):
+    """ Delete or rename the logs of deleted and renamed habits in throttled batches. """
+    work(name=name, once=once, on_job=lambda job, count: click.echo(f"{job['op']} {job['habit_id']}: {count} log(s)"))
+
+
+@habit.cli.command("sweep-orphans")
+@click.option("--dry-run", is_flag=True, help="Only count the orphans.")
+def sweep_orphan_logs(dry_run):
+    """ Reclaim logs, log buckets and rollups left behind by habits deleted before the cascade worker existed. """
+    report = sweep_orphans(dry_run=dry_run)
+    verb = "Found" if dry_run else "Deleted"
+    click.echo(f"{verb} {report['logs']} log(s), {report['buckets']} log bucket(s) and {report['rollups']} rollup(s) "
+               f"of {report['habits']} deleted habit(s)")
@@ -0,0 +1,166 @@
+from bson import ObjectId
+from database import Habit, Habit_Log, Habit_Log_Bucket
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional
+import heapq
+import itertools
+import os
+import time
+
+COMPACT_AFTER_DAYS = int(os.getenv("LOG_COMPACT_AFTER_DAYS", 365))  # Logs older than this are compacted
+COMPACT_BATCH_SIZE = int(os.getenv("LOG_COMPACT_BATCH_SIZE", 1000))  # Logs moved per round trip
+COMPACT_PAUSE_SECONDS = float(os.getenv("LOG_COMPACT_PAUSE_SECONDS", 0.05))  # Pause between batches
+
+
+def _project(log: dict, projection: Optional[Dict[str, int]]) -> dict:
+    if not projection:
+        return log
+    return {field: value for field, value in log.items() if projection.get(field)}
+
+
+def compacted_logs(habit_id: str, after: Optional[datetime] = None,
+                   projection: Optional[Dict[str, int]] = None,
+                   stored_since: Optional[datetime] = None,
+                   stored_until: Optional[datetime] = None) -> Iterator[dict]:
+    """
+    The habit's compacted logs after `after`, oldest first, shaped like habit_logs
+    documents (without an _id). Only buckets holding a later log are read, and with
+    `stored_since` / `stored_until` only buckets whose latest log was stored
+    (inserted) in [stored_since, stored_until).
+    """
+    query: dict = {"habit_id": habit_id}
+    if after:
+        query["last"] = {"$gt": after}
+    stored: dict = {}
+    if stored_since:
+        stored["$gte"] = stored_since
+    if stored_until:
+        stored["$lt"] = stored_until
+    if stored:
+        query["stored"] = stored
+    for bucket in Habit_Log_Bucket.habit_log_buckets.find(query).sort("year", 1):
+        for timestamp in sorted(bucket["timestamps"]):
+            if after is None or timestamp > after:
+                yield _project({
+                    "username": bucket["username"],
+                    "habit_name": bucket["habit_name"],
+                    "habit_id": habit_id,
+                    "timestamp": timestamp,
+                    "log": "done",
+                }, projection)
+
+
+def _unique_by_timestamp(logs: Iterable[dict]) -> Iterator[dict]:
+    """ Drop repeated timestamps: a log seen twice while its compaction batch was in flight. """
+    previous = None
+    for log in logs:
+        if log["timestamp"] != previous:
+            previous = log["timestamp"]
+            yield log
+
+
+def read_logs(habit_id: str, after: Optional[datetime] = None, limit: Optional[int] = None,
+              projection: Optional[Dict[str, int]] = None) -> Iterator[dict]:
+    """
+    Logs of a habit oldest first, compacted and raw merged by timestamp.
+    `projection` must keep the timestamp.
+    """
+    query: dict = {'habit_id': habit_id}
+    if after:
+        query['timestamp'] = {'$gt': after}
+    raw = Habit_Log.habit_logs.find(query, projection).sort('timestamp', 1)
+    if limit:
+        raw = raw.limit(limit)
+    logs = _unique_by_timestamp(heapq.merge(
+        compacted_logs(habit_id, after, projection), raw, key=lambda log: log["timestamp"]
+    ))
+    return itertools.islice(logs, limit) if limit else logs
+
+
+def stored_logs(habit_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                projection: Optional[Dict[str, int]] = None) -> Iterator[dict]:
+    """
+    Logs of a habit stored (inserted) in [since, until), by their ObjectId, whatever
+    their own timestamps: a batch replayed today with last week's timestamps is
+    in today's range. Oldest timestamp first, compacted and raw merged; compacted
+    logs come with their whole bucket (year), in the range of the bucket's latest
+    log, so they may repeat across ranges.
+    `projection` must keep the timestamp.
+    """
+    query: dict = {'habit_id': habit_id}
+    stored: dict = {}
+    if since:
+        stored['$gte'] = ObjectId.from_datetime(since)
+    if until:
+        stored['$lt'] = ObjectId.from_datetime(until)
+    if stored:
+        query['_id'] = stored
+    raw = Habit_Log.habit_logs.find(query, projection).sort('timestamp', 1)
+    return _unique_by_timestamp(heapq.merge(
+        compacted_logs(habit_id, projection=projection, stored_since=since, stored_until=until), raw, key=lambda log: log["timestamp"]
+    ))
+
+
+def _stored_at(log: dict) -> datetime:
+    """ When a habit_logs document was inserted (naive UTC, like the timestamps), from its ObjectId. """
+    return log["_id"].generation_time.replace(tzinfo=None)
+
+
+def done_timestamps(habit_id: str) -> Iterator[datetime]:
+    """ Timestamps of the habit's 'done' logs, compacted and raw, in ascending order. """
+    raw = Habit_Log.habit_logs.find({"habit_id": habit_id, "log": "done"}, {"_id": 0, "timestamp": 1}).sort("timestamp", 1)
+    logs = heapq.merge(
+        compacted_logs(habit_id, projection={"timestamp": 1}),
+        (log for log in raw if log.get("timestamp")),
+        key=lambda log: log["timestamp"],
+    )
+    return (log["timestamp"] for log in _unique_by_timestamp(logs))
+
+
+def compact_habit(habit: dict, before: datetime, batch_size: int = COMPACT_BATCH_SIZE,
+                  pause: float = COMPACT_PAUSE_SECONDS) -> int:
+    """
+    Move the habit's 'done' logs older than `before` into its yearly buckets,
+    `batch_size` at a time; pending logs stay until they are folded into the
+    rollup. Each batch is added to the buckets before it is deleted from
+    habit_logs, and adding is idempotent, so an interrupted run loses nothing
+    and is simply run again. Buckets keep the latest insertion
+    time of the logs moved in (`stored`), for incremental exports. Returns how
+    many logs were moved.
+    """
+    habit_id = habit["habit_id"]
+    moved = 0
+    while True:
+        logs = list(Habit_Log.habit_logs.find(
+            {"habit_id": habit_id, "log": "done", "pending": {"$ne": True}, "timestamp": {"$lt": before}}, {"_id": 1, "timestamp": 1}
+        ).sort("timestamp", 1).limit(batch_size))
+        if not logs:
+            return moved
+        years: Dict[int, List[dict]] = {}
+        for log in logs:
+            years.setdefault(log["timestamp"].year, []).append(log)
+        for year, year_logs in years.items():  # A batch spans a year or two
+            Habit_Log_Bucket.habit_log_buckets.update_one({"habit_id": habit_id, "year": year}, {
+                "$set": {"username": habit["username"], "habit_name": habit["habit_name"]},
+                "$addToSet": {"timestamps": {"$each": [log["timestamp"] for log in year_logs]}},
+                "$max": {"last": year_logs[-1]["timestamp"], "stored": max(_stored_at(log) for log in year_logs)},
+            }, upsert=True)
+        Habit_Log.habit_logs.delete_many({"_id": {"$in": [log["_id"] for log in logs]}})
+        moved += len(logs)
+        time.sleep(pause)
+
+
+def compact_all(query: Optional[dict] = None, older_than: timedelta = timedelta(days=COMPACT_AFTER_DAYS),
+                batch_size: int = COMPACT_BATCH_SIZE, pause: float = COMPACT_PAUSE_SECONDS) -> Dict[str, int]:
+    """
+    Compact the logs older than `older_than` of every habit matching `query`.
+    Returns how many habits had logs moved and how many logs were moved.
+    """
+    before = datetime.utcnow() - older_than
+    report = {"habits": 0, "logs": 0}
+    for habit in Habit.find(query or {}, {"_id": 0, "habit_id": 1, "username": 1, "habit_name": 1}):
+        moved = compact_habit(habit, before, batch_size, pause)
+        if moved:
+            report["habits"] += 1
+            report["logs"] += moved
+    return report
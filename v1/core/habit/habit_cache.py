@@ -0,0 +1,103 @@
+from database import get_redis, primary_reads
+from datetime import datetime
+from flask import current_app, make_response, request
+from typing import Callable, Optional
+from .habit_periods import FREQUENCIES, period_start
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Encoded response bodies by ETag, and their last use (member = ETag, score = unix time)
+CACHE_KEY = "cache:response:{etag}"
+CACHE_LRU_KEY = "cache:response:lru"
+
+CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 3600))  # Unused entries expire after this
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 10000))  # Least recently used beyond this are evicted, 0 disables
+CACHE_MAX_BODY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BODY_BYTES", 64 * 1024))  # Larger bodies aren't cached
+
+
+def _cache_redis():
+    return get_redis(os.getenv("RESPONSE_CACHE_REDIS_URL"))  # Defaults to REDIS_URL
+
+
+def response_tag(*parts) -> str:
+    """ ETag of the current endpoint's response for `parts` (habit ids, versions, request options). """
+    key = json.dumps([request.endpoint, *parts], default=str, separators=(",", ":"))
+    return hashlib.sha1(key.encode()).hexdigest()[:32]
+
+
+def habit_tag(habit: dict, *parts, now: Optional[datetime] = None) -> str:
+    """
+    ETag of a response computed from one habit: changes with the habit's version
+    and with the current period, since streaks lapse and periods accrue without writes.
+    """
+    now = now or datetime.utcnow()
+    frequency = habit.get("frequency")
+    period = period_start(now, frequency) if frequency in FREQUENCIES else now.date()
+    return response_tag(habit["habit_id"], habit.get("version", 0), period, *parts)
+
+
+def _cached(etag: str) -> Optional[str]:
+    if CACHE_MAX_ENTRIES <= 0:
+        return None
+    try:
+        pipe = _cache_redis().pipeline(transaction=False)
+        pipe.getex(CACHE_KEY.format(etag=etag), ex=CACHE_TTL_SECONDS)
+        pipe.zadd(CACHE_LRU_KEY, {etag: time.time()}, xx=True)
+        body, _ = pipe.execute()
+        return body
+    except Exception as e:
+        logger.warning("Response cache read failed: %s", e)
+        return None
+
+
+def _store(etag: str, body: bytes):
+    if CACHE_MAX_ENTRIES <= 0 or len(body) > CACHE_MAX_BODY_BYTES:
+        return
+    try:
+        client = _cache_redis()
+        now = time.time()
+        pipe = client.pipeline(transaction=False)
+        pipe.set(CACHE_KEY.format(etag=etag), body, ex=CACHE_TTL_SECONDS)
+        pipe.zadd(CACHE_LRU_KEY, {etag: now})
+        pipe.zremrangebyscore(CACHE_LRU_KEY, "-inf", now - CACHE_TTL_SECONDS)  # Their bodies have expired
+        pipe.zcard(CACHE_LRU_KEY)
+        size = pipe.execute()[-1]
+        if size > CACHE_MAX_ENTRIES:
+            evicted = [member for member, _ in client.zpopmin(CACHE_LRU_KEY, size - CACHE_MAX_ENTRIES)]
+            if evicted:
+                client.delete(*(CACHE_KEY.format(etag=member) for member in evicted))
+    except Exception as e:
+        logger.warning("Response cache write failed: %s", e)
+
+
+def conditional_response(etag: str, compute: Callable[[], object]):
+    """
+    Answer a GET whose body is fully determined by `etag`: 304 when the client
+    already holds it (If-None-Match), else the cached body, else `compute()`
+    (any view return value). Only 200 responses get the ETag and are cached.
+    Cache failures are logged and the body is computed as if it were a miss.
+
+    `compute()` always reads from the primary, even in a reads_from_secondaries
+    view: a secondary behind the one that served the habit's version would cache
+    an older body under the newer ETag, and hits keep it alive.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        body = _cached(etag)
+        if body is not None:
+            response = current_app.response_class(body, mimetype="application/json")
+        else:
+            with primary_reads():
+                response = make_response(compute())
+            if response.status_code != 200:
+                return response
+            _store(etag, response.get_data())
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"  # Revalidate every time, never in shared caches
+    return response
@@ -0,0 +1,166 @@
+from database import Habit, Habit_Log, Habit_Log_Bucket, Habit_Rollup, get_redis
+from typing import Callable, Iterable, List, Optional
+import json
+import logging
+import os
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+# Pending cascade jobs; a worker moves each one to its own processing list until it is done
+JOBS_KEY = "cascade:jobs"
+PROCESSING_PREFIX = "cascade:processing:"
+
+BATCH_SIZE = int(os.getenv("CASCADE_BATCH_SIZE", 1000))  # Logs deleted or rewritten per round trip
+PAUSE_SECONDS = float(os.getenv("CASCADE_PAUSE_SECONDS", 0.05))  # Pause between batches, leaves room for requests
+
+
+def enqueue(*jobs: dict):
+    """
+    Queue cascade jobs for the worker. Failures are logged, never raised: logs
+    left behind are reclaimed by `flask habit sweep-orphans`.
+    """
+    if not jobs:
+        return
+    try:
+        get_redis().lpush(JOBS_KEY, *(json.dumps(job) for job in jobs))
+    except Exception as e:
+        logger.warning("Could not queue %d cascade job(s): %s", len(jobs), e)
+
+
+def habits_deleted(habits: Iterable[dict]):
+    """
+    Drop the rollups and compacted logs of deleted habits now (a few documents
+    each) and queue their raw logs for deletion.
+    """
+    habit_ids = [habit["habit_id"] for habit in habits if habit.get("habit_id")]
+    if habit_ids:
+        Habit_Rollup.habit_rollups.delete_many({"habit_id": {"$in": habit_ids}})
+        Habit_Log_Bucket.habit_log_buckets.delete_many({"habit_id": {"$in": habit_ids}})
+        enqueue(*({"op": "delete", "habit_id": habit_id} for habit_id in habit_ids))
+
+
+def habit_renamed(habit_id: str, new_habit_name: str):
+    """ Queue the rewrite of the denormalised habit_name of a renamed habit's logs. """
+    enqueue({"op": "rename", "habit_id": habit_id, "habit_name": new_habit_name})
+
+
+def delete_logs(habit_ids: List[str], batch_size: int = BATCH_SIZE, pause: float = PAUSE_SECONDS) -> int:
+    """
+    Delete every log of `habit_ids`, `batch_size` at a time, pausing between
+    batches so a long history never holds the database for long. Returns the count.
+    """
+    deleted = 0
+    while True:
+        ids = [log["_id"] for log in Habit_Log.habit_logs.find({"habit_id": {"$in": habit_ids}}, {"_id": 1}).limit(batch_size)]
+        if not ids:
+            return deleted
+        deleted += Habit_Log.habit_logs.delete_many({"_id": {"$in": ids}}).deleted_count
+        time.sleep(pause)
+
+
+def rename_logs(habit_id: str, habit_name: str, batch_size: int = BATCH_SIZE, pause: float = PAUSE_SECONDS) -> int:
+    """ Rewrite habit_name on the habit's logs in batches (see delete_logs). Returns the count. """
+    renamed = 0
+    while True:
+        ids = [log["_id"] for log in Habit_Log.habit_logs.find(
+            {"habit_id": habit_id, "habit_name": {"$ne": habit_name}}, {"_id": 1}
+        ).limit(batch_size)]
+        if not ids:
+            return renamed
+        renamed += Habit_Log.habit_logs.update_many(
+            {"_id": {"$in": ids}, "habit_id": habit_id}, {"$set": {"habit_name": habit_name}}
+        ).modified_count
+        time.sleep(pause)
+
+
+def run_job(job: dict) -> int:
+    """ Apply one cascade job; jobs are idempotent, so replaying one is harmless. """
+    if job.get("op") == "delete":
+        if Habit.habits.find_one({"habit_id": job["habit_id"]}, {"_id": 1}):
+            return 0  # Never delete the logs of a live habit
+        return delete_logs([job["habit_id"]])
+    if job.get("op") == "rename":
+        habit = Habit.habits.find_one({"habit_id": job["habit_id"]}, {"_id": 0, "habit_name": 1})
+        if not habit:
+            return 0
+        Habit_Log_Bucket.habit_log_buckets.update_many({"habit_id": job["habit_id"]}, {"$set": {"habit_name": habit["habit_name"]}})
+        return rename_logs(job["habit_id"], habit["habit_name"])  # The current name wins over queued ones
+    logger.warning("Unknown cascade job %s", job)
+    return 0
+
+
+def worker_name() -> str:
+    return os.getenv("DYNO") or f"{socket.gethostname()}:{os.getpid()}"
+
+
+def work(name: Optional[str] = None, once: bool = False, wait: int = 5,
+         on_job: Optional[Callable[[dict, int], None]] = None):
+    """
+    Process cascade jobs until stopped (or until the queue is empty with `once`).
+    Each job sits on this worker's processing list while it runs, so jobs of a
+    worker that died are picked up again when a worker of the same name starts.
+    """
+    client = get_redis()
+    processing = PROCESSING_PREFIX + (name or worker_name())
+    while client.lmove(processing, JOBS_KEY, "RIGHT", "RIGHT"):
+        pass  # Requeue what this worker was doing when it stopped
+    while True:
+        raw = client.lmove(JOBS_KEY, processing, "RIGHT", "LEFT") if once else client.blmove(JOBS_KEY, processing, wait, "RIGHT", "LEFT")
+        if raw is None:
+            if once:
+                return
+            continue
+        job = json.loads(raw)
+        try:
+            count = run_job(job)
+        except Exception as e:
+            logger.warning("Cascade job %s failed, requeued: %s", job, e)
+            client.lmove(processing, JOBS_KEY, "LEFT", "LEFT")
+            time.sleep(wait)
+            continue
+        client.lrem(processing, 1, raw)
+        if on_job:
+            on_job(job, count)
+
+
+def sweep_orphans(dry_run: bool = False, chunk: int = 1000) -> dict:
+    """
+    Reclaim logs, compacted logs and rollups whose habit no longer exists. Streams
+    the distinct habit ids of each collection (index scans) and checks them
+    against habits in chunks. Returns the orphan counts.
+    """
+    report = {"habits": 0, "logs": 0, "buckets": 0, "rollups": 0}
+    counted = set()  # A dry run deletes nothing, so the rollup pass would count the log pass' orphans again
+
+    def reclaim(habit_ids: List[str]):
+        live = {habit["habit_id"] for habit in Habit.habits.find({"habit_id": {"$in": habit_ids}}, {"_id": 0, "habit_id": 1})}
+        orphans = [habit_id for habit_id in habit_ids if habit_id not in live and habit_id not in counted]
+        if not orphans:
+            return
+        report["habits"] += len(orphans)
+        if dry_run:
+            counted.update(orphans)
+            report["logs"] += Habit_Log.habit_logs.count_documents({"habit_id": {"$in": orphans}})
+            report["buckets"] += Habit_Log_Bucket.habit_log_buckets.count_documents({"habit_id": {"$in": orphans}})
+            report["rollups"] += Habit_Rollup.habit_rollups.count_documents({"habit_id": {"$in": orphans}})
+        else:
+            report["logs"] += delete_logs(orphans)
+            report["buckets"] += Habit_Log_Bucket.habit_log_buckets.delete_many({"habit_id": {"$in": orphans}}).deleted_count
+            report["rollups"] += Habit_Rollup.habit_rollups.delete_many({"habit_id": {"$in": orphans}}).deleted_count
+
+    for collection in (Habit_Log.habit_logs, Habit_Log_Bucket.habit_log_buckets, Habit_Rollup.habit_rollups):
+        pending: List[str] = []
+        for group in collection.aggregate([
+            {"$sort": {"habit_id": 1}},
+            {"$group": {"_id": "$habit_id"}},
+        ], allowDiskUse=True):
+            if group["_id"] is not None:
+                pending.append(group["_id"])
+            if len(pending) >= chunk:
+                reclaim(pending)
+                pending = []
+        if pending:
+            reclaim(pending)
+    return report
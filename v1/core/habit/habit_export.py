@@ -0,0 +1,106 @@
+from database import Habit
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Iterator, Optional
+from .habit_buckets import stored_logs
+import csv
+import io
+import itertools
+import os
+import zlib
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+# One row per habit followed by one row per log; unused fields are left empty
+EXPORT_FIELDS = ('type', 'username', 'habit_id', 'habit_name', 'frequency', 'status', 'start_date', 'timestamp', 'log')
+HABIT_PAGE_SIZE = 1000  # Habits read per query, so no cursor stays open for the whole export
+GZIP_CHUNK_SIZE = 64 * 1024  # Compressed bytes buffered before a chunk is sent
+# Logs stored in the last seconds are left to the next export: inserts still in
+# flight, and ObjectIds made by app servers whose clocks run a little behind
+EXPORT_CHECKPOINT_LAG_SECONDS = int(os.getenv("EXPORT_CHECKPOINT_LAG_SECONDS", 60))
+
+
+def _habits(username: Optional[str]) -> Iterator[dict]:
+    """ Habits of `username` (or of every user) in keyset pages. """
+    query: dict = {"username": username} if username else {}
+    key = "habit_name" if username else "habit_id"  # Served by (username, habit_name) / (habit_id)
+    last = None
+    while True:
+        page_query = {**query, key: {"$gt": last}} if last is not None else query
+        page = list(Habit.find(page_query, {"_id": 0}).sort(key, 1).limit(HABIT_PAGE_SIZE))
+        yield from page
+        if len(page) < HABIT_PAGE_SIZE:
+            return
+        last = page[-1][key]
+
+
+def export_checkpoint(now: Optional[datetime] = None) -> datetime:
+    """
+    The `until` of an export started `now`, and the `since` of the next one:
+    EXPORT_CHECKPOINT_LAG_SECONDS ago, whole seconds like ObjectId times.
+    """
+    now = now or datetime.utcnow()
+    return (now - timedelta(seconds=EXPORT_CHECKPOINT_LAG_SECONDS)).replace(microsecond=0)
+
+
+def export_rows(username: Optional[str] = None, since: Optional[datetime] = None,
+                until: Optional[datetime] = None) -> Iterator[dict]:
+    """
+    Every habit of `username` (or of every user) followed by its logs, raw and
+    compacted, stored (inserted) from `since` and before `until`, whatever their
+    timestamps. Habit rows are always included. Rows are produced one at a time
+    from the cursors, so memory use doesn't depend on the size of the export.
+    """
+    for habit in _habits(username):
+        yield {
+            "type": "habit",
+            "username": habit["username"],
+            "habit_id": habit["habit_id"],
+            "habit_name": habit["habit_name"],
+            "frequency": habit.get("frequency"),
+            "status": habit.get("status"),
+            "start_date": habit.get("start_date"),
+        }
+        for log in stored_logs(habit["habit_id"], since, until, projection={"_id": 0, "timestamp": 1, "log": 1}):
+            yield {
+                "type": "log",
+                "username": habit["username"],
+                "habit_id": habit["habit_id"],
+                "habit_name": habit["habit_name"],  # The current name, even before a rename reached the logs
+                "timestamp": log["timestamp"],
+                "log": log.get("log"),
+            }
+
+
+def encode_rows(rows: Iterable[dict], export_format: str, dumps: Callable[[dict], str]) -> Iterator[str]:
+    """ Encode rows as CSV (with a header line) or JSON lines, one string per row. """
+    if export_format == 'jsonl':
+        for row in rows:
+            yield dumps(row) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in itertools.chain([None], rows):
+        if row is not None:
+            writer.writerow({field: value.isoformat() if isinstance(value, datetime) else value
+                             for field, value in row.items()})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def gzip_chunks(chunks: Iterable[str]) -> Iterator[bytes]:
+    """ Gzip a stream of strings, yielding a compressed chunk every GZIP_CHUNK_SIZE bytes or so. """
+    compressor = zlib.compressobj(wbits=31)  # 31: gzip header and trailer
+    pending = []
+    size = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            pending.append(data)
+            size += len(data)
+        if size >= GZIP_CHUNK_SIZE:
+            yield b"".join(pending)
+            pending, size = [], 0
+    pending.append(compressor.flush())
+    yield b"".join(pending)
@@ -0,0 +1,108 @@
+from database import Habit_Log, Habit_Log_Bucket
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Tuple, Union
+import base64
+import itertools
+import numpy as np
+
+HEATMAP_BUCKETS = ('day', 'week', 'month')
+HEATMAP_ENCODINGS = ('bits', 'rle')
+# Default bucket of each habit frequency
+FREQUENCY_BUCKETS = {'daily': 'day', 'weekly': 'week', 'monthly': 'month'}
+MAX_HEATMAP_PERIODS = 10000  # About 27 years of days
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def day_numbers(timestamps: Iterable[datetime]) -> np.ndarray:
+    """
+    The day of each timestamp as datetime64[D]. Buckets never need a finer unit, and
+    toordinal() is much cheaper than NumPy converting datetime objects one by one.
+    """
+    ordinals = np.fromiter((timestamp.toordinal() for timestamp in timestamps), dtype=np.int64)
+    return (ordinals - EPOCH_ORDINAL).astype('datetime64[D]')
+
+
+def done_days_between(habit_id: str, start: datetime, end: datetime) -> np.ndarray:
+    """
+    Days of the habit's 'done' logs, raw and compacted, in [start, end), unordered
+    and possibly repeated. Only timestamps are read from MongoDB.
+    """
+    raw = Habit_Log.habit_logs.find(
+        {"habit_id": habit_id, "log": "done", "timestamp": {"$gte": start, "$lt": end}}, {"_id": 0, "timestamp": 1}
+    )
+    last_year = (end - timedelta(milliseconds=1)).year
+    buckets = Habit_Log_Bucket.habit_log_buckets.find(
+        {"habit_id": habit_id, "year": {"$gte": start.year, "$lte": last_year}}, {"_id": 0, "timestamps": 1}
+    )
+    return day_numbers(itertools.chain(
+        (log["timestamp"] for log in raw),
+        # Buckets hold whole years
+        (timestamp for bucket in buckets for timestamp in bucket["timestamps"] if start <= timestamp < end),
+    ))
+
+
+def bucket_numbers(days: np.ndarray, bucket: str) -> np.ndarray:
+    """ Number of the day, ISO week (starting Monday) or month of each datetime64[D] day, counted from the Unix epoch. """
+    if bucket == 'month':
+        return days.astype('datetime64[M]').astype(np.int64)
+    numbers = days.astype(np.int64)
+    if bucket == 'week':
+        return (numbers + 3) // 7  # 1970-01-01 was a Thursday: weeks since Monday 1969-12-29
+    return numbers
+
+
+def bucket_start(number: int, bucket: str) -> str:
+    """ ISO date of the first day of a bucket number. """
+    if bucket == 'month':
+        return str(np.datetime64(number, 'M').astype('datetime64[D]'))
+    if bucket == 'week':
+        return str(np.datetime64(number * 7 - 3, 'D'))
+    return str(np.datetime64(number, 'D'))
+
+
+def bucket_range(start: datetime, end: datetime, bucket: str) -> Tuple[int, int]:
+    """ First bucket number and number of buckets covering [start, end). """
+    first, last = bucket_numbers(day_numbers([start, end - timedelta(milliseconds=1)]), bucket)
+    return int(first), int(last - first + 1)
+
+
+def completion_grid(days: np.ndarray, first: int, periods: int, bucket: str) -> np.ndarray:
+    """ One boolean per bucket from `first`: True when at least one of the days falls in it. """
+    grid = np.zeros(periods, dtype=bool)
+    grid[bucket_numbers(days, bucket) - first] = True
+    return grid
+
+
+def run_lengths(grid: np.ndarray) -> List[int]:
+    """ Lengths of the alternating runs of missed and completed buckets, starting with a (possibly empty) missed run. """
+    edges = np.flatnonzero(np.diff(grid.astype(np.int8))) + 1
+    runs = np.diff(np.concatenate(([0], edges, [grid.size])))
+    if grid.size and grid[0]:
+        runs = np.concatenate(([0], runs))
+    return runs.tolist()
+
+
+def encode_grid(grid: np.ndarray, encoding: str) -> Union[str, List[int]]:
+    """ Base64 of the grid packed 8 buckets per byte, first bucket in the high bit, or its run lengths. """
+    if encoding == 'rle':
+        return run_lengths(grid)
+    return base64.b64encode(np.packbits(grid).tobytes()).decode()
+
+
+def heatmap(habit_id: str, start: datetime, end: datetime, bucket: str = 'day',
+            encoding: str = 'bits') -> Dict[str, Union[str, int, List[int]]]:
+    """
+    Completion grid of a habit over [start, end): which days, ISO weeks or
+    months hold at least one 'done' log, bucketed with NumPy datetime64 arithmetic.
+    """
+    first, periods = bucket_range(start, end, bucket)
+    grid = completion_grid(done_days_between(habit_id, start, end), first, periods, bucket)
+    return {
+        "bucket": bucket,
+        "start": bucket_start(first, bucket),
+        "periods": periods,
+        "completed": int(grid.sum()),
+        "encoding": encoding,
+        "data": encode_grid(grid, encoding),
+    }
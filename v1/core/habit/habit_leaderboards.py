@@ -0,0 +1,234 @@
+from database import Habit, Habit_Rollup, get_redis
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from .habit_periods import FREQUENCIES, period_start
+from .habit_buckets import done_timestamps
+from .habit_rollup import fold_log
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Best streak each habit reached in a month, per frequency: member = habit_id, score = streak
+STREAKS_KEY = "leaderboard:streaks:{frequency}:{month}"
+# habit_id -> [username, habit_name] of the habits counted on the boards (names are shown to their owner only)
+HABITS_KEY = "leaderboard:habits"
+# Per normalised habit name and frequency: habits, completed periods and the sum of their first periods
+ADHERENCE_KEY = "leaderboard:adherence:{frequency}:{name}"
+
+LEADERBOARD_MONTHS = 12  # Months of streak boards kept (and cleaned up when a habit is deleted)
+STREAKS_TTL = 400 * 24 * 3600  # A month's board expires after the LEADERBOARD_MONTHS that follow it
+
+
+def month_of(moment: datetime) -> str:
+    return moment.strftime("%Y-%m")
+
+
+def recent_months(now: Optional[datetime] = None) -> List[str]:
+    """ The current month and the LEADERBOARD_MONTHS - 1 before it. """
+    now = now or datetime.utcnow()
+    index = now.year * 12 + now.month - 1
+    return [f"{(index - i) // 12:04d}-{(index - i) % 12 + 1:02d}" for i in range(LEADERBOARD_MONTHS)]
+
+
+def normalise_name(habit_name: str) -> str:
+    """ Habit names are compared across users case- and whitespace-insensitively. """
+    return " ".join(habit_name.lower().split())
+
+
+def period_index(period: datetime, frequency: str) -> int:
+    """ Periods since a fixed Monday, so sums of first periods can be turned back into elapsed periods. """
+    if frequency == 'monthly':
+        return period.year * 12 + period.month - 1
+    days = (period_start(period, frequency) - datetime(1970, 1, 5)).days
+    return days if frequency == 'daily' else days // 7
+
+
+def _count_habit(pipe, habit: dict, rollup: dict, sign: int = 1, prefix: str = ""):
+    """ Add (or with sign=-1 remove) a habit's rollup to its name's adherence counters. """
+    key = prefix + ADHERENCE_KEY.format(frequency=habit["frequency"], name=normalise_name(habit["habit_name"]))
+    pipe.hincrby(key, "habits", sign)
+    pipe.hincrby(key, "completed", sign * rollup.get("completed_count", 0))
+    pipe.hincrby(key, "first", sign * period_index(rollup["first_log_date"], habit["frequency"]))
+
+
+def record_progress(habit: dict, before: Optional[dict], after: dict, timestamps: Iterable[datetime]):
+    """
+    Update the leaderboards after the habit's rollup went from `before` to `after`
+    with the 'done' logs at `timestamps` (ascending): two round trips of O(log n)
+    commands. A habit not on the boards yet (HSETNX of HABITS_KEY) has its whole
+    rollup counted, so a habit logged before the boards existed counts from its
+    real first period. Failures are logged, never raised; `flask habit
+    rebuild-leaderboards` repairs any drift.
+    """
+    if habit.get("frequency") not in FREQUENCIES:
+        return
+    folded = before
+    best: Dict[str, int] = {}
+    for timestamp in timestamps:
+        folded = fold_log(folded, habit["habit_id"], habit["frequency"], timestamp)
+        best[month_of(timestamp)] = max(best.get(month_of(timestamp), 0), folded["current_streak"])
+    # A rollup recomputed from all the logs (no rollup yet, or a replayed gap) has the real streak
+    month = month_of(after["last_log_date"])
+    best[month] = max(best.get(month, 0), after["current_streak"])
+    completed = after.get("completed_count", 0) - (before or {}).get("completed_count", 0)
+    if completed <= 0:
+        return  # Same period, the streak didn't move
+    try:
+        client = get_redis()
+        added = client.hsetnx(HABITS_KEY, habit["habit_id"], json.dumps([habit["username"], habit["habit_name"]]))
+        pipe = client.pipeline(transaction=False)
+        for month, streak in best.items():
+            key = STREAKS_KEY.format(frequency=habit["frequency"], month=month)
+            pipe.zadd(key, {habit["habit_id"]: streak}, gt=True)
+            pipe.expire(key, STREAKS_TTL)
+        if added:
+            _count_habit(pipe, habit, after)
+        else:
+            pipe.hincrby(ADHERENCE_KEY.format(frequency=habit["frequency"], name=normalise_name(habit["habit_name"])),
+                         "completed", completed)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Could not update the leaderboards of habit %s: %s", habit.get("habit_id"), e)
+
+
+def forget_habits(habits: Iterable[dict]):
+    """ Take deleted habits off the leaderboards (call before their rollups are deleted). """
+    habits = {habit["habit_id"]: habit for habit in habits if habit.get("frequency") in FREQUENCIES}
+    if not habits:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for rollup in Habit_Rollup.habit_rollups.find({"habit_id": {"$in": list(habits)}, "first_log_date": {"$ne": None}}):
+            _count_habit(pipe, habits[rollup["habit_id"]], rollup, -1)
+        for month in recent_months():
+            for frequency in FREQUENCIES:
+                members = [habit_id for habit_id, habit in habits.items() if habit["frequency"] == frequency]
+                if members:
+                    pipe.zrem(STREAKS_KEY.format(frequency=frequency, month=month), *members)
+        pipe.hdel(HABITS_KEY, *habits)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Could not remove %d habit(s) from the leaderboards: %s", len(habits), e)
+
+
+def rename_on_leaderboards(habit: dict, new_habit_name: str):
+    """ Show a renamed habit under its new name and move its adherence to the new name's counters. """
+    if habit.get("frequency") not in FREQUENCIES:
+        return
+    try:
+        client = get_redis()
+        if not client.hexists(HABITS_KEY, habit["habit_id"]):
+            return  # Never logged
+        pipe = client.pipeline()  # MULTI/EXEC: counted under exactly one name
+        pipe.hset(HABITS_KEY, habit["habit_id"], json.dumps([habit["username"], new_habit_name]))
+        rollup = Habit_Rollup.find_rollup_by_habit_id(habit["habit_id"])
+        if rollup and rollup.get("first_log_date"):
+            _count_habit(pipe, habit, rollup, -1)
+            _count_habit(pipe, {**habit, "habit_name": new_habit_name}, rollup)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Could not rename habit %s on the leaderboards: %s", habit.get("habit_id"), e)
+
+
+def top_streaks(frequency: str, month: str, limit: int = 10, username: Optional[str] = None) -> List[Dict[str, object]]:
+    """
+    The `limit` best streaks of a month: ZREVRANGE, O(log n + limit). Entries are
+    anonymous (rank and streak); only the habits of `username` carry their name.
+    """
+    client = get_redis()
+    members = client.zrevrange(STREAKS_KEY.format(frequency=frequency, month=month), 0, limit - 1, withscores=True)
+    if not members:
+        return []
+    names = client.hmget(HABITS_KEY, [habit_id for habit_id, _ in members])
+    top = []
+    for rank, ((_, streak), name) in enumerate(zip(members, names), start=1):
+        entry: Dict[str, object] = {"rank": rank, "streak": int(streak)}
+        owner, habit_name = json.loads(name) if name else (None, None)
+        if username and owner == username:
+            entry.update(habit_name=habit_name, yours=True)
+        top.append(entry)
+    return top
+
+
+def streak_rank(habit: dict, month: str) -> Optional[Tuple[int, int, int]]:
+    """ (rank, streak, habits on the board) of a habit in a month's board, O(log n); None when it isn't on it. """
+    key = STREAKS_KEY.format(frequency=habit["frequency"], month=month)
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.zrevrank(key, habit["habit_id"])
+    pipe.zscore(key, habit["habit_id"])
+    pipe.zcard(key)
+    rank, streak, size = pipe.execute()
+    if rank is None:
+        return None
+    return rank + 1, int(streak), size
+
+
+def name_adherence(habit_name: str, frequency: str, now: Optional[datetime] = None) -> Optional[Dict[str, object]]:
+    """ Global adherence of every habit called `habit_name` (any case) with this frequency. """
+    counters = get_redis().hgetall(ADHERENCE_KEY.format(frequency=frequency, name=normalise_name(habit_name)))
+    habits = int(counters.get("habits", 0))
+    if habits <= 0:
+        return None
+    completed = int(counters.get("completed", 0))
+    # Each habit's periods run from its first period to the current one, both included
+    total_periods = habits * (period_index(now or datetime.utcnow(), frequency) + 1) - int(counters.get("first", 0))
+    return {
+        "habit_name": normalise_name(habit_name),
+        "frequency": frequency,
+        "habits": habits,
+        "completed": completed,
+        "total_periods": total_periods,
+        "adherence_rate": round(completed / total_periods * 100, 2) if total_periods > 0 else 0.0,
+    }
+
+
+def rebuild_leaderboards(now: Optional[datetime] = None) -> int:
+    """
+    Recompute every leaderboard from the logs (raw and compacted) into scratch
+    keys, then swap them in with one MULTI/EXEC. Logs accepted while it runs
+    may be missed; run it again after a busy period. Returns how many habits were counted.
+    """
+    client = get_redis()
+    months = set(recent_months(now))
+    scratch = "leaderboard:rebuild:"
+    for key in client.scan_iter(scratch + "*"):
+        client.delete(key)
+
+    written = set()
+    counted = 0
+    pipe = client.pipeline(transaction=False)
+    for habit in Habit.find({"frequency": {"$in": list(FREQUENCIES)}}, {"_id": 0, "habit_id": 1, "username": 1, "habit_name": 1, "frequency": 1}):
+        best: Dict[str, int] = {}
+        rollup: Optional[dict] = None
+        for timestamp in done_timestamps(habit["habit_id"]):
+            rollup = fold_log(rollup, habit["habit_id"], habit["frequency"], timestamp)
+            month = month_of(timestamp)
+            if month in months:
+                best[month] = max(best.get(month, 0), rollup["current_streak"])
+        if not rollup:
+            continue
+        for month, streak in best.items():
+            key = STREAKS_KEY.format(frequency=habit["frequency"], month=month)
+            pipe.zadd(scratch + key, {habit["habit_id"]: streak})
+            written.add(key)
+        pipe.hset(scratch + HABITS_KEY, habit["habit_id"], json.dumps([habit["username"], habit["habit_name"]]))
+        written.add(HABITS_KEY)
+        _count_habit(pipe, habit, rollup, prefix=scratch)
+        written.add(ADHERENCE_KEY.format(frequency=habit["frequency"], name=normalise_name(habit["habit_name"])))
+        counted += 1
+        if counted % 1000 == 0:
+            pipe.execute()
+    pipe.execute()
+
+    swap = client.pipeline()  # MULTI/EXEC: readers see the old boards or the new ones
+    for pattern in ("leaderboard:streaks:*", "leaderboard:adherence:*", HABITS_KEY):
+        for key in client.scan_iter(pattern):
+            if key not in written:
+                swap.delete(key)
+    for key in written:
+        swap.rename(scratch + key, key)
+        if key.startswith("leaderboard:streaks:"):
+            swap.expire(key, STREAKS_TTL)
+    swap.execute()
+    return counted
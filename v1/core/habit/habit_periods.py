@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+
+
+def period_start(timestamp: datetime, frequency: str) -> datetime:
+    """
+    Start of the calendar period (day, ISO week starting Monday, or month) containing `timestamp`.
+    """
+    day = datetime(timestamp.year, timestamp.month, timestamp.day)
+    if frequency == 'daily':
+        return day
+    elif frequency == 'weekly':
+        return day - timedelta(days=day.weekday())
+    elif frequency == 'monthly':
+        return day.replace(day=1)
+    raise ValueError(f"Unsupported frequency '{frequency}'")
+
+
+def shift_period(period: datetime, frequency: str, periods: int = 1) -> datetime:
+    """
+    Move a period start forward (or backward with a negative count) by whole periods.
+    """
+    if frequency == 'daily':
+        return period + timedelta(days=periods)
+    elif frequency == 'weekly':
+        return period + timedelta(weeks=periods)
+    elif frequency == 'monthly':
+        month_index = period.year * 12 + (period.month - 1) + periods
+        return period.replace(year=month_index // 12, month=month_index % 12 + 1)
+    raise ValueError(f"Unsupported frequency '{frequency}'")
+
+
+def periods_between(first: datetime, last: datetime, frequency: str) -> int:
+    """
+    Number of periods from the period of `first` to the period of `last`, both included.
+    """
+    first = period_start(first, frequency)
+    last = period_start(last, frequency)
+    if last < first:
+        return 0
+    if frequency == 'daily':
+        return (last - first).days + 1
+    elif frequency == 'weekly':
+        return (last - first).days // 7 + 1
+    return (last.year - first.year) * 12 + (last.month - first.month) + 1
+
+
+def is_streak_alive(last_period: Optional[datetime], frequency: str, now: datetime) -> bool:
+    """
+    A streak is alive while its last completed period is the current or the previous one.
+    """
+    if last_period is None:
+        return False
+    return last_period >= shift_period(period_start(now, frequency), frequency, -1)
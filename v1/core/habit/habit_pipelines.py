@@ -0,0 +1,101 @@
+from datetime import datetime
+from typing import List, Optional
+
+# $dateTrunc / $dateDiff unit per habit frequency
+PERIOD_UNITS = {'daily': 'day', 'weekly': 'week', 'monthly': 'month'}
+
+
+def _period_unit(frequency: str) -> dict:
+    """ Unit arguments for $dateTrunc/$dateDiff (ISO weeks start on Monday). """
+    unit = {"unit": PERIOD_UNITS[frequency]}
+    if frequency == 'weekly':
+        unit["startOfWeek"] = "monday"
+    return unit
+
+
+def compacted_logs_stages(habit_id: str, in_range: Optional[dict] = None) -> List[dict]:
+    """
+    Stages turning the habit's compacted log buckets back into {timestamp}
+    documents, within `in_range` (a $gte/$lt timestamp condition) when given.
+    """
+    match: dict = {"habit_id": habit_id}
+    if in_range:
+        years = {}
+        if "$gte" in in_range:
+            years["$gte"] = in_range["$gte"].year
+        if "$lt" in in_range:
+            years["$lte"] = in_range["$lt"].year  # Served by the (habit_id, year) index
+        match["year"] = years
+    stages = [
+        {"$match": match},
+        {"$unwind": "$timestamps"},
+        {"$project": {"_id": 0, "timestamp": "$timestamps"}},
+    ]
+    if in_range:
+        stages.append({"$match": {"timestamp": in_range}})
+    return stages
+
+
+def statistics_pipeline(habit_id: str, frequency: str, last_instant: datetime,
+                        start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[dict]:
+    """
+    Aggregation computing total periods, completed periods and adherence of a habit in one round trip.
+
+    'done' logs, raw and compacted, are bucketed by calendar period with $dateTrunc, so
+    each period counts once. Periods are counted from `start` (or the first completed
+    period) up to `last_instant`.
+    """
+    match: dict = {"habit_id": habit_id, "log": "done"}
+    in_range: dict = {}
+    if start or end:
+        match["timestamp"] = in_range
+        if start:
+            in_range["$gte"] = start
+        if end:
+            in_range["$lt"] = end
+
+    unit = _period_unit(frequency)
+    return [
+        {"$match": match},
+        {"$unionWith": {"coll": "habit_log_buckets", "pipeline": compacted_logs_stages(habit_id, in_range)}},
+        {"$group": {"_id": {"$dateTrunc": {"date": "$timestamp", **unit}}}},
+        {"$group": {"_id": None, "completed": {"$sum": 1}, "first_period": {"$min": "$_id"}}},
+        {"$project": {
+            "_id": 0,
+            "completed": 1,
+            "total_periods": {"$add": [
+                {"$dateDiff": {"startDate": start or "$first_period", "endDate": last_instant, **unit}},
+                1,
+            ]},
+        }},
+        {"$set": {
+            "adherence_rate": {"$round": [
+                {"$multiply": [{"$divide": ["$completed", {"$max": ["$total_periods", 1]}]}, 100]}, 2
+            ]},
+        }},
+    ]
+
+
+def dashboard_pipeline(username: str) -> List[dict]:
+    """
+    All habits of a user joined with their rollups, in one round trip.
+    The join uses the unique habit_id index of habit_rollups.
+    """
+    return [
+        {"$match": {"username": username}},
+        {"$sort": {"habit_name": 1}},  # Served by the (username, habit_name) index
+        {"$lookup": {
+            "from": "habit_rollups",
+            "localField": "habit_id",
+            "foreignField": "habit_id",
+            "as": "rollup",
+        }},
+        {"$project": {
+            "_id": 0,
+            "habit_id": 1,
+            "habit_name": 1,
+            "frequency": 1,
+            "status": 1,
+            "rollup": {"$first": "$rollup"},
+        }},
+    ]
@@ -0,0 +1,168 @@
+from database import Habit, get_redis
+from v1.core.events import publish_event
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+from .habit_periods import FREQUENCIES, shift_period
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Sorted set of scheduled reminders: member = encoded habit, score = epoch seconds the reminder is due
+DUE_KEY = "reminders:due"
+
+# How long before a streak breaks its reminder is sent, per frequency
+REMINDER_LEAD = {
+    'daily': timedelta(hours=4),
+    'weekly': timedelta(days=1),
+    'monthly': timedelta(days=3),
+}
+
+
+def _epoch(moment: datetime) -> float:
+    """ Naive UTC datetime (the storage convention) to epoch seconds. """
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _utc(seconds: float) -> datetime:
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).replace(tzinfo=None)
+
+
+def reminder_member(habit: dict) -> str:
+    """
+    Sorted-set member of a habit. It carries everything the reminder needs, so a
+    tick never reads Mongo; it changes (and is moved) when the habit is renamed.
+    """
+    return json.dumps([habit["habit_id"], habit["username"], habit["habit_name"], habit["frequency"]])
+
+
+def streak_deadline(last_period: datetime, frequency: str) -> datetime:
+    """ When a streak whose last completed period is `last_period` breaks: the end of the following period. """
+    return shift_period(last_period, frequency, 2)
+
+
+def schedule_reminder(habit: dict, last_period: datetime):
+    """
+    (Re)schedule the habit's reminder after a log completed `last_period`: one
+    ZADD, replacing any earlier due time. Failures are logged, never raised.
+    """
+    if habit.get("frequency") not in FREQUENCIES:
+        return
+    due = streak_deadline(last_period, habit["frequency"]) - REMINDER_LEAD[habit["frequency"]]
+    try:
+        get_redis().zadd(DUE_KEY, {reminder_member(habit): _epoch(due)})
+    except Exception as e:
+        logger.warning("Could not schedule a reminder for habit %s: %s", habit.get("habit_id"), e)
+
+
+def cancel_reminders(habits: Iterable[dict]):
+    """ Drop the reminders of deleted habits. """
+    members = [reminder_member(habit) for habit in habits if habit.get("frequency") in FREQUENCIES]
+    if not members:
+        return
+    try:
+        get_redis().zrem(DUE_KEY, *members)
+    except Exception as e:
+        logger.warning("Could not cancel %d reminder(s): %s", len(members), e)
+
+
+def rename_reminder(habit: dict, new_habit_name: str):
+    """
+    Move a scheduled reminder to the habit's new name, keeping its due time. The
+    due time is read under WATCH and the move runs in MULTI/EXEC, retried when
+    the set changed in between (e.g. a tick sent the reminder), so the reminder
+    is never lost or duplicated.
+    """
+    if habit.get("frequency") not in FREQUENCIES:
+        return
+    old_member = reminder_member(habit)
+    new_member = reminder_member({**habit, "habit_name": new_habit_name})
+
+    def move(pipe):
+        due = pipe.zscore(DUE_KEY, old_member)
+        if due is None:
+            return  # Not scheduled, or already sent
+        pipe.multi()
+        pipe.zrem(DUE_KEY, old_member)
+        pipe.zadd(DUE_KEY, {new_member: due})
+
+    try:
+        get_redis().transaction(move, DUE_KEY)
+    except Exception as e:
+        logger.warning("Could not rename the reminder of habit %s: %s", habit.get("habit_id"), e)
+
+
+def pop_due(now: Optional[datetime] = None, limit: int = 1000) -> List[Tuple[dict, datetime]]:
+    """
+    Claim up to `limit` reminders due at `now`, as (habit, due time).
+
+    A range query reads only the due members (O(log N + limit), however many
+    habits are scheduled); removing them in one MULTI/EXEC and keeping those
+    this call actually removed lets several schedulers run side by side.
+    """
+    client = get_redis()
+    members = client.zrangebyscore(DUE_KEY, "-inf", _epoch(now or datetime.utcnow()), start=0, num=limit, withscores=True)
+    if not members:
+        return []
+    pipe = client.pipeline()
+    for member, _ in members:
+        pipe.zrem(DUE_KEY, member)
+    removed = pipe.execute()
+
+    claimed = []
+    for (member, due), won in zip(members, removed):
+        if won:
+            habit_id, username, habit_name, frequency = json.loads(member)
+            claimed.append(({"habit_id": habit_id, "username": username, "habit_name": habit_name, "frequency": frequency}, _utc(due)))
+    return claimed
+
+
+def send_reminder(habit: dict, due: datetime):
+    """ Tell the user's open streams that the habit's streak breaks soon. """
+    publish_event(habit["username"], "reminder", {
+        "habit_id": habit["habit_id"],
+        "habit_name": habit["habit_name"],
+        "frequency": habit["frequency"],
+        "deadline": (due + REMINDER_LEAD[habit["frequency"]]).isoformat(),
+    })
+
+
+def tick(now: Optional[datetime] = None, limit: int = 1000) -> int:
+    """ Send every reminder due at `now` (claimed in batches of `limit`), returns how many were sent. """
+    now = now or datetime.utcnow()
+    sent = 0
+    while True:
+        batch = pop_due(now, limit)
+        for habit, due in batch:
+            if due + REMINDER_LEAD[habit["frequency"]] > now:  # Late ticks don't remind about broken streaks
+                send_reminder(habit, due)
+                sent += 1
+        if len(batch) < limit:
+            return sent
+
+
+def schedule_all(query: Optional[dict] = None) -> int:
+    """
+    Schedule the reminders of every habit matching `query` from its rollup (backfill,
+    or recovery after losing Redis). Returns how many were scheduled.
+    """
+    now = datetime.utcnow()
+    scheduled = 0
+    pipe = get_redis().pipeline(transaction=False)
+    for habit in Habit.habits.aggregate([
+        {"$match": query or {}},
+        {"$lookup": {"from": "habit_rollups", "localField": "habit_id", "foreignField": "habit_id", "as": "rollup"}},
+        {"$project": {"_id": 0, "habit_id": 1, "username": 1, "habit_name": 1, "frequency": 1,
+                      "last_period": {"$first": "$rollup.last_period"}}},
+    ]):
+        if habit.get("frequency") not in FREQUENCIES or not habit.get("last_period"):
+            continue
+        deadline = streak_deadline(habit["last_period"], habit["frequency"])
+        if deadline <= now:
+            continue  # Streak already broken
+        pipe.zadd(DUE_KEY, {reminder_member(habit): _epoch(deadline - REMINDER_LEAD[habit["frequency"]])})
+        scheduled += 1
+        if scheduled % 1000 == 0:
+            pipe.execute()
+    pipe.execute()
+    return scheduled
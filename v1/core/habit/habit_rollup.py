@@ -0,0 +1,241 @@
+from bson import ObjectId
+from database import Habit, Habit_Log, Habit_Rollup
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from datetime import datetime
+from typing import Iterable, List, Optional, Dict, Tuple, Union
+import os
+from .habit_periods import FREQUENCIES, period_start, shift_period
+from .habit_buckets import done_timestamps
+
+# Unique keys the log path relies on: one log per habit per period, one rollup per habit
+LOG_PERIOD_KEY = [("habit_id", 1), ("period", 1)]
+ROLLUP_KEY = [("habit_id", 1)]
+
+FOLD_ATTEMPTS = 5  # Reads and rewrites of a rollup changed concurrently before giving up
+FOLD_BATCH_SIZE = int(os.getenv("ROLLUP_FOLD_BATCH_SIZE", 1000))  # Pending logs folded per pass
+
+_checked_indexes = set()
+
+
+class UniqueIndexMissing(Exception):
+    """ A unique index the log path relies on is missing: logs are refused rather than accepted unchecked. """
+
+
+def require_unique_index(collection, keys: List[Tuple[str, int]]):
+    """
+    Fail closed unless `collection` has a unique index on `keys`: without
+    habit_logs' (habit_id, period) index a second log of a period would be
+    stored, without habit_rollups' habit_id index two folds could each insert a
+    rollup. Checked once per process (`flask db sync-indexes` creates them).
+    """
+    if (collection.name, tuple(keys)) in _checked_indexes:
+        return
+    for index in collection.index_information().values():
+        if [tuple(key) for key in index.get("key", [])] == keys and index.get("unique"):
+            _checked_indexes.add((collection.name, tuple(keys)))
+            return
+    fields = ", ".join(field for field, _ in keys)
+    raise UniqueIndexMissing(f"{collection.name} needs its unique ({fields}) index, run `flask db sync-indexes`")
+
+
+def backfill_rollup(habit_id: str, frequency: str) -> Optional[dict]:
+    """
+    Build the rollup of a habit logged before rollups existed from its logs (raw
+    and compacted). Never replaces a stored rollup: when one appeared meanwhile it
+    is left as is. Returns the rollup, None when the habit has no 'done' logs.
+    """
+    rollup = compute_rollup(habit_id, frequency, done_timestamps(habit_id))
+    if rollup is None:
+        return None
+    try:
+        Habit_Rollup.habit_rollups.insert_one(dict(rollup))
+    except DuplicateKeyError:
+        return Habit_Rollup.habit_rollups.find_one({"habit_id": habit_id}, {"_id": 0})
+    return rollup
+
+
+def swap_rollup(habit_id: str, before: Optional[dict], after: Optional[dict]) -> bool:
+    """
+    Replace the habit's rollup `before` (as read, None when there was none) by
+    `after` (None deletes it), unless it changed since it was read: the filter
+    matches the whole document read. Returns False when it changed, the caller
+    reads it again and redoes its work.
+    """
+    if after == before:
+        return True
+    if before is None:
+        try:
+            Habit_Rollup.habit_rollups.insert_one(dict(after))
+        except DuplicateKeyError:
+            return False
+        return True
+    unchanged = {**before, "habit_id": habit_id}
+    if after is None:
+        return Habit_Rollup.habit_rollups.delete_one(unchanged).deleted_count == 1
+    return Habit_Rollup.habit_rollups.replace_one(unchanged, after).matched_count == 1
+
+
+def fold_rollup(habit_id: str, frequency: str, timestamps: List[datetime]) -> Tuple[Optional[dict], Optional[dict]]:
+    """
+    Fold stored 'done' logs (`timestamps`) into the habit's rollup. Logs of later
+    periods than the rollup's last one are folded in memory; a habit without a
+    rollup, or a log replayed into an earlier period, gets its rollup recomputed
+    from all its logs. Folding a log twice changes nothing, and the rollup is
+    compare-and-swapped (swap_rollup), so concurrent folds never lose or double
+    count a log. Returns (rollup before, rollup after).
+    """
+    require_unique_index(Habit_Rollup.habit_rollups, ROLLUP_KEY)
+    timestamps = sorted(timestamps)
+    for _ in range(FOLD_ATTEMPTS):
+        before = Habit_Rollup.habit_rollups.find_one({"habit_id": habit_id}, {"_id": 0})
+        if before and timestamps and period_start(timestamps[0], frequency) >= before["last_period"]:
+            after = before
+            for timestamp in timestamps:
+                after = fold_log(after, habit_id, frequency, timestamp)
+        else:
+            after = compute_rollup(habit_id, frequency, done_timestamps(habit_id))
+        if swap_rollup(habit_id, before, after):
+            return before, after
+    raise RuntimeError(f"The rollup of habit {habit_id} kept changing during {FOLD_ATTEMPTS} folds")
+
+
+def pending_logs(habit_ids: Optional[List[str]] = None, stored_before: Optional[datetime] = None,
+                 limit: int = FOLD_BATCH_SIZE) -> List[dict]:
+    """ Logs not folded into their rollup yet: of `habit_ids`, or stored (inserted) before `stored_before`. """
+    query: dict = {"pending": True}
+    if habit_ids is not None:
+        query["habit_id"] = {"$in": habit_ids}
+    if stored_before:
+        query["_id"] = {"$lt": ObjectId.from_datetime(stored_before)}
+    return list(Habit_Log.habit_logs.find(query, {"habit_id": 1, "habit_name": 1, "timestamp": 1}).limit(limit))
+
+
+def settle_logs(log_ids: List[ObjectId]):
+    """ Mark logs as folded into their rollup (after the rollup and everything derived from it were updated). """
+    if log_ids:
+        Habit_Log.habit_logs.update_many({"_id": {"$in": log_ids}}, {"$unset": {"pending": ""}})
+
+
+def assign_periods(query: Optional[dict] = None) -> int:
+    """
+    Give the 'done' logs stored before the one-log-per-period key existed their
+    period, so new logs can't repeat it. A period logged twice under the old 24h
+    spacing (a 31-day month) keeps its first log only in the key. Returns how
+    many logs got a period.
+    """
+    assigned = 0
+    habits = Habit.find({**(query or {}), "frequency": {"$in": list(FREQUENCIES)}}, {"_id": 0, "habit_id": 1, "frequency": 1})
+    for habit in habits:
+        periods = set()
+        operations = []
+        for log in Habit_Log.habit_logs.find(
+            {"habit_id": habit["habit_id"], "log": "done", "period": {"$exists": False}}, {"_id": 1, "timestamp": 1}
+        ).sort("timestamp", 1):
+            period = period_start(log["timestamp"], habit["frequency"])
+            if period not in periods:
+                periods.add(period)
+                operations.append(UpdateOne({"_id": log["_id"]}, {"$set": {"period": period}}))
+        if not operations:
+            continue
+        try:
+            Habit_Log.habit_logs.bulk_write(operations, ordered=False)
+            assigned += len(operations)
+        except BulkWriteError as e:  # Periods taken by logs stored since the key existed
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            assigned += len(operations) - len(errors)
+    return assigned
+
+
+def fold_log(rollup: Optional[dict], habit_id: str, frequency: str, timestamp: datetime) -> Dict[str, Union[str, int, datetime]]:
+    """
+    Return `rollup` with one more 'done' log folded in (a log of its last period only moves last_log_date).
+    """
+    period = period_start(timestamp, frequency)
+    if not rollup:
+        return {
+            "habit_id": habit_id,
+            "frequency": frequency,
+            "current_streak": 1,
+            "longest_streak": 1,
+            "completed_count": 1,
+            "first_log_date": timestamp,
+            "last_log_date": timestamp,
+            "last_period": period,
+        }
+    rollup = dict(rollup)
+    if period != rollup["last_period"]:
+        if period == shift_period(rollup["last_period"], frequency, 1):
+            rollup["current_streak"] += 1
+        else:
+            rollup["current_streak"] = 1
+        rollup["completed_count"] += 1
+        rollup["longest_streak"] = max(rollup["longest_streak"], rollup["current_streak"])
+        rollup["last_period"] = period
+    rollup["last_log_date"] = timestamp
+    return rollup
+
+
+def compute_rollup(habit_id: str, frequency: str, timestamps: Iterable[datetime]) -> Optional[Dict[str, Union[str, int, datetime]]]:
+    """
+    Build a rollup from 'done' timestamps in ascending order.
+    """
+    rollup: Optional[dict] = None
+    for timestamp in timestamps:
+        rollup = fold_log(rollup, habit_id, frequency, timestamp)
+    return rollup
+
+
+def rebuild_rollup(habit: dict) -> Optional[dict]:
+    """
+    Recompute a habit's rollup from its logs (raw and compacted) and replace the
+    stored one, unless a log was folded in meanwhile: then it is recomputed again.
+    """
+    habit_id = habit.get("habit_id")
+    frequency = habit.get("frequency")
+    for _ in range(FOLD_ATTEMPTS):
+        before = Habit_Rollup.habit_rollups.find_one({"habit_id": habit_id}, {"_id": 0})
+        rollup = compute_rollup(habit_id, frequency, done_timestamps(habit_id)) if frequency in FREQUENCIES else None
+        if swap_rollup(habit_id, before, rollup):
+            return rollup
+    raise RuntimeError(f"The rollup of habit {habit_id} kept changing during {FOLD_ATTEMPTS} rebuilds")
+
+
+def rebuild_all(query: Optional[dict] = None, missing: bool = False) -> int:
+    """
+    Rebuild the rollups of every habit matching `query`, returns how many were rebuilt.
+    With `missing`, only backfill the habits that have no rollup yet (habits
+    logged before rollups existed) and leave the stored ones alone.
+    """
+    rebuilt = 0
+    if missing:
+        habits = Habit.find({**(query or {}), "frequency": {"$in": list(FREQUENCIES)}}, {"_id": 0, "habit_id": 1, "frequency": 1})
+        for page in _pages(habits, 1000):
+            stored = {rollup["habit_id"] for rollup in Habit_Rollup.habit_rollups.find(
+                {"habit_id": {"$in": [habit["habit_id"] for habit in page]}}, {"_id": 0, "habit_id": 1}
+            )}
+            backfilled = [habit["habit_id"] for habit in page
+                          if habit["habit_id"] not in stored and backfill_rollup(habit["habit_id"], habit["frequency"])]
+            if backfilled:
+                Habit.bump_versions(backfilled)
+            rebuilt += len(backfilled)
+        return rebuilt
+
+    for habit in Habit.find(query or {}):
+        rebuild_rollup(habit)
+        rebuilt += 1
+    Habit.habits.update_many(query or {}, {"$inc": {"version": 1}})  # Drop responses built on drifted rollups
+    return rebuilt
+
+
+def _pages(items: Iterable[dict], size: int) -> Iterable[List[dict]]:
+    page: List[dict] = []
+    for item in items:
+        page.append(item)
+        if len(page) == size:
+            yield page
+            page = []
+    if page:
+        yield page
@@ -1,13 +1,135 @@
-from database import User, Habit, Habit_Log
-from datetime import datetime, timedelta
-from flask_sse import sse
-from flask import jsonify
-import redis
+from database import User, Habit, Habit_Log, Habit_Rollup, HabitRepository, primary_reads
+from datetime import datetime, timedelta, timezone
+from v1.core.events import publish_event
+from flask import after_this_request, current_app, has_request_context, jsonify
+import logging
+import os
 import time
-from typing import Optional, Dict, Tuple, Union
+from typing import Callable, List, Optional, Dict, Tuple, Union
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from .habit_periods import FREQUENCIES, period_start, periods_between, is_streak_alive
+from .habit_rollup import FOLD_BATCH_SIZE, LOG_PERIOD_KEY, fold_rollup, pending_logs, require_unique_index, settle_logs
+from .habit_buckets import read_logs
+from .habit_pipelines import statistics_pipeline, dashboard_pipeline
+from .habit_reminders import schedule_reminder
+from .habit_leaderboards import record_progress
+
+logger = logging.getLogger(__name__)
+
+# Logs still pending this long after they were stored are folded by the scheduler
+PENDING_GRACE_SECONDS = int(os.getenv("LOG_PENDING_GRACE_SECONDS", 60))
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """ Parse an optional ISO 8601 timestamp into naive UTC (the storage convention). """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+# A habit is logged at most once per period (calendar day, ISO week or month)
+PERIOD_NAMES = {
+    'daily': 'day',
+    'weekly': 'week',
+    'monthly': 'month',
+}
+
+
+def publish_streak(username: str, habit_name: str, rollup: dict):
+    """ Tell the user's open streams about a habit's new streak. """
+    publish_event(username, "streak-changed", {
+        "habit_id": rollup["habit_id"],
+        "habit_name": habit_name,
+        "current_streak": rollup.get("current_streak", 0),
+        "longest_streak": rollup.get("longest_streak", 0),
+    })
+
+
+def after_response(function: Callable, *args):
+    """
+    Run `function(*args)` once the response was sent, so it adds nothing to the
+    request's latency (right away outside requests). Failures are logged.
+    """
+    def run():
+        try:
+            function(*args)
+        except Exception as e:
+            logger.warning("%s failed after the response: %s", function.__name__, e)
 
-# Connect to Redis
-redis_client = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
+    if not has_request_context():
+        run()
+        return
+    app = current_app._get_current_object()
+
+    @after_this_request
+    def defer(response):
+        def in_app_context():
+            with app.app_context():
+                run()
+        response.call_on_close(in_app_context)
+        return response
+
+
+def fold_pending_logs(habit_ids: Optional[List[str]] = None, stored_before: Optional[datetime] = None) -> int:
+    """
+    Fold pending logs (of `habit_ids`, or stored before `stored_before`) into
+    their habits' rollups, then update what derives from them: the habits'
+    versions (ETags, response cache), the users' event streams, reminders and
+    leaderboards. A log stays pending until all of that is done, so a fold cut
+    short is run again by the scheduler (fold_stranded_logs), and folding a log
+    twice changes nothing. Returns how many logs were folded.
+    """
+    with primary_reads():  # The rollup is compared with what was last written
+        logs = pending_logs(habit_ids, stored_before)
+        if not logs:
+            return 0
+        by_habit: Dict[str, List[dict]] = {}
+        for log in logs:
+            by_habit.setdefault(log["habit_id"], []).append(log)
+        habits = {habit["habit_id"]: habit for habit in Habit.find({"habit_id": {"$in": list(by_habit)}})}
+
+        folded: List[dict] = []
+        for habit_id, habit_logs in by_habit.items():
+            habit = habits.get(habit_id)
+            if not habit or habit.get("frequency") not in FREQUENCIES:
+                folded += habit_logs  # A deleted habit: the cascade deletes its logs
+                continue
+            timestamps = sorted(log["timestamp"] for log in habit_logs)
+            try:
+                before, rollup = fold_rollup(habit_id, habit["frequency"], timestamps)
+            except Exception as e:
+                logger.warning("Could not fold %d log(s) of habit %s: %s", len(habit_logs), habit_id, e)
+                continue
+            for timestamp in timestamps:
+                publish_event(habit["username"], "log-accepted", {
+                    "habit_id": habit_id, "habit_name": habit["habit_name"], "timestamp": timestamp.isoformat()
+                })
+            if rollup != before:
+                publish_streak(habit["username"], habit["habit_name"], rollup)
+                schedule_reminder(habit, rollup["last_period"])
+                record_progress(habit, before, rollup, timestamps)
+            folded += habit_logs
+
+        Habit.bump_versions({log["habit_id"] for log in folded})
+        settle_logs([log["_id"] for log in folded])
+        return len(folded)
+
+
+def fold_stranded_logs(now: Optional[datetime] = None) -> int:
+    """
+    Fold the logs still pending PENDING_GRACE_SECONDS after they were stored:
+    their request's fold failed, or its worker died before it ran.
+    """
+    stored_before = (now or datetime.utcnow()) - timedelta(seconds=PENDING_GRACE_SECONDS)
+    total = 0
+    while True:
+        folded = fold_pending_logs(stored_before=stored_before)
+        total += folded
+        if folded < FOLD_BATCH_SIZE:
+            return total
 
 
 class HabitEngine:
@@ -17,17 +139,27 @@ class HabitEngine:
     """
 
     def post_log(self, username: str, habit_name: str, habit_id: str, log: str) -> Tuple[Dict[str, Union[str, dict]], int]:
-        """Post a log for a specific habit."""
+        """
+        Post a log for a specific habit.
+
+        One write: the log is stored with its period, and the unique (habit_id,
+        period) index rejects a second log of the same day, week or month, however
+        many posts race. The rollup and what derives from it are folded in once
+        the response was sent (fold_pending_logs).
+        """
 
         # Validate log content
         if not log:
             return {"message": "Log content cannot be empty"}, 400
 
+        if not isinstance(log, str):
+            return {"message": "Log content should be a string"}, 400
+
         log = log.lower()
         if log != 'done':
             return {"message": "Log content should be 'done'"}, 409
 
-        habit = Habit.habits.find_one({'habit_id': habit_id})
+        habit = HabitRepository.current().find_by_id(habit_id)
         if not habit:
             return {"message": "Habit not found"}, 404
 
@@ -35,174 +167,241 @@ class HabitEngine:
         if not habit_frequency:
             return {"message": "No frequency found, update frequency for the habit and try again"}, 404
 
-        if habit_frequency not in ['daily', 'weekly', 'monthly']:
+        if habit_frequency not in FREQUENCIES:
             return {"message": "Log posting requires frequency to be 'daily', 'weekly', or 'monthly' for accurate tracking."}, 405
 
         try:
-            today: datetime = datetime.utcnow()
-            log_entry: Optional[dict] = Habit_Log.habit_logs.find_one(
-                {"habit_id": habit_id},
-                sort=[("timestamp", -1)]
-            )
-            start_date: Optional[datetime] = log_entry.get("timestamp") if log_entry else None
-
-            if log_entry and not start_date:
-                return {"message": f"Habit log entry found but missing timestamp: {log_entry}"}, 400
-
-            elif habit_frequency == 'daily':
-                if not start_date or today - start_date >= timedelta(days=1):
-                    result = Habit_Log(username, habit_name, habit_id, log).insert_log()
-                    return result
-                else:
-                    return {"message": f"You can't log more than 1 '{habit_frequency}' log per day"}, 409
+            require_unique_index(Habit_Log.habit_logs, LOG_PERIOD_KEY)
+            habit_log = Habit_Log(username, habit_name, habit_id, log)
+            # Mongo keeps millisecond precision; the rollup and the log store the same instant
+            habit_log.timestamp = habit_log.timestamp.replace(microsecond=habit_log.timestamp.microsecond // 1000 * 1000)
+            habit_log.period = period_start(habit_log.timestamp, habit_frequency)
+            try:
+                result = habit_log.insert_log()
+            except DuplicateKeyError:
+                return {"message": f"You can't log more than 1 '{habit_frequency}' log per {PERIOD_NAMES[habit_frequency]}"}, 409
+            if result[1] == 201:
+                after_response(fold_pending_logs, [habit_id])
+            return result
 
-            elif habit_frequency == 'weekly':
-                if not start_date or today - start_date >= timedelta(weeks=1):
-                    result = Habit_Log(username, habit_name, habit_id, log).insert_log()
-                    return result
-                else:
-                    return {"message": f"You can't log more than 1 '{habit_frequency}' log per week"}, 409
+        except Exception as e:
+            return {"message": f"Error posting log: {str(e)}"}, 500
 
-            elif habit_frequency == 'monthly':
-                if not start_date or today - start_date >= timedelta(days=30):
-                    result = Habit_Log(username, habit_name, habit_id, log).insert_log()
-                    return result
+    def post_logs(self, username: str, entries: List[dict]) -> List[Dict[str, Union[str, int]]]:
+        """
+        Post many logs of the user's habits at once (offline clients replaying their queue).
+
+        Habits and their rollups (last logged period) are loaded with one query
+        each. A log must be of a later period than the habit's last one and of a
+        period not taken earlier in the batch; the accepted logs are written with
+        a single unordered insert_many, where the unique (habit_id, period) index
+        rejects periods logged concurrently. Rollups are folded once the response
+        was sent, like post_log. Returns one result per entry, in request order.
+        """
+        now: datetime = datetime.utcnow()
+        results: List[Dict[str, Union[str, int]]] = []
+        pending: List[Tuple[int, dict, datetime]] = []
+
+        habits: Dict[str, dict] = {}
+        repository = HabitRepository.current()
+        for habit in Habit.find({"username": username}):
+            repository.remember(habit)
+            habits[habit["habit_name"]] = habit
+
+        for index, entry in enumerate(entries):
+            habit_name = entry.get("habit_name") if isinstance(entry, dict) else None
+            result: Dict[str, Union[str, int]] = {"index": index, "habit_name": habit_name}
+            results.append(result)
+            try:
+                timestamp = parse_timestamp(entry.get("timestamp")) or now
+            except (AttributeError, TypeError, ValueError):
+                result.update(status=400, message="timestamp must be an ISO 8601 datetime")
+                continue
+            log = entry.get("log") or "done"
+            if not isinstance(log, str):
+                result.update(status=400, message="log must be a string")
+                continue
+            log = log.lower()
+            habit = habits.get(habit_name) if isinstance(habit_name, str) else None
+            if log != 'done':
+                result.update(status=409, message="Log content should be 'done'")
+            elif timestamp > now:
+                result.update(status=400, message="Log timestamp can't be in the future")
+            elif not habit:
+                result.update(status=404, message="Habit not found")
+            elif habit.get('frequency') not in FREQUENCIES:
+                result.update(status=405, message="Log posting requires frequency to be 'daily', 'weekly', or 'monthly' for accurate tracking.")
+            else:
+                # Mongo keeps millisecond precision, compare like the stored value
+                pending.append((index, habit, timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)))
+
+        # Last logged period per habit, from the rollups
+        last_periods: Dict[str, datetime] = {}
+        habit_ids = list({habit["habit_id"] for _, habit, _ in pending})
+        if habit_ids:
+            for rollup in Habit_Rollup.habit_rollups.find({"habit_id": {"$in": habit_ids}}, {"_id": 0, "habit_id": 1, "last_period": 1}):
+                last_periods[rollup["habit_id"]] = rollup["last_period"]
+
+        accepted: List[Tuple[int, dict, datetime, datetime]] = []
+        for index, habit, timestamp in sorted(pending, key=lambda item: item[2]):
+            habit_frequency = habit["frequency"]
+            period = period_start(timestamp, habit_frequency)
+            last = last_periods.get(habit["habit_id"])
+            if last and period <= last:
+                results[index].update(status=409, message=f"You can't log more than 1 '{habit_frequency}' log per {PERIOD_NAMES[habit_frequency]}")
+                continue
+            last_periods[habit["habit_id"]] = period
+            accepted.append((index, habit, timestamp, period))
+
+        if accepted:
+            require_unique_index(Habit_Log.habit_logs, LOG_PERIOD_KEY)
+            documents = [
+                Habit_Log(username, habit["habit_name"], habit["habit_id"], 'done', timestamp, period).to_document()
+                for _, habit, timestamp, period in accepted
+            ]
+            failed: Dict[int, dict] = {}
+            try:
+                Habit_Log.habit_logs.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    failed[error["index"]] = error
+
+            stored = set()
+            for position, (index, habit, _, _) in enumerate(accepted):
+                error = failed.get(position)
+                if error is None:
+                    results[index].update(status=201, message="Log added successfully")
+                    stored.add(habit["habit_id"])
+                elif error.get("code") == 11000:  # Logged concurrently
+                    habit_frequency = habit["frequency"]
+                    results[index].update(status=409, message=f"You can't log more than 1 '{habit_frequency}' log per {PERIOD_NAMES[habit_frequency]}")
                 else:
-                    return {"message": f"You can't log more than 1 '{habit_frequency}' log per month"}, 409
+                    results[index].update(status=500, message=f"Error adding log: {error.get('errmsg', '')}")
+            if stored:
+                after_response(fold_pending_logs, sorted(stored))
 
-        except Exception as e:
-            return {"message": f"Error posting log: {str(e)}"}, 500
+        return results
 
-    def log_history(self, habit_id: str) -> Union[Dict[str, str], Tuple[Dict[str, str], int]]:
+    def dashboard(self, username: str) -> List[Dict[str, Union[str, int, float, None]]]:
+        """
+        Every habit of a user with its current streak, adherence and last log time,
+        computed from one aggregation joining habits with their rollups.
         """
-        Fetches log history for a given habit ID.
+        today: datetime = datetime.utcnow()
+        dashboard = []
+        for habit in Habit.habits.aggregate(dashboard_pipeline(username)):
+            habit_frequency: Optional[str] = habit.get('frequency')
+            rollup: dict = habit.get('rollup') or {}
+            streak: int = 0
+            total_periods: int = 0
+            adherence: Optional[float] = None
+            if rollup.get('first_log_date') and habit_frequency in FREQUENCIES:
+                if is_streak_alive(rollup.get('last_period'), habit_frequency, today):
+                    streak = rollup.get('current_streak', 0)
+                total_periods = periods_between(rollup['first_log_date'], today, habit_frequency)
+                adherence = round(rollup.get('completed_count', 0) / total_periods * 100, 2) if total_periods else 0.0
+            last_log: Optional[datetime] = rollup.get('last_log_date')
+            dashboard.append({
+                "habit_name": habit.get('habit_name'),
+                "frequency": habit_frequency,
+                "status": habit.get('status'),
+                "current_streak": streak,
+                "longest_streak": rollup.get('longest_streak', 0),
+                "completed": rollup.get('completed_count', 0),
+                "total_periods": total_periods,
+                "adherence_rate": adherence,
+                "last_log": last_log.isoformat() if last_log else None,
+            })
+        return dashboard
+
+    def log_history(self, habit_id: str, after: Optional[datetime] = None, limit: Optional[int] = None,
+                    projection: Optional[Dict[str, int]] = None):
+        """
+        Fetches log history for a given habit ID, oldest first.
+
+        Keyset pagination: `after` is the timestamp of the last log already seen,
+        so each page is an index range scan on (habit_id, timestamp) instead of a skip.
+        Compacted logs (see habit_buckets) are merged in, without an _id.
         """
-        logs = Habit_Log.habit_logs.find({'habit_id': habit_id})
-        if logs is None:
-            return {"message": "No logs found"}, 404
-        return logs
+        return read_logs(habit_id, after, limit, projection)
 
     def streak(self, habit_id: str) -> Dict[str, str]:
         """
-        Calculate the current streak for a habit.
+        Return the current streak for a habit from its rollup.
         """
-        habit = Habit.habits.find_one({'habit_id': habit_id})
+        habit = HabitRepository.current().find_by_id(habit_id)
         if not habit:
             return {"message": "Habit not found"}, 404
 
         habit_name: Optional[str] = habit.get('habit_name')
         habit_frequency: Optional[str] = habit.get('frequency')
-        logs = Habit_Log.habit_logs.find({'habit_id': habit_id}).sort('timestamp', 1)
-
-        if not logs:
-            return {"message": "No logs found for this habit"}, 404
+        rollup: Optional[dict] = Habit_Rollup.find_rollup_by_habit_id(habit_id)
 
         streak: int = 0
-        last_log_date: Optional[datetime] = None
-        last_log_week: Optional[int] = None
-        last_log_month: Optional[int] = None
-        last_log_year: Optional[int] = None
-
-        for log in logs:
-            log_date: Optional[datetime] = log.get('timestamp')
-            if not log_date or log.get('log') != 'done':
-                continue
-
-            if habit_frequency == 'daily':
-                if last_log_date is None or log_date - last_log_date == timedelta(days=1):
-                    streak += 1
-                    last_log_date = log_date
-                else:
-                    break
-
-            elif habit_frequency == 'weekly':
-                log_week: int = log_date.isocalendar()[1]
-                log_year: int = log_date.year
-
-                if last_log_week is None or (
-                    log_week == last_log_week + 1 and log_year == last_log_year
-                ) or (
-                    log_week == 1 and log_year == last_log_year + 1):
-                    streak += 1
-                    last_log_week = log_week
-                    last_log_year = log_year
-                else:
-                    break
-
-            elif habit_frequency == 'monthly':
-                log_month: int = log_date.month
-                log_year: int = log_date.year
-                if last_log_month is None or (
-                    log_month == last_log_month + 1 and log_year == last_log_year
-                ) or (
-                    log_month == 1 and log_year == last_log_year + 1):
-                    streak += 1
-                    last_log_month = log_month
-                    last_log_year = log_year
-                else:
-                    break
-
-        return {"streak_count": f"Your streak for '{habit_name}' is '{streak}', you haven't 'log' your progress yet."}
+        longest_streak: int = 0
+        if rollup and habit_frequency in FREQUENCIES:
+            longest_streak = rollup.get('longest_streak', 0)
+            if is_streak_alive(rollup.get('last_period'), habit_frequency, datetime.utcnow()):
+                streak = rollup.get('current_streak', 0)
+
+        return {
+            "streak_count": f"Your streak for '{habit_name}' is '{streak}', you haven't 'log' your progress yet.",
+            "current_streak": streak,
+            "longest_streak": longest_streak,
+        }
 
-    def statistics(self, habit_id: str) -> Tuple[Dict[str, Union[str, dict]], int]:
+    def statistics(self, habit_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Tuple[Dict[str, Union[str, dict]], int]:
         """
         Calculate and return progress statistics for a habit.
+
+        Whole-history statistics are read from the habit's rollup. A date range
+        (start inclusive, end exclusive), or a habit without a rollup yet, is
+        computed by a single aggregation over habit_logs and the compacted logs.
         """
-        habit = Habit.habits.find_one({'habit_id': habit_id})
+        habit = HabitRepository.current().find_by_id(habit_id)
         if not habit:
             return jsonify({"message": "Habit not found"}), 404
 
         habit_frequency: Optional[str] = habit.get('frequency')
         if not habit_frequency:
             return jsonify({"message": "No frequency found, update frequency for the habit and try again"}), 404
-        elif habit_frequency not in ['daily', 'weekly', 'monthly']:
+        elif habit_frequency not in FREQUENCIES:
             return jsonify({"message": "Only 'daily', 'weekly', or 'monthly' frequencies can generate statistics for accountability."}), 405
 
-        log_entry = Habit_Log.habit_logs.find_one(
-            {"habit_id": habit_id},
-            sort=[("timestamp", -1)]
-        )
-        start_date: Optional[datetime] = log_entry.get("timestamp") if log_entry else None
-        logs = Habit_Log.habit_logs.find({'habit_id': habit_id}).sort('timestamp', 1)
-
-        if not start_date or not logs:
-            return jsonify({"message": "No logs found for this habit"}), 404
+        today: datetime = datetime.utcnow()
+        rollup: Optional[dict] = None
+        if not start and not end:
+            rollup = Habit_Rollup.find_rollup_by_habit_id(habit_id)
 
         total_periods: int = 0
         completed: int = 0
-        adherence: float = 0.0
-
-        today: datetime = datetime.utcnow()
-
-        if habit_frequency == 'daily':
-            while start_date <= today:
-                total_periods += 1
-                for log in logs:
-                    if log.get('log') == 'done' and start_date <= log.get('timestamp') < start_date + timedelta(days=1):
-                        completed += 1
-                start_date += timedelta(days=1)
-
-        elif habit_frequency == 'weekly':
-            while start_date <= today:
-                total_periods += 1
-                for log in logs:
-                    if log.get('log') == 'done' and start_date <= log.get('timestamp') < start_date + timedelta(weeks=1):
-                        completed += 1
-                start_date += timedelta(weeks=1)
-
-        elif habit_frequency == 'monthly':
-            while start_date <= today:
-                total_periods += 1
-                for log in logs:
-                    if log.get('log') == 'done' and start_date <= log.get('timestamp') < (start_date.replace(month=start_date.month + 1) if start_date.month < 12 else start_date.replace(year=start_date.year + 1, month=1)):
-                        completed += 1
-                if start_date.month == 12:
-                    start_date = start_date.replace(year=start_date.year + 1, month=1)
-                else:
-                    start_date = start_date.replace(month=start_date.month + 1)
-
-        if total_periods > 0:
-            adherence = (completed / total_periods) * 100
+        adherence: Optional[float] = None
+
+        if rollup and rollup.get('first_log_date'):
+            total_periods = periods_between(rollup['first_log_date'], today, habit_frequency)
+            completed = rollup.get('completed_count', 0)
+        else:
+            if start and habit.get('start_date') and start < habit['start_date']:
+                start = habit['start_date']  # No periods to complete before the habit existed
+            last_instant: datetime = min(end - timedelta(milliseconds=1), today) if end else today
+            if start and start > last_instant:
+                return jsonify({"message": "Statistics range must start before it ends"}), 400
+
+            result = list(Habit_Log.habit_logs.aggregate(
+                statistics_pipeline(habit_id, habit_frequency, last_instant, start, end)
+            ))
+            if result:
+                total_periods = result[0]['total_periods']
+                completed = result[0]['completed']
+                adherence = result[0]['adherence_rate']
+            elif start:
+                total_periods = periods_between(start, last_instant, habit_frequency)
+                completed = 0
+            else:
+                return jsonify({"message": "No logs found for this habit"}), 404
+
+        if adherence is None:
+            adherence = (completed / total_periods) * 100 if total_periods > 0 else 0.0
 
         stats = {
             "habit_name": habit.get("habit_name", "Unknown"),
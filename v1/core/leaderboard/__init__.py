@@ -0,0 +1,8 @@
+from .leaderboard_blueprint import leaderboard  # Import the leaderboard blueprint
+
+def register_leaderboard_blueprint(app):
+
+    # Register the blueprint
+    app.register_blueprint(leaderboard, url_prefix='/leaderboard')
+
+__all__ = ['leaderboard'] # Explicitly export the blueprint
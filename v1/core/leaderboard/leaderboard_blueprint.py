@@ -0,0 +1,71 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from database import HabitRepository
+from v1.core.habit.habit_periods import FREQUENCIES
+from v1.core.habit.habit_leaderboards import month_of, name_adherence, recent_months, streak_rank, top_streaks
+from datetime import datetime
+
+leaderboard = Blueprint('leaderboard', __name__)
+
+MAX_LEADERBOARD_SIZE = 100
+
+
+def requested_month():
+    """ ?month=YYYY-MM, one of the months boards are kept for (default: the current one). """
+    month = request.args.get("month") or month_of(datetime.utcnow())
+    return month if month in recent_months() else None
+
+
+@leaderboard.route("/streaks", methods=['GET'], strict_slashes=False)
+@jwt_required()
+def get_top_streaks():
+    """ Best streaks reached this month (or ?month=YYYY-MM) by any habit of a frequency, the user's own named. """
+    frequency = request.args.get("frequency", "daily")
+    month = requested_month()
+    if frequency not in FREQUENCIES:
+        return jsonify({"message": f"frequency must be one of {', '.join(FREQUENCIES)}"}), 400
+    if not month:
+        return jsonify({"message": "month must be YYYY-MM within the last 12 months"}), 400
+    try:
+        limit = max(1, min(int(request.args.get("limit", 10)), MAX_LEADERBOARD_SIZE))
+    except ValueError:
+        return jsonify({"message": "limit must be a number"}), 400
+    return jsonify({"frequency": frequency, "month": month, "leaders": top_streaks(frequency, month, limit, get_jwt_identity())}), 200
+
+
+@leaderboard.route("/streaks/rank", methods=['GET'], strict_slashes=False)
+@jwt_required()
+def get_streak_rank():
+    """ Rank of one of the user's habits on its frequency's streak board. """
+    username = get_jwt_identity()
+    habit = HabitRepository.current().find_by_name(username, request.args.get("habit_name"))
+    if not habit:
+        return jsonify({"message": "Habit not found"}), 404
+    if habit.get("frequency") not in FREQUENCIES:
+        return jsonify({"message": "Only 'daily', 'weekly', or 'monthly' habits are ranked."}), 405
+    month = requested_month()
+    if not month:
+        return jsonify({"message": "month must be YYYY-MM within the last 12 months"}), 400
+
+    ranked = streak_rank(habit, month)
+    if not ranked:
+        return jsonify({"message": f"'{habit['habit_name']}' has no streak in {month} yet"}), 404
+    rank, streak, size = ranked
+    return jsonify({"habit_name": habit["habit_name"], "frequency": habit["frequency"], "month": month,
+                    "rank": rank, "streak": streak, "ranked_habits": size}), 200
+
+
+@leaderboard.route("/adherence", methods=['GET'], strict_slashes=False)
+@jwt_required()
+def get_name_adherence():
+    """ Adherence of every user's habits with this name (case-insensitive) and frequency. """
+    habit_name = request.args.get("habit_name")
+    frequency = request.args.get("frequency", "daily")
+    if not habit_name:
+        return jsonify({"message": "habit_name is required"}), 400
+    if frequency not in FREQUENCIES:
+        return jsonify({"message": f"frequency must be one of {', '.join(FREQUENCIES)}"}), 400
+    adherence = name_adherence(habit_name, frequency)
+    if not adherence:
+        return jsonify({"message": f"No '{frequency}' habit named '{habit_name}' has been logged yet"}), 404
+    return jsonify(adherence), 200
@@ -0,0 +1,27 @@
+import os
+from pymongo import monitoring
+from database.client import redis_listeners
+from .instrumentation import (metrics, mongo_command_metrics, record_redis_command,
+                              start_request_timer, record_request, metrics_view)
+
+_listeners_registered = False
+
+
+def register_metrics(app):
+    """
+    Time requests, Mongo commands and Redis commands, and serve them at /metrics.
+    Must run before the first Mongo client is created: pymongo only attaches
+    globally registered listeners to clients built afterwards.
+    """
+    global _listeners_registered
+    if not _listeners_registered:
+        monitoring.register(mongo_command_metrics)
+        redis_listeners.append(record_redis_command)
+        _listeners_registered = True
+
+    app.config['SLOW_REQUEST_MS'] = float(app.config.get('SLOW_REQUEST_MS') or os.getenv('SLOW_REQUEST_MS', 0))
+    app.before_request(start_request_timer)
+    app.after_request(record_request)
+    app.add_url_rule("/metrics", endpoint="metrics", view_func=metrics_view, methods=["GET"])
+
+__all__ = ['metrics', 'register_metrics'] # Explicitly export the registry
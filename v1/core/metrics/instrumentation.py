@@ -0,0 +1,190 @@
+from flask import current_app, g, has_request_context, request
+from pymongo import monitoring
+from .registry import MetricsRegistry
+import atexit
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Most Mongo commands a slow-request log line lists
+MAX_LOGGED_COMMANDS = 50
+
+# Directory shared by the workers of one server (gunicorn.conf.py sets it): each
+# writes a snapshot of its metrics there and /metrics serves their sum. Unset:
+# /metrics serves the answering process only.
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 5))  # A worker's snapshot lags by up to this
+_last_flush = 0.0
+
+metrics = MetricsRegistry()
+request_duration = metrics.histogram(
+    "habitforge_http_request_duration_seconds", "Time to build a response, per endpoint.", ["endpoint", "method"])
+requests_total = metrics.counter(
+    "habitforge_http_requests_total", "Responses per endpoint and status code.", ["endpoint", "method", "status"])
+request_mongo_time = metrics.histogram(
+    "habitforge_http_request_mongo_seconds", "Time a request spent waiting on MongoDB, per endpoint.", ["endpoint"])
+request_redis_time = metrics.histogram(
+    "habitforge_http_request_redis_seconds", "Time a request spent waiting on Redis, per endpoint.", ["endpoint"])
+mongo_duration = metrics.histogram(
+    "habitforge_mongo_command_duration_seconds", "MongoDB command round trips, per collection and command.", ["collection", "command"])
+mongo_failures = metrics.counter(
+    "habitforge_mongo_command_failures_total", "Failed MongoDB commands, per collection and command.", ["collection", "command"])
+redis_duration = metrics.histogram(
+    "habitforge_redis_command_duration_seconds", "Redis command round trips, per command.", ["command"])
+redis_failures = metrics.counter(
+    "habitforge_redis_command_failures_total", "Failed Redis commands, per command.", ["command"])
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Times every command of the Mongo clients created after it is registered.
+    Inside a request the time is also added to the request's total, and the
+    command is kept for the slow-request log when that is enabled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collections = {}  # (connection id, request id) -> collection of a running command
+
+    def started(self, event):
+        name = "collection" if event.command_name == "getMore" else event.command_name
+        collection = event.command.get(name)
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else ""
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed):
+        with self._lock:
+            collection = self._collections.pop((event.connection_id, event.request_id), "")
+        seconds = event.duration_micros / 1e6
+        mongo_duration.observe(seconds, collection, event.command_name)
+        if failed:
+            mongo_failures.inc(collection, event.command_name)
+        if has_request_context():
+            g.mongo_seconds = g.get("mongo_seconds", 0.0) + seconds
+            commands = g.get("mongo_commands")
+            if commands is not None and len(commands) < MAX_LOGGED_COMMANDS:
+                commands.append({"command": event.command_name, "collection": collection,
+                                 "ms": round(seconds * 1000, 2), "failed": failed})
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._collections = {}
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
+
+def record_redis_command(command: str, seconds: float, failed: bool):
+    """ Listener for the shared Redis clients (database.client.redis_listeners). """
+    redis_duration.observe(seconds, command)
+    if failed:
+        redis_failures.inc(command)
+    if has_request_context():
+        g.redis_seconds = g.get("redis_seconds", 0.0) + seconds
+
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if current_app.config.get("SLOW_REQUEST_MS"):
+        g.mongo_commands = []
+
+
+def record_request(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or "unmatched"
+    mongo_seconds = g.get("mongo_seconds", 0.0)
+    redis_seconds = g.get("redis_seconds", 0.0)
+
+    request_duration.observe(elapsed, endpoint, request.method)
+    requests_total.inc(endpoint, request.method, str(response.status_code))
+    request_mongo_time.observe(mongo_seconds, endpoint)
+    request_redis_time.observe(redis_seconds, endpoint)
+    flush_snapshot()
+
+    slow_ms = current_app.config.get("SLOW_REQUEST_MS")
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        logger.warning("Slow request %s", json.dumps({
+            "endpoint": endpoint,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "ms": round(elapsed * 1000, 2),
+            "mongo_ms": round(mongo_seconds * 1000, 2),
+            "redis_ms": round(redis_seconds * 1000, 2),
+            "mongo_commands": g.get("mongo_commands", []),
+        }))
+    return response
+
+
+def metrics_dir():
+    return os.getenv("METRICS_DIR")
+
+
+def flush_snapshot(force: bool = False):
+    """
+    Write this worker's metrics to METRICS_DIR/<pid>.json, at most every
+    METRICS_FLUSH_SECONDS unless forced. The file is replaced atomically, so
+    readers never see half of it; it stays after the worker exits, so the
+    totals don't drop when gunicorn replaces a worker.
+    """
+    global _last_flush
+    directory = metrics_dir()
+    now = time.monotonic()
+    if not directory or (not force and now - _last_flush < METRICS_FLUSH_SECONDS):
+        return
+    _last_flush = now
+    try:
+        os.makedirs(directory, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(handle, "w") as file:
+            json.dump(metrics.snapshot(), file)
+        os.replace(temporary, os.path.join(directory, f"{os.getpid()}.json"))
+    except OSError as e:
+        logger.warning("Could not write the metrics snapshot: %s", e)
+
+
+def worker_snapshots():
+    """ The snapshots of every worker of this server, the answering one's current. """
+    flush_snapshot(force=True)
+    for path in glob.glob(os.path.join(metrics_dir(), "*.json")):
+        try:
+            with open(path) as file:
+                yield json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping metrics snapshot %s: %s", path, e)
+
+
+def metrics_view():
+    """ Prometheus scrape endpoint: the sum over the server's workers (this worker's alone without METRICS_DIR). """
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return current_app.response_class("unauthorized\n", status=401, mimetype="text/plain")
+    body = metrics.render(worker_snapshots()) if metrics_dir() else metrics.render()
+    return current_app.response_class(body, mimetype="text/plain; version=0.0.4")
+
+
+def _reset_after_fork():
+    """ A forked worker reports its own requests only (the others' come from their snapshots). """
+    global _last_flush
+    metrics.reset()
+    mongo_command_metrics.reset()
+    _last_flush = 0.0
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(flush_snapshot, force=True)
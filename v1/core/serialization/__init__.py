@@ -0,0 +1,9 @@
+from .json_provider import HabitJSONProvider, encode_default
+
+def register_json_provider(app):
+
+    # Encode ObjectId and datetime natively in every JSON response
+    app.json_provider_class = HabitJSONProvider
+    app.json = HabitJSONProvider(app)
+
+__all__ = ['HabitJSONProvider', 'encode_default', 'register_json_provider'] # Explicitly export the provider
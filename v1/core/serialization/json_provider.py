@@ -0,0 +1,75 @@
+from bson import ObjectId
+from datetime import date, datetime
+from flask.json.provider import DefaultJSONProvider
+import json
+import re
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
+
+# Same output as Flask's default provider: sorted keys
+ORJSON_OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+
+def _escape(match) -> str:
+    code = ord(match.group())
+    if code > 0xFFFF:  # Outside the BMP: a UTF-16 surrogate pair, like json.dumps
+        code -= 0x10000
+        return f"\\u{0xD800 | code >> 10:04x}\\u{0xDC00 | code & 0x3FF:04x}"
+    return f"\\u{code:04x}"
+
+
+def escape_non_ascii(text: str) -> str:
+    """ orjson always writes UTF-8: escape non-ASCII characters as json.dumps(ensure_ascii=True) does. """
+    return text if text.isascii() else NON_ASCII.sub(_escape, text)
+
+
+def encode_default(value):
+    """ Encode the BSON types found in documents: ObjectId as its hex string, dates as ISO 8601. """
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class HabitJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider encoding Mongo documents as they come from the driver, so views
+    hand cursors' documents to jsonify without copying them first.
+
+    Uses orjson when it is installed (datetimes are encoded natively, naive ones
+    without an offset, like `isoformat()`), and the standard library otherwise.
+    Non-ASCII characters are escaped while `ensure_ascii` is set, as Flask does.
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is not None and not kwargs:
+            text = orjson.dumps(obj, default=encode_default, option=ORJSON_OPTIONS).decode()
+            return escape_non_ascii(text) if self.ensure_ascii else text
+        kwargs.setdefault("default", encode_default)
+        kwargs.setdefault("sort_keys", self.sort_keys)
+        kwargs.setdefault("ensure_ascii", self.ensure_ascii)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        """ Like DefaultJSONProvider.response: one positional value, several as a list, or keyword arguments as a dict. """
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        if orjson is None or pretty:
+            return super().response(*args, **kwargs)
+        if args and kwargs:
+            raise TypeError("app.json.response() takes either args or kwargs, not both")
+        obj = (args[0] if len(args) == 1 else list(args)) if args else (kwargs or None)
+        body = orjson.dumps(obj, default=encode_default, option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        if self.ensure_ascii and not body.isascii():
+            body = escape_non_ascii(body.decode()).encode()
+        return self._app.response_class(body, mimetype=self.mimetype)